@@ -0,0 +1,161 @@
+"""
+Benchmarks the /filter-samples query patterns on a synthetic encounter table,
+before and after the schema migrations.
+
+The tables are created in a separate schema of the configured database (the
+same SQL_* variables as the server), so existing data is never touched:
+
+    python benchmarks/filter_samples.py --encounters 1000000
+"""
+import argparse
+import datetime as dt
+import json
+import random
+import statistics
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(__file__), "..", "src"))
+
+import sqlalchemy as sql
+
+from helpers.utils import connect_db
+from helpers.migrations import run_migrations
+
+BASELINE_SQL = path.join(path.dirname(__file__), "..", "..", "database", "create_db.sql")
+FIRST_DATE = dt.date(2015, 1, 1)
+DAYS = 2900
+
+# Same filters built by server.filter_sample
+QUERIES = {
+    "nome": """
+        SELECT e.identificador, t.nome FROM encontro e
+        JOIN tartaruga t ON e.tartaruga_identificador = t.identificador
+        WHERE t.nome = :nome""",
+    "nome_data": """
+        SELECT e.identificador, t.nome FROM encontro e
+        JOIN tartaruga t ON e.tartaruga_identificador = t.identificador
+        WHERE t.nome = :nome AND e.data BETWEEN :inicio AND :fim""",
+    "data": """
+        SELECT e.identificador, t.nome FROM encontro e
+        JOIN tartaruga t ON e.tartaruga_identificador = t.identificador
+        WHERE e.data BETWEEN :inicio AND :fim""",
+    "estado_cidade": """
+        SELECT e.identificador, t.nome FROM encontro e
+        JOIN tartaruga t ON e.tartaruga_identificador = t.identificador
+        WHERE e.estado = :estado AND e.cidade = :cidade""",
+    "estado_cidade_data": """
+        SELECT e.identificador, t.nome FROM encontro e
+        JOIN tartaruga t ON e.tartaruga_identificador = t.identificador
+        WHERE e.estado = :estado AND e.cidade = :cidade
+          AND e.data BETWEEN :inicio AND :fim""",
+}
+
+
+def populate(database, schema, encounters, turtles, cities):
+    """Create the baseline tables in a fresh schema and fill them."""
+    with database.begin() as conn:
+        conn.execute(sql.text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+        conn.execute(sql.text(f'CREATE SCHEMA "{schema}"'))
+        conn.execute(sql.text(f'SET LOCAL search_path TO "{schema}"'))
+        with open(BASELINE_SQL, encoding="utf-8") as file:
+            conn.exec_driver_sql(file.read())
+
+        conn.execute(sql.text("""
+            INSERT INTO tartaruga (nome, ultimo_encontro, ultima_imagem_cabeca)
+            SELECT 'tartaruga_' || i, date '2022-01-01', decode('00', 'hex')
+            FROM generate_series(1, :turtles) i
+        """), {"turtles": turtles})
+        conn.execute(sql.text("""
+            INSERT INTO encontro (latitude, longitude, cidade, estado, tartaruga_identificador,
+                                  imagem_corpo, imagem_cabeca, "data")
+            SELECT round((random() * 60 - 35)::numeric, 6)::text,
+                   round((random() * 40 - 75)::numeric, 6)::text,
+                   'cidade_' || (i % :cities), 'estado_' || (i % :cities % 27),
+                   1 + (random() * (:turtles - 1))::int,
+                   decode('00', 'hex'), decode('00', 'hex'),
+                   :first_date + (random() * :days)::int
+            FROM generate_series(1, :encounters) i
+        """), {
+            "encounters": encounters,
+            "turtles": turtles,
+            "cities": cities,
+            "first_date": FIRST_DATE,
+            "days": DAYS,
+        })
+    analyze(database, schema)
+
+
+def analyze(database, schema):
+    with database.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(sql.text(f'ANALYZE "{schema}".tartaruga'))
+        conn.execute(sql.text(f'ANALYZE "{schema}".encontro'))
+
+
+def random_parameters(turtles, cities):
+    start = FIRST_DATE + dt.timedelta(days=random.randrange(DAYS - 30))
+    city = random.randrange(cities)
+    return {
+        "nome": f"tartaruga_{random.randint(1, turtles)}",
+        "inicio": start,
+        "fim": start + dt.timedelta(days=30),
+        "estado": f"estado_{city % 27}",
+        "cidade": f"cidade_{city}",
+    }
+
+
+def measure(database, schema, repetitions, turtles, cities):
+    """Latency in milliseconds of each query, with random parameters."""
+    report = {}
+    with database.connect() as conn:
+        conn.execute(sql.text(f'SET search_path TO "{schema}"'))
+        for name, query in QUERIES.items():
+            timings = []
+            for _ in range(repetitions):
+                params = random_parameters(turtles, cities)
+                start = time.perf_counter()
+                conn.execute(sql.text(query), params).fetchall()
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            report[name] = {
+                "median_ms": round(statistics.median(timings), 3),
+                "p95_ms": round(timings[int(0.95 * (len(timings) - 1))], 3),
+            }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--encounters", type=int, default=1_000_000)
+    parser.add_argument("--turtles", type=int, default=10_000)
+    parser.add_argument("--cities", type=int, default=500)
+    parser.add_argument("--repetitions", type=int, default=20)
+    parser.add_argument("--schema", default="bench_filter_samples")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic schema")
+    args = parser.parse_args()
+
+    database = connect_db()
+    random.seed(0)
+
+    start = time.perf_counter()
+    populate(database, args.schema, args.encounters, args.turtles, args.cities)
+    populated = time.perf_counter() - start
+
+    before = measure(database, args.schema, args.repetitions, args.turtles, args.cities)
+    applied = run_migrations(database, schema=args.schema)
+    analyze(database, args.schema)
+    after = measure(database, args.schema, args.repetitions, args.turtles, args.cities)
+
+    if not args.keep:
+        with database.begin() as conn:
+            conn.execute(sql.text(f'DROP SCHEMA "{args.schema}" CASCADE'))
+
+    print(json.dumps({
+        "encounters": args.encounters,
+        "turtles": args.turtles,
+        "populate_s": round(populated, 1),
+        "migrations": applied,
+        "before": before,
+        "after": after,
+    }, indent=2))
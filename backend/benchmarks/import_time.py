@@ -0,0 +1,101 @@
+"""
+Profiles the import of the server and fails when startup regresses.
+
+Imports server in fresh interpreters with -X importtime, against the
+database configured by the SQL_* variables, and reports the wall time and
+the slowest modules. Exits with status 1 when the median import exceeds
+the budget or when a module that must stay lazy is imported at startup:
+
+    python benchmarks/import_time.py --budget-ms 1000
+
+With --check-schema it also compares helpers/models.py with the live schema.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from os import path
+
+SRC_DIR = path.join(path.dirname(path.abspath(__file__)), "..", "src")
+
+# Heavy modules the server only needs, if ever, after startup
+LAZY_MODULES = ("matplotlib", "pandas", "imageio", "requests")
+
+IMPORT_SERVER = """
+import time
+start = time.perf_counter()
+import server
+print("wall_ms", (time.perf_counter() - start) * 1000)
+"""
+
+CHECK_SCHEMA = """
+import json
+from helpers.models import schema_differences
+from helpers.utils import connect_db
+print(json.dumps(schema_differences(connect_db())))
+"""
+
+
+def profile():
+    """Wall time of one import and the cumulative microseconds per module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SERVER],
+        cwd=SRC_DIR, capture_output=True, text=True, check=True
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative)
+    wall = float(result.stdout.split("wall_ms")[-1])
+    return wall, modules
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budget-ms", type=float, default=1000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--check-schema", action="store_true")
+    args = parser.parse_args()
+
+    runs = [profile() for _ in range(args.runs)]
+    walls = [wall for wall, _ in runs]
+    modules = runs[-1][1]
+    top_level = {name: us for name, us in modules.items() if "." not in name}
+    lazy = sorted(name for name in top_level if name in LAZY_MODULES)
+
+    report = {
+        "budget_ms": args.budget_ms,
+        "wall_ms": {
+            "median": round(statistics.median(walls), 1),
+            "min": round(min(walls), 1),
+            "max": round(max(walls), 1),
+        },
+        "slowest_packages_ms": {
+            name: round(us / 1000, 1)
+            for name, us in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]
+        },
+        "lazy_modules_imported": lazy,
+    }
+    failures = []
+    if report["wall_ms"]["median"] > args.budget_ms:
+        failures.append(f"import took {report['wall_ms']['median']} ms, budget {args.budget_ms} ms")
+    if lazy:
+        failures.append(f"imported at startup: {', '.join(lazy)}")
+
+    if args.check_schema:
+        output = subprocess.run(
+            [sys.executable, "-c", CHECK_SCHEMA],
+            cwd=SRC_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        report["schema_differences"] = json.loads(output.strip().splitlines()[-1])
+        if report["schema_differences"]:
+            failures.append("helpers/models.py differs from the database schema")
+
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failures else 0)
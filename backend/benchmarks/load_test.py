@@ -0,0 +1,235 @@
+"""
+Loads the backend with parallel uploads and reports how its connection pool copes.
+
+For each pool configuration (DB_POOL_SIZE:DB_MAX_OVERFLOW) it starts
+gunicorn and, at each concurrency level, sends that many /submit-sample
+requests at a time. It reports the throughput, the latency percentiles and
+the outcomes, and, sampled while the load runs, the connections the
+server holds in Postgres (pg_stat_activity, by state) and the pool gauges of
+/metrics. It runs against the database configured by the SQL_* variables,
+like the server, and stores every upload there:
+
+    python benchmarks/load_test.py --pools 2:0,5:10 --concurrency 1,8,32
+"""
+import argparse
+import base64
+import glob
+import io
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from PIL import Image
+from sqlalchemy import text
+
+SRC_DIR = path.join(path.dirname(path.abspath(__file__)), "..", "src")
+IMAGES = path.join(SRC_DIR, "..", "..", "notebooks", "imgs", "*", "*.JPG")
+
+sys.path.insert(0, SRC_DIR)
+from startup import children, free_port  # noqa: E402
+
+CONNECTIONS = """
+SELECT coalesce(state, 'unknown'), count(*)
+FROM pg_stat_activity
+WHERE datname = current_database()
+AND pid <> pg_backend_pid()
+AND backend_type = 'client backend'
+GROUP BY 1
+"""
+
+
+def photos(pattern, size, count):
+    """Base64 JPEGs of up to count photos, at most size pixels wide."""
+    encoded = []
+    for name in sorted(glob.glob(pattern))[:count]:
+        image = Image.open(name).convert("RGB")
+        image.thumbnail((size, size))
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        encoded.append(base64.b64encode(buffer.getvalue()).decode())
+    if not encoded:
+        raise RuntimeError(f"no photos match {pattern}")
+    return encoded
+
+
+def upload(url, photo, name):
+    """Submit one sample; returns the outcome and the latency. The outcome
+    is the status code, or the detail of a 400: 102 (a known turtle, the
+    encounter is stored) or 103 (name taken)."""
+    body = json.dumps({
+        "latitude": "-22.9",
+        "longitude": "-43.2",
+        "turtle_name": name,
+        "photo_date": "2022-07-29",
+        "photo1": photo,
+        "photo2": photo,
+    }).encode()
+    request = Request(url + "/submit-sample", body, {"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urlopen(request, timeout=300) as response:
+            status = response.status
+    except HTTPError as error:
+        status = error.code
+        if status == 400:
+            status = json.loads(error.read()).get("detail", status)
+    except OSError:
+        status = "error"
+    return status, time.perf_counter() - start
+
+
+class Sampler(threading.Thread):
+    """Peak connections of the server, by state, and peak pool gauges,
+    sampled every interval seconds until stopped."""
+
+    def __init__(self, url, database, interval=0.1):
+        super().__init__(daemon=True)
+        self.url = url
+        self.database = database
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.connections = {}
+        self.gauges = {}
+
+    def run(self):
+        with self.database.connect() as conn:
+            while not self.stopped.wait(self.interval):
+                states = dict(conn.execute(text(CONNECTIONS)).all())
+                states["total"] = sum(states.values())
+                for state, count in states.items():
+                    self.connections[state] = max(self.connections.get(state, 0), count)
+                try:
+                    with urlopen(self.url + "/metrics", timeout=5) as response:
+                        lines = response.read().decode().splitlines()
+                except OSError:
+                    continue
+                # Summed over the workers, through METRICS_DIR
+                for line in lines:
+                    if line.startswith("db_pool_"):
+                        name, value = line.split()
+                        self.gauges[name] = max(self.gauges.get(name, 0), int(value))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def load(url, database, encoded, concurrency, requests):
+    """Send requests uploads, concurrency at a time."""
+    run = uuid.uuid4().hex[:8]
+    sampler = Sampler(url, database)
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(
+            lambda i: upload(url, encoded[i % len(encoded)], f"load-{run}-{i}"),
+            range(requests)
+        ))
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+
+    latencies = sorted(latency for _, latency in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "uploads_per_s": round(requests / elapsed, 2),
+        "latency_s": {
+            "p50": round(percentiles[49], 3),
+            "p95": round(percentiles[94], 3),
+            "p99": round(percentiles[98], 3),
+            "max": round(latencies[-1], 3),
+        },
+        "outcomes": statuses,
+        "peak_connections": sampler.connections,
+        "peak_pool_gauges": sampler.gauges,
+    }
+
+
+def serve(pool_size, max_overflow, args):
+    """Start gunicorn with a pool configuration and wait for /ready."""
+    port = free_port()
+    env = dict(
+        os.environ,
+        HOST="127.0.0.1",
+        PORT=str(port),
+        WEB_WORKERS=str(args.workers),
+        WEB_THREADS=str(args.threads),
+        DB_POOL_SIZE=str(pool_size),
+        DB_MAX_OVERFLOW=str(max_overflow),
+        DB_POOL_TIMEOUT=str(args.pool_timeout),
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:application"],
+        cwd=SRC_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.timeout:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            with urlopen(url + "/ready", timeout=5) as response:
+                if response.status == 200 and len(children(process.pid)) >= args.workers:
+                    return process, url
+        # Refused or timed out while the workers are still booting
+        except OSError:
+            pass
+        time.sleep(0.1)
+    process.send_signal(signal.SIGTERM)
+    raise RuntimeError(f"gunicorn not ready after {args.timeout} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pools", default="2:0,5:10", help="DB_POOL_SIZE:DB_MAX_OVERFLOW pairs")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=64, help="uploads per concurrency level")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--pool-timeout", type=float, default=30)
+    parser.add_argument("--images", default=IMAGES)
+    parser.add_argument("--size", type=int, default=480, help="width of the uploaded photos")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    from helpers.utils import connect_db
+    database = connect_db()
+    encoded = photos(args.images, args.size, 16)
+
+    report = []
+    for pool in args.pools.split(","):
+        pool_size, max_overflow = (int(value) for value in pool.split(":"))
+        process, url = serve(pool_size, max_overflow, args)
+        try:
+            for concurrency in args.concurrency.split(","):
+                print(f"pool {pool}, {concurrency} concurrent uploads", file=sys.stderr)
+                report.append({
+                    "pool_size": pool_size,
+                    "max_overflow": max_overflow,
+                    **load(url, database, encoded, int(concurrency), args.requests),
+                })
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
+    database.dispose()
+
+    print(json.dumps({
+        "workers": args.workers,
+        "threads": args.threads,
+        "pool_timeout_s": args.pool_timeout,
+        "runs": report,
+    }, indent=2))
@@ -0,0 +1,266 @@
+"""
+Benchmarks head recognition on the labelled photos of notebooks/imgs.
+
+Each CM* folder holds the photos of one turtle. The first photos of every
+folder are enrolled in the gallery and each remaining photo is identified
+against it, through the same ingest, feature and index code as the server.
+The gallery is then padded with synthetic identities to measure how search
+latency, throughput and accuracy scale:
+
+    python benchmarks/recognition.py --matcher contour --output contour.json
+
+With --cascade-top-k, every search also runs through the perceptual hash
+shortlist, and the report tells how often it agrees with the exhaustive search.
+"""
+import argparse
+import glob
+import json
+import statistics
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(__file__), "..", "src"))
+
+import numpy as np
+
+from helpers.images import ingest_image
+from vision_models.descriptor_index import HuMomentsIndex, hu_distances
+from vision_models.hash_index import HashIndex, perceptual_hash
+from vision_models.recognition_pool import head_features
+from vision_models.sift_index import SiftIndex
+
+IMAGES_DIR = path.join(path.dirname(__file__), "..", "..", "notebooks", "imgs")
+
+# Same decision thresholds as the server defaults
+THRESHOLDS = {
+    "contour": 0.1,
+    "sift": 60,
+}
+
+
+def load_dataset(directory):
+    """Photo paths by identity, one identity per CM* folder."""
+    dataset = {}
+    for folder in sorted(glob.glob(path.join(directory, "CM*"))):
+        photos = sorted(
+            glob.glob(path.join(folder, "*.JPG")) + glob.glob(path.join(folder, "*.jpg"))
+        )
+        if photos:
+            dataset[path.basename(folder)] = photos
+    return dataset
+
+
+def extract(matcher, photo):
+    """Descriptor and perceptual hash of a photo, and the milliseconds
+    spent on each."""
+    with open(photo, "rb") as file:
+        data = file.read()
+    start = time.perf_counter()
+    head = ingest_image(data).matching
+    descriptor = head_features(matcher, head)
+    extracted = time.perf_counter()
+    signature = perceptual_hash(head)
+    hashed = time.perf_counter()
+    return descriptor, signature, (extracted - start) * 1000, (hashed - extracted) * 1000
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return {
+        "mean_ms": round(statistics.mean(timings), 3),
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[int(0.95 * (len(timings) - 1))], 3),
+        "p99_ms": round(timings[int(0.99 * (len(timings) - 1))], 3),
+    }
+
+
+def build_index(matcher, gallery):
+    """Matcher and hash indexes of (entry id, descriptor, signature) triples."""
+    index = SiftIndex() if matcher == "sift" else HuMomentsIndex()
+    hash_index = HashIndex()
+    for entry, descriptor, signature in gallery:
+        index.add(entry, descriptor)
+        hash_index.add(entry, signature)
+    return index, hash_index
+
+
+def scores(matcher, index, descriptor):
+    """Score of every gallery entry for a query, higher is better."""
+    if matcher == "sift":
+        return index.votes(descriptor)
+    entries, moments = index.snapshot()
+    if len(entries) == 0:
+        return {}
+    return dict(zip(entries.tolist(), (-hu_distances(descriptor, moments)).tolist()))
+
+
+def rank_identities(entry_scores, owners):
+    """Identities ordered by the best score of their entries."""
+    best = {}
+    for entry, score in entry_scores.items():
+        identity = owners[entry]
+        if identity not in best or score > best[identity]:
+            best[identity] = score
+    return sorted(best, key=best.get, reverse=True)
+
+
+def synthetic_descriptors(matcher, real, count, sift_features):
+    """Distractor descriptors resembling the real ones."""
+    rng = np.random.default_rng(0)
+    if matcher == "sift":
+        pool = np.concatenate([d for d in real if d is not None and len(d)])
+        for _ in range(count):
+            rows = pool[rng.integers(len(pool), size=sift_features)]
+            yield np.clip(rows + rng.normal(0, 10, rows.shape), 0, 255).astype(np.float32)
+    else:
+        for _ in range(count):
+            moments = real[rng.integers(len(real))]
+            # Log-normal jitter keeps signs and orders of magnitude realistic
+            yield moments * np.exp(rng.normal(0, 0.5, moments.shape))
+
+
+def decide(decisions, match, owners, identity):
+    if match is None:
+        decisions["rejected"] += 1
+    elif owners[match] == identity:
+        decisions["correct"] += 1
+    else:
+        decisions["wrong"] += 1
+
+
+def identify(matcher, indexes, owners, queries, top_k, cascade_k, cascade_max_distance):
+    """Accuracy and search latency of every query against an index, and
+    of the cascade when cascade_k > 0."""
+    index, hash_index = indexes
+    hits = {k: 0 for k in top_k}
+    decisions = {"correct": 0, "wrong": 0, "rejected": 0}
+    timings = []
+    cascade = {
+        "decisions": {"correct": 0, "wrong": 0, "rejected": 0},
+        "agreement": 0,
+        "identity_in_shortlist": 0,
+        "timings": [],
+    }
+    for identity, descriptor, signature in queries:
+        # Only the lookup the server does is timed
+        start = time.perf_counter()
+        match = index.best_match(descriptor, THRESHOLDS[matcher])
+        timings.append((time.perf_counter() - start) * 1000)
+        ranking = rank_identities(scores(matcher, index, descriptor), owners)
+
+        for k in top_k:
+            hits[k] += identity in ranking[:k]
+        decide(decisions, match, owners, identity)
+
+        if cascade_k > 0:
+            start = time.perf_counter()
+            # Same rule as the server: galleries up to K are searched whole
+            if len(hash_index) > cascade_k:
+                candidates = hash_index.shortlist(signature, cascade_k, cascade_max_distance)
+            else:
+                candidates = None
+            cascade_match = index.best_match(descriptor, THRESHOLDS[matcher], candidates)
+            cascade["timings"].append((time.perf_counter() - start) * 1000)
+
+            decide(cascade["decisions"], cascade_match, owners, identity)
+            cascade["agreement"] += cascade_match == match
+            cascade["identity_in_shortlist"] += candidates is None or any(
+                owners[entry] == identity for entry in candidates.tolist()
+            )
+
+    report = {
+        "accuracy": {f"top{k}": round(hits[k] / len(queries), 4) for k in top_k},
+        "decisions": decisions,
+        "search": percentiles(timings),
+        "throughput_qps": round(len(queries) / (sum(timings) / 1000), 2),
+    }
+    if cascade_k > 0:
+        report["cascade"] = {
+            "decisions": cascade["decisions"],
+            # Fraction of queries deciding as the exhaustive search does
+            "agreement": round(cascade["agreement"] / len(queries), 4),
+            "identity_in_shortlist": round(cascade["identity_in_shortlist"] / len(queries), 4),
+            "search": percentiles(cascade["timings"]),
+            "throughput_qps": round(len(queries) / (sum(cascade["timings"]) / 1000), 2),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--matcher", choices=("contour", "sift"), default="contour")
+    parser.add_argument("--images", default=IMAGES_DIR)
+    parser.add_argument("--gallery-per-identity", type=int, default=1)
+    parser.add_argument("--top-k", default="1,3,5")
+    parser.add_argument("--scales", default="100,1000,10000",
+                        help="gallery sizes, in identities, for the scaling runs")
+    parser.add_argument("--sift-features", type=int, default=100,
+                        help="descriptors per synthetic SIFT identity")
+    parser.add_argument("--cascade-top-k", type=int, default=0,
+                        help="perceptual hash shortlist size, 0 to skip the cascade")
+    parser.add_argument("--cascade-max-distance", type=int, default=64)
+    parser.add_argument("--output", help="JSON file for the report (default: stdout)")
+    args = parser.parse_args()
+
+    top_k = [int(k) for k in args.top_k.split(",")]
+    dataset = load_dataset(args.images)
+
+    gallery, queries, owners, extraction, hashing = [], [], {}, [], []
+    for identity, photos in dataset.items():
+        for position, photo in enumerate(photos):
+            descriptor, signature, extracted, hashed = extract(args.matcher, photo)
+            extraction.append(extracted)
+            hashing.append(hashed)
+            if position < args.gallery_per_identity:
+                entry = len(owners) + 1
+                owners[entry] = identity
+                gallery.append((entry, descriptor, signature))
+            else:
+                queries.append((identity, descriptor, signature))
+    cascade = (args.cascade_top_k, args.cascade_max_distance)
+
+    report = {
+        "matcher": args.matcher,
+        "identities": len(dataset),
+        "gallery_per_identity": args.gallery_per_identity,
+        "queries": len(queries),
+        "extraction": percentiles(extraction),
+        "hashing": percentiles(hashing),
+        **identify(args.matcher, build_index(args.matcher, gallery), owners, queries, top_k, *cascade),
+        "scaling": [],
+    }
+
+    # Distractors derive from the gallery only, never from the held-out queries
+    real = [descriptor for _, descriptor, _ in gallery]
+    rng = np.random.default_rng(0)
+    for scale in sorted(int(s) for s in args.scales.split(",")):
+        extra = max(scale - len(dataset), 0)
+        scaled_gallery, scaled_owners = list(gallery), dict(owners)
+        for descriptor in synthetic_descriptors(args.matcher, real, extra, args.sift_features):
+            entry = len(scaled_owners) + 1
+            scaled_owners[entry] = f"synthetic_{entry}"
+            # Hashes of unrelated photos: uniformly random bits
+            signature = int(rng.integers(0, 2 ** 63)) << 1 | int(rng.integers(0, 2))
+            scaled_gallery.append((entry, descriptor, signature))
+
+        start = time.perf_counter()
+        indexes = build_index(args.matcher, scaled_gallery)
+        # SIFT builds its FLANN tree on first search; build it here to time it apart
+        if args.matcher == "sift":
+            indexes[0].votes(real[0])
+        built = time.perf_counter() - start
+
+        report["scaling"].append({
+            "identities": len(dataset) + extra,
+            "build_s": round(built, 3),
+            **identify(args.matcher, indexes, scaled_owners, queries, top_k, *cascade),
+        })
+        print(f"{len(dataset) + extra} identities done", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output)
+    else:
+        print(output)
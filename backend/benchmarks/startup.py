@@ -0,0 +1,144 @@
+"""
+Measures the backend cold start and the memory of its gunicorn workers.
+
+Reports the time to import the app and load the recognition index in a
+fresh interpreter. Then, for gunicorn with and without preload, it reports
+the time until every worker is up and /ready answers, and the RSS, PSS
+(shared pages split between processes) and private memory of the master
+and each worker. It runs against the database configured by the SQL_*
+variables, like the server:
+
+    python benchmarks/startup.py --workers 4
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from os import path
+from urllib.request import urlopen
+
+SRC_DIR = path.join(path.dirname(path.abspath(__file__)), "..", "src")
+
+COLD_START = """
+import json, resource, time
+start = time.perf_counter()
+import server
+imported = time.perf_counter()
+server.load_head_index()
+loaded = time.perf_counter()
+print(json.dumps({
+    "import_s": round(imported - start, 3),
+    "index_load_s": round(loaded - imported, 3),
+    "indexed_turtles": len(server.head_index),
+    "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+}))
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def memory(pid):
+    """Rss, Pss and private memory of a process, in MB."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss_mb": round(fields["Rss"] / 1024, 1),
+        "pss_mb": round(fields["Pss"] / 1024, 1),
+        "private_mb": round((fields["Private_Clean"] + fields["Private_Dirty"]) / 1024, 1),
+    }
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children", encoding="utf-8") as file:
+        return [int(child) for child in file.read().split()]
+
+
+def cold_start():
+    output = subprocess.run(
+        [sys.executable, "-c", COLD_START],
+        cwd=SRC_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def gunicorn(workers, preload, timeout):
+    """Start gunicorn, wait for every worker and /ready, then measure it."""
+    port = free_port()
+    env = dict(
+        os.environ,
+        HOST="127.0.0.1",
+        PORT=str(port),
+        WEB_WORKERS=str(workers),
+        WEB_PRELOAD="1" if preload else "0",
+    )
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:application"],
+        cwd=SRC_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        ready = None
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError("gunicorn exited during startup")
+            try:
+                with urlopen(f"http://127.0.0.1:{port}/ready", timeout=5) as response:
+                    if response.status == 200 and len(children(process.pid)) >= workers:
+                        ready = time.perf_counter() - start
+                        break
+            # Refused or timed out while the workers are still booting
+            except OSError:
+                pass
+            time.sleep(0.1)
+        if ready is None:
+            raise RuntimeError(f"gunicorn not ready after {timeout} s")
+
+        # Every worker has finished booting once each answered at least once
+        for _ in range(workers * 4):
+            with urlopen(f"http://127.0.0.1:{port}/ready", timeout=30):
+                pass
+
+        print(f"gunicorn preload={preload} measured", file=sys.stderr)
+        worker_memory = [memory(pid) for pid in children(process.pid)]
+        master = memory(process.pid)
+        return {
+            "workers": workers,
+            "preload": preload,
+            "ready_s": round(ready, 3),
+            "master": master,
+            "worker_mean": {
+                key: round(sum(item[key] for item in worker_memory) / len(worker_memory), 1)
+                for key in master
+            },
+            "total_pss_mb": round(master["pss_mb"] + sum(item["pss_mb"] for item in worker_memory), 1),
+        }
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        "cold_start": cold_start(),
+        "gunicorn": [
+            gunicorn(args.workers, preload, args.timeout)
+            for preload in (True, False)
+        ],
+    }, indent=2))
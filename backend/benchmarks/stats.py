@@ -0,0 +1,260 @@
+"""
+Benchmarks the /stats aggregations as the encounter history grows.
+
+The tables are created in a separate schema of the configured database (the
+same SQL_* variables as the server), migrated, and grown to each size in
+--encounters. At each size it times every aggregation read from the summary
+tables of 0007_estatisticas and computed with GROUP BY on encontro. Then it
+measures what the triggers add to an insert, runs concurrent writers to check
+that they never deadlock, and compares the summaries with encontro:
+
+    python benchmarks/stats.py --encounters 10000,100000,1000000
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(__file__), "..", "src"))
+
+import sqlalchemy as sql
+from sqlalchemy.exc import DBAPIError
+
+from helpers.utils import connect_db
+from helpers.migrations import run_migrations
+
+BASELINE_SQL = path.join(path.dirname(__file__), "..", "..", "database", "create_db.sql")
+
+# Same aggregations as the /stats endpoints of server.py
+QUERIES = {
+    "estados": {
+        "summary": """
+            SELECT estado, sum(encontros) FROM estatistica_local
+            GROUP BY estado HAVING sum(encontros) > 0 ORDER BY 2 DESC, 1""",
+        "encontro": """
+            SELECT estado, count(identificador) FROM encontro
+            GROUP BY estado HAVING count(identificador) > 0 ORDER BY 2 DESC, 1""",
+    },
+    "cidades": {
+        "summary": """
+            SELECT estado, cidade, sum(encontros) FROM estatistica_local
+            GROUP BY estado, cidade HAVING sum(encontros) > 0
+            ORDER BY 3 DESC, 1, 2 LIMIT 100""",
+        "encontro": """
+            SELECT estado, cidade, count(identificador) FROM encontro
+            GROUP BY estado, cidade HAVING count(identificador) > 0
+            ORDER BY 3 DESC, 1, 2 LIMIT 100""",
+    },
+    "tartarugas": {
+        "summary": """
+            SELECT tartaruga_identificador, sum(encontros), min(primeiro_encontro),
+                   max(ultimo_encontro)
+            FROM estatistica_tartaruga
+            GROUP BY tartaruga_identificador HAVING sum(encontros) > 0
+            ORDER BY 2 DESC, 1 LIMIT 100""",
+        "encontro": """
+            SELECT tartaruga_identificador, count(identificador), min("data"), max("data")
+            FROM encontro
+            GROUP BY tartaruga_identificador HAVING count(identificador) > 0
+            ORDER BY 2 DESC, 1 LIMIT 100""",
+    },
+    "meses": {
+        "summary": """
+            SELECT mes, sum(encontros) FROM estatistica_mes
+            GROUP BY mes HAVING sum(encontros) > 0 ORDER BY mes""",
+        "encontro": """
+            SELECT date_trunc('month', "data")::date, count(identificador) FROM encontro
+            GROUP BY 1 HAVING count(identificador) > 0 ORDER BY 1""",
+    },
+}
+
+INSERT_ENCONTROS = """
+    INSERT INTO encontro (latitude, longitude, cidade, estado, tartaruga_identificador,
+                          imagem_corpo, imagem_cabeca, "data")
+    SELECT '-22.9', '-43.2', 'cidade_' || c, 'estado_' || (c % 27),
+           1 + (random() * (:turtles - 1))::int,
+           decode('00', 'hex'), decode('00', 'hex'),
+           date '2015-01-01' + (random() * 2900)::int
+    FROM (SELECT (random() * (:cities - 1))::int AS c FROM generate_series(1, :count)) cidades
+"""
+
+
+def setup(database, schema, turtles):
+    """Create the baseline tables in a fresh schema and migrate them."""
+    with database.begin() as conn:
+        conn.execute(sql.text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+        conn.execute(sql.text(f'CREATE SCHEMA "{schema}"'))
+        conn.execute(sql.text(f'SET LOCAL search_path TO "{schema}"'))
+        with open(BASELINE_SQL, encoding="utf-8") as file:
+            conn.exec_driver_sql(file.read())
+        conn.execute(sql.text("""
+            INSERT INTO tartaruga (nome, ultimo_encontro, ultima_imagem_cabeca)
+            SELECT 'tartaruga_' || i, date '2022-01-01', decode('00', 'hex')
+            FROM generate_series(1, :turtles) i
+        """), {"turtles": turtles})
+    run_migrations(database, schema=schema)
+
+
+def connect(database, schema):
+    conn = database.connect()
+    conn.execute(sql.text(f'SET search_path TO "{schema}"'))
+    return conn
+
+
+def grow(database, schema, count, turtles, cities, chunk=100_000):
+    """Insert count encounters through the triggers, chunk rows per statement."""
+    with connect(database, schema) as conn:
+        while count > 0:
+            with conn.begin():
+                conn.execute(sql.text(INSERT_ENCONTROS), {
+                    "count": min(chunk, count), "turtles": turtles, "cities": cities
+                })
+            count -= chunk
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(sql.text("ANALYZE"))
+
+
+def measure(database, schema, repetitions):
+    """Median milliseconds of each aggregation, from each source."""
+    report = {}
+    with connect(database, schema) as conn:
+        for name, sources in QUERIES.items():
+            report[name] = {}
+            for source, query in sources.items():
+                timings = []
+                for _ in range(repetitions):
+                    start = time.perf_counter()
+                    conn.execute(sql.text(query)).fetchall()
+                    timings.append((time.perf_counter() - start) * 1000)
+                report[name][f"{source}_ms"] = round(statistics.median(timings), 3)
+    return report
+
+
+def insert_cost(database, schema, inserts, turtles, cities):
+    """Median milliseconds of a one-row insert transaction, with the triggers
+    and without them."""
+    report = {}
+    with connect(database, schema) as conn:
+        for triggers in (True, False):
+            with conn.begin():
+                conn.execute(sql.text(
+                    f"ALTER TABLE encontro {'ENABLE' if triggers else 'DISABLE'} TRIGGER USER"
+                ))
+            timings = []
+            for _ in range(inserts):
+                start = time.perf_counter()
+                with conn.begin():
+                    conn.execute(sql.text(INSERT_ENCONTROS), {
+                        "count": 1, "turtles": turtles, "cities": cities
+                    })
+                timings.append((time.perf_counter() - start) * 1000)
+            report["with_triggers_ms" if triggers else "without_triggers_ms"] = round(
+                statistics.median(timings), 3
+            )
+        with conn.begin():
+            # The rows inserted without the triggers never reached the summaries
+            conn.execute(sql.text(
+                "DELETE FROM encontro WHERE identificador > (SELECT max(identificador) FROM encontro) - :n"
+            ), {"n": inserts})
+            conn.execute(sql.text("ALTER TABLE encontro ENABLE TRIGGER USER"))
+    return report
+
+
+def concurrent_writers(database, schema, writers, seconds, turtles, cities):
+    """Writers inserting batches and deleting encounters at once; counts the
+    deadlocks."""
+    deadlocks, transactions = [0], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+    with connect(database, schema) as conn:
+        last = conn.execute(sql.text("SELECT max(identificador) FROM encontro")).scalar()
+
+    def writer():
+        with connect(database, schema) as conn:
+            while time.perf_counter() < deadline:
+                try:
+                    # One statement per transaction, like the server writes
+                    with conn.begin():
+                        if random.random() < 0.2:
+                            first = random.randint(1, last)
+                            conn.execute(sql.text(
+                                "DELETE FROM encontro WHERE identificador BETWEEN :first AND :first + 4"
+                            ), {"first": first})
+                        else:
+                            conn.execute(sql.text(INSERT_ENCONTROS), {
+                                "count": random.randint(1, 50), "turtles": turtles, "cities": cities
+                            })
+                    with lock:
+                        transactions[0] += 1
+                except DBAPIError as error:
+                    if "deadlock" not in str(error):
+                        raise
+                    with lock:
+                        deadlocks[0] += 1
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"writers": writers, "transactions": transactions[0], "deadlocks": deadlocks[0]}
+
+
+def consistent(database, schema):
+    """Whether every summary matches its GROUP BY on encontro."""
+    with connect(database, schema) as conn:
+        return all(
+            conn.execute(sql.text(sources["summary"])).fetchall()
+            == conn.execute(sql.text(sources["encontro"])).fetchall()
+            for sources in QUERIES.values()
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--encounters", default="10000,100000,1000000")
+    parser.add_argument("--turtles", type=int, default=10_000)
+    parser.add_argument("--cities", type=int, default=500)
+    parser.add_argument("--repetitions", type=int, default=10)
+    parser.add_argument("--inserts", type=int, default=200)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--schema", default="bench_stats")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic schema")
+    args = parser.parse_args()
+
+    database = connect_db()
+    random.seed(0)
+    setup(database, args.schema, args.turtles)
+
+    sizes, current = [], 0
+    for size in (int(value) for value in args.encounters.split(",")):
+        start = time.perf_counter()
+        grow(database, args.schema, size - current, args.turtles, args.cities)
+        print(f"{size} encounters", file=sys.stderr)
+        sizes.append({
+            "encounters": size,
+            "grow_s": round(time.perf_counter() - start, 1),
+            "queries": measure(database, args.schema, args.repetitions),
+        })
+        current = size
+
+    report = {
+        "turtles": args.turtles,
+        "cities": args.cities,
+        "sizes": sizes,
+        "insert": insert_cost(database, args.schema, args.inserts, args.turtles, args.cities),
+        "concurrency": concurrent_writers(
+            database, args.schema, args.writers, args.seconds, args.turtles, args.cities
+        ),
+        "summaries_consistent": consistent(database, args.schema),
+    }
+
+    if not args.keep:
+        with database.begin() as conn:
+            conn.execute(sql.text(f'DROP SCHEMA "{args.schema}" CASCADE'))
+
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,11 @@
+-- Cache persistente da geocodificacao reversa dos encontros
+CREATE TABLE IF NOT EXISTS geocodificacao(
+  latitude double precision NOT NULL,
+  longitude double precision NOT NULL,
+  cidade varchar NOT NULL,
+  estado varchar NOT NULL,
+  criado_em timestamp NOT NULL,
+  CONSTRAINT geocodificacao_pkey PRIMARY KEY(latitude, longitude)
+);
+
+COMMENT ON TABLE geocodificacao IS 'cache da geocodificacao reversa dos encontros';
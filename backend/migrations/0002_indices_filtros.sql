@@ -0,0 +1,24 @@
+-- Indices para os filtros de /filter-samples e /samples
+
+-- Filtro por tartaruga, opcionalmente com intervalo de datas
+CREATE INDEX IF NOT EXISTS encontro_tartaruga_data_idx
+  ON encontro (tartaruga_identificador, "data");
+
+-- Filtro por estado e cidade, opcionalmente com intervalo de datas
+CREATE INDEX IF NOT EXISTS encontro_estado_cidade_data_idx
+  ON encontro (estado, cidade, "data");
+
+-- Filtro apenas por intervalo de datas
+CREATE INDEX IF NOT EXISTS encontro_data_idx
+  ON encontro ("data");
+
+-- Nomes repetidos recebem o identificador como sufixo antes do indice unico
+UPDATE tartaruga t
+  SET nome = t.nome || ' (' || t.identificador || ')'
+  WHERE EXISTS (
+    SELECT 1 FROM tartaruga o
+    WHERE o.nome = t.nome AND o.identificador < t.identificador
+  );
+
+CREATE UNIQUE INDEX IF NOT EXISTS tartaruga_nome_key
+  ON tartaruga (nome);
@@ -0,0 +1,16 @@
+-- Coordenadas numericas dos encontros, com indice espacial
+
+ALTER TABLE encontro
+  ADD COLUMN IF NOT EXISTS latitude_num double precision,
+  ADD COLUMN IF NOT EXISTS longitude_num double precision;
+
+UPDATE encontro
+  SET latitude_num = latitude::double precision,
+      longitude_num = longitude::double precision
+  WHERE latitude_num IS NULL
+    AND latitude ~ '^\s*-?[0-9]+(\.[0-9]+)?\s*$'
+    AND longitude ~ '^\s*-?[0-9]+(\.[0-9]+)?\s*$';
+
+-- O tipo point do Postgres tem operador GiST nativo, sem depender do PostGIS
+CREATE INDEX IF NOT EXISTS encontro_coordenadas_idx
+  ON encontro USING gist (point(longitude_num, latitude_num));
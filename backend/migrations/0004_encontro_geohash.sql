@@ -0,0 +1,66 @@
+-- Geohash dos encontros, para consultas por area que funcionam sem PostGIS
+
+-- Mesmo algoritmo de helpers.geo.geohash_encode
+CREATE OR REPLACE FUNCTION geohash_encode(
+  lat double precision,
+  lon double precision,
+  precisao integer DEFAULT 9
+) RETURNS varchar
+LANGUAGE plpgsql IMMUTABLE AS $$
+DECLARE
+  base32 constant text := '0123456789bcdefghjkmnpqrstuvwxyz';
+  lat_min double precision := -90;
+  lat_max double precision := 90;
+  lon_min double precision := -180;
+  lon_max double precision := 180;
+  meio double precision;
+  hash text := '';
+  bits integer := 0;
+  caractere integer := 0;
+  par boolean := true;
+BEGIN
+  IF lat IS NULL OR lon IS NULL THEN
+    RETURN NULL;
+  END IF;
+  WHILE length(hash) < precisao LOOP
+    IF par THEN
+      meio := (lon_min + lon_max) / 2;
+      IF lon >= meio THEN
+        caractere := caractere * 2 + 1;
+        lon_min := meio;
+      ELSE
+        caractere := caractere * 2;
+        lon_max := meio;
+      END IF;
+    ELSE
+      meio := (lat_min + lat_max) / 2;
+      IF lat >= meio THEN
+        caractere := caractere * 2 + 1;
+        lat_min := meio;
+      ELSE
+        caractere := caractere * 2;
+        lat_max := meio;
+      END IF;
+    END IF;
+    par := NOT par;
+    bits := bits + 1;
+    IF bits = 5 THEN
+      hash := hash || substr(base32, caractere + 1, 1);
+      bits := 0;
+      caractere := 0;
+    END IF;
+  END LOOP;
+  RETURN hash;
+END
+$$;
+
+ALTER TABLE encontro
+  ADD COLUMN IF NOT EXISTS geohash varchar(12);
+
+UPDATE encontro
+  SET geohash = geohash_encode(latitude_num, longitude_num)
+  WHERE geohash IS NULL AND latitude_num IS NOT NULL;
+
+-- varchar_pattern_ops permite usar o indice em LIKE 'prefixo%'
+CREATE INDEX IF NOT EXISTS encontro_geohash_idx
+  ON encontro (geohash varchar_pattern_ops);
@@ -0,0 +1,9 @@
+-- Miniaturas dos encontros e cabeca normalizada usada no reconhecimento.
+-- Linhas antigas ficam NULL ate rodar backfill_images.py
+
+ALTER TABLE encontro
+  ADD COLUMN IF NOT EXISTS miniatura_corpo bytea,
+  ADD COLUMN IF NOT EXISTS miniatura_cabeca bytea;
+
+ALTER TABLE tartaruga
+  ADD COLUMN IF NOT EXISTS cabeca_normalizada bytea;
@@ -0,0 +1,34 @@
+-- Imagens passam a ser guardadas em binario, sem base64 (33% menores).
+-- Apenas valores cujo inicio e texto base64 sao convertidos; bytes brutos
+-- e referencias ao armazenamento em arquivos (sha256:...) ficam como estao
+
+CREATE FUNCTION pg_temp.imagem_em_base64(imagem bytea) RETURNS boolean
+LANGUAGE sql IMMUTABLE AS $$
+  SELECT imagem IS NOT NULL
+     AND length(imagem) > 0
+     AND encode(substring(imagem FROM 1 FOR 64), 'escape') ~ '^[A-Za-z0-9+/=]+$'
+$$;
+
+CREATE FUNCTION pg_temp.imagem_binaria(imagem bytea) RETURNS bytea
+LANGUAGE sql IMMUTABLE AS $$
+  SELECT CASE WHEN pg_temp.imagem_em_base64(imagem)
+    THEN decode(convert_from(imagem, 'UTF8'), 'base64')
+    ELSE imagem
+  END
+$$;
+
+UPDATE encontro SET
+    imagem_corpo = pg_temp.imagem_binaria(imagem_corpo),
+    imagem_cabeca = pg_temp.imagem_binaria(imagem_cabeca),
+    miniatura_corpo = pg_temp.imagem_binaria(miniatura_corpo),
+    miniatura_cabeca = pg_temp.imagem_binaria(miniatura_cabeca)
+  WHERE pg_temp.imagem_em_base64(imagem_corpo)
+     OR pg_temp.imagem_em_base64(imagem_cabeca)
+     OR pg_temp.imagem_em_base64(miniatura_corpo)
+     OR pg_temp.imagem_em_base64(miniatura_cabeca);
+
+UPDATE tartaruga SET
+    ultima_imagem_cabeca = pg_temp.imagem_binaria(ultima_imagem_cabeca),
+    cabeca_normalizada = pg_temp.imagem_binaria(cabeca_normalizada)
+  WHERE pg_temp.imagem_em_base64(ultima_imagem_cabeca)
+     OR pg_temp.imagem_em_base64(cabeca_normalizada);
@@ -0,0 +1,152 @@
+-- Resumos dos encontros para /stats: por local, por tartaruga e por mes.
+-- Gatilhos por comando somam a variacao de cada escrita em encontro, de
+-- modo que ler um resumo nao depende do tamanho do historico
+
+CREATE TABLE IF NOT EXISTS estatistica_local (
+  estado varchar NOT NULL,
+  cidade varchar NOT NULL,
+  encontros bigint NOT NULL,
+  CONSTRAINT estatistica_local_pkey PRIMARY KEY (estado, cidade)
+);
+
+CREATE TABLE IF NOT EXISTS estatistica_tartaruga (
+  tartaruga_identificador integer NOT NULL,
+  encontros bigint NOT NULL,
+  primeiro_encontro date,
+  ultimo_encontro date,
+  CONSTRAINT estatistica_tartaruga_pkey PRIMARY KEY (tartaruga_identificador)
+);
+
+CREATE TABLE IF NOT EXISTS estatistica_mes (
+  mes date NOT NULL,
+  encontros bigint NOT NULL,
+  CONSTRAINT estatistica_mes_pkey PRIMARY KEY (mes)
+);
+
+-- Aplica as linhas inseridas (sinal 1) e removidas (sinal -1) de um comando.
+-- As tabelas sao sempre atualizadas na mesma ordem, e cada uma pela ordem da
+-- chave, para que transacoes de um comando cada, como as do servidor, nao
+-- entrem em deadlock
+CREATE OR REPLACE FUNCTION estatisticas_aplicar(
+  estados varchar[],
+  cidades varchar[],
+  tartarugas integer[],
+  datas date[],
+  sinais integer[]
+) RETURNS void
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO estatistica_local AS e (estado, cidade, encontros)
+    SELECT estado, cidade, sum(sinal)
+    FROM unnest(estados, cidades, sinais) AS v(estado, cidade, sinal)
+    GROUP BY estado, cidade
+    HAVING sum(sinal) <> 0
+    ORDER BY estado, cidade
+  ON CONFLICT (estado, cidade) DO UPDATE
+    SET encontros = e.encontros + excluded.encontros;
+
+  INSERT INTO estatistica_tartaruga AS e
+      (tartaruga_identificador, encontros, primeiro_encontro, ultimo_encontro)
+    SELECT tartaruga, sum(sinal), min(data) FILTER (WHERE sinal > 0), max(data) FILTER (WHERE sinal > 0)
+    FROM unnest(tartarugas, datas, sinais) AS v(tartaruga, data, sinal)
+    GROUP BY tartaruga
+    HAVING sum(sinal) <> 0
+    ORDER BY tartaruga
+  ON CONFLICT (tartaruga_identificador) DO UPDATE
+    SET encontros = e.encontros + excluded.encontros,
+        primeiro_encontro = least(e.primeiro_encontro, excluded.primeiro_encontro),
+        ultimo_encontro = greatest(e.ultimo_encontro, excluded.ultimo_encontro);
+
+  -- Datas removidas podem ter sido a primeira ou a ultima da tartaruga
+  UPDATE estatistica_tartaruga e
+    SET primeiro_encontro = r.primeiro_encontro,
+        ultimo_encontro = r.ultimo_encontro
+    FROM (
+      SELECT e2.tartaruga_identificador, min(e2.data) AS primeiro_encontro, max(e2.data) AS ultimo_encontro
+      FROM encontro e2
+      WHERE e2.tartaruga_identificador IN (
+        SELECT tartaruga
+        FROM unnest(tartarugas, datas, sinais) AS v(tartaruga, data, sinal)
+        GROUP BY tartaruga, data
+        HAVING sum(sinal) < 0
+      )
+      GROUP BY e2.tartaruga_identificador
+    ) r
+    WHERE e.tartaruga_identificador = r.tartaruga_identificador;
+
+  INSERT INTO estatistica_mes AS e (mes, encontros)
+    SELECT date_trunc('month', data)::date, sum(sinal)
+    FROM unnest(datas, sinais) AS v(data, sinal)
+    GROUP BY 1
+    HAVING sum(sinal) <> 0
+    ORDER BY 1
+  ON CONFLICT (mes) DO UPDATE
+    SET encontros = e.encontros + excluded.encontros;
+END
+$$;
+
+-- Atualizacoes que so trocam imagens se anulam e nao tocam nos resumos
+CREATE OR REPLACE FUNCTION estatisticas_encontro() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM estatisticas_aplicar(
+      array_agg(estado), array_agg(cidade), array_agg(tartaruga_identificador),
+      array_agg("data"), array_agg(1)
+    ) FROM novos;
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM estatisticas_aplicar(
+      array_agg(estado), array_agg(cidade), array_agg(tartaruga_identificador),
+      array_agg("data"), array_agg(-1)
+    ) FROM antigos;
+  ELSE
+    PERFORM estatisticas_aplicar(
+      array_agg(estado), array_agg(cidade), array_agg(tartaruga_identificador),
+      array_agg("data"), array_agg(sinal)
+    ) FROM (
+      SELECT estado, cidade, tartaruga_identificador, "data", 1 AS sinal FROM novos
+      UNION ALL
+      SELECT estado, cidade, tartaruga_identificador, "data", -1 AS sinal FROM antigos
+    ) AS linhas;
+  END IF;
+  RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS encontro_estatisticas_insercao ON encontro;
+CREATE TRIGGER encontro_estatisticas_insercao
+  AFTER INSERT ON encontro
+  REFERENCING NEW TABLE AS novos
+  FOR EACH STATEMENT EXECUTE FUNCTION estatisticas_encontro();
+
+DROP TRIGGER IF EXISTS encontro_estatisticas_atualizacao ON encontro;
+CREATE TRIGGER encontro_estatisticas_atualizacao
+  AFTER UPDATE ON encontro
+  REFERENCING OLD TABLE AS antigos NEW TABLE AS novos
+  FOR EACH STATEMENT EXECUTE FUNCTION estatisticas_encontro();
+
+DROP TRIGGER IF EXISTS encontro_estatisticas_remocao ON encontro;
+CREATE TRIGGER encontro_estatisticas_remocao
+  AFTER DELETE ON encontro
+  REFERENCING OLD TABLE AS antigos
+  FOR EACH STATEMENT EXECUTE FUNCTION estatisticas_encontro();
+
+-- Criar os gatilhos bloqueia escritas em encontro ate o fim desta migracao,
+-- entao a carga inicial nao perde nem conta duas vezes nenhum encontro
+TRUNCATE estatistica_local, estatistica_tartaruga, estatistica_mes;
+
+INSERT INTO estatistica_local (estado, cidade, encontros)
+  SELECT estado, cidade, count(*)
+  FROM encontro
+  GROUP BY estado, cidade;
+
+INSERT INTO estatistica_tartaruga
+    (tartaruga_identificador, encontros, primeiro_encontro, ultimo_encontro)
+  SELECT tartaruga_identificador, count(*), min("data"), max("data")
+  FROM encontro
+  GROUP BY tartaruga_identificador;
+
+INSERT INTO estatistica_mes (mes, encontros)
+  SELECT date_trunc('month', "data")::date, count(*)
+  FROM encontro
+  GROUP BY 1;
@@ -0,0 +1,20 @@
+-- Estado dos trabalhos em segundo plano (submissoes assincronas e
+-- importacoes). Cada trabalho roda no processo que o recebeu, mas qualquer
+-- worker do servidor responde a consulta em /jobs
+CREATE TABLE IF NOT EXISTS trabalho (
+  identificador varchar NOT NULL,
+  situacao varchar NOT NULL,
+  codigo integer,
+  resultado json,
+  erro text,
+  criado_em timestamp NOT NULL,
+  concluido_em timestamp,
+  CONSTRAINT trabalho_pkey PRIMARY KEY (identificador)
+);
+
+-- Contagem dos trabalhos pendentes em /recognition-status
+CREATE INDEX IF NOT EXISTS trabalho_pendente_idx
+  ON trabalho (criado_em)
+  WHERE situacao IN ('queued', 'running');
+
+COMMENT ON TABLE trabalho IS 'trabalhos em segundo plano do servidor';
@@ -0,0 +1,3 @@
+-- As consultas por area usam o indice GiST de 0003_encontro_coordenadas, e o
+-- geohash so agrupa os encontros ja filtrados, entao este indice nao e lido
+DROP INDEX IF EXISTS encontro_geohash_idx;
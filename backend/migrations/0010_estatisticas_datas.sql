@@ -0,0 +1,72 @@
+-- Tartarugas sem nenhum encontro mantinham as datas do ultimo removido.
+-- Mesma funcao de 0007_estatisticas, mas o recalculo das datas tambem
+-- cobre as tartarugas que ficaram sem encontros
+
+CREATE OR REPLACE FUNCTION estatisticas_aplicar(
+  estados varchar[],
+  cidades varchar[],
+  tartarugas integer[],
+  datas date[],
+  sinais integer[]
+) RETURNS void
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO estatistica_local AS e (estado, cidade, encontros)
+    SELECT estado, cidade, sum(sinal)
+    FROM unnest(estados, cidades, sinais) AS v(estado, cidade, sinal)
+    GROUP BY estado, cidade
+    HAVING sum(sinal) <> 0
+    ORDER BY estado, cidade
+  ON CONFLICT (estado, cidade) DO UPDATE
+    SET encontros = e.encontros + excluded.encontros;
+
+  INSERT INTO estatistica_tartaruga AS e
+      (tartaruga_identificador, encontros, primeiro_encontro, ultimo_encontro)
+    SELECT tartaruga, sum(sinal), min(data) FILTER (WHERE sinal > 0), max(data) FILTER (WHERE sinal > 0)
+    FROM unnest(tartarugas, datas, sinais) AS v(tartaruga, data, sinal)
+    GROUP BY tartaruga
+    HAVING sum(sinal) <> 0
+    ORDER BY tartaruga
+  ON CONFLICT (tartaruga_identificador) DO UPDATE
+    SET encontros = e.encontros + excluded.encontros,
+        primeiro_encontro = least(e.primeiro_encontro, excluded.primeiro_encontro),
+        ultimo_encontro = greatest(e.ultimo_encontro, excluded.ultimo_encontro);
+
+  -- Datas removidas podem ter sido a primeira ou a ultima da tartaruga. Sem
+  -- encontros restantes, o LEFT JOIN deixa as duas datas NULL
+  UPDATE estatistica_tartaruga e
+    SET primeiro_encontro = r.primeiro_encontro,
+        ultimo_encontro = r.ultimo_encontro
+    FROM (
+      SELECT t.tartaruga, min(e2.data) AS primeiro_encontro, max(e2.data) AS ultimo_encontro
+      FROM (
+        SELECT DISTINCT tartaruga
+        FROM (
+          SELECT tartaruga
+          FROM unnest(tartarugas, datas, sinais) AS v(tartaruga, data, sinal)
+          GROUP BY tartaruga, data
+          HAVING sum(sinal) < 0
+        ) removidas
+      ) t
+      LEFT JOIN encontro e2 ON e2.tartaruga_identificador = t.tartaruga
+      GROUP BY t.tartaruga
+    ) r
+    WHERE e.tartaruga_identificador = r.tartaruga;
+
+  INSERT INTO estatistica_mes AS e (mes, encontros)
+    SELECT date_trunc('month', data)::date, sum(sinal)
+    FROM unnest(datas, sinais) AS v(data, sinal)
+    GROUP BY 1
+    HAVING sum(sinal) <> 0
+    ORDER BY 1
+  ON CONFLICT (mes) DO UPDATE
+    SET encontros = e.encontros + excluded.encontros;
+END
+$$;
+
+-- Corrige os resumos que ja ficaram com datas antigas
+UPDATE estatistica_tartaruga
+  SET primeiro_encontro = NULL,
+      ultimo_encontro = NULL
+  WHERE encontros = 0
+    AND (primeiro_encontro IS NOT NULL OR ultimo_encontro IS NOT NULL);
@@ -0,0 +1,100 @@
+"""
+Fills the thumbnails and normalized head images of the rows stored before
+image ingestion existed. Safe to interrupt and run again.
+"""
+import argparse
+
+import sqlalchemy as sql
+
+from helpers.utils import connect_db
+from helpers.images import ImageStore, ingest_image
+
+
+def backfill_encontros(database, store, batch):
+    encontro = sql.Table("encontro", sql.MetaData(), autoload_with=database)
+    done, cursor = 0, 0
+    while True:
+        with database.begin() as conn:
+            rows = conn.execute(
+                sql.select([
+                    encontro.c.identificador,
+                    encontro.c.imagem_corpo,
+                    encontro.c.imagem_cabeca
+                ]).where(
+                    encontro.c.identificador > cursor,
+                    sql.or_(
+                        encontro.c.miniatura_corpo.is_(None),
+                        encontro.c.miniatura_cabeca.is_(None)
+                    )
+                ).order_by(encontro.c.identificador).limit(batch)
+            ).fetchall()
+            for row in rows:
+                conn.execute(
+                    encontro.update().where(
+                        encontro.c.identificador == row.identificador
+                    ).values(
+                        miniatura_corpo=thumbnail(store, row.imagem_corpo),
+                        miniatura_cabeca=thumbnail(store, row.imagem_cabeca)
+                    )
+                )
+        if not rows:
+            return done
+        done += len(rows)
+        cursor = rows[-1].identificador
+        print(f"encontro: {done}")
+
+
+def backfill_tartarugas(database, store, batch):
+    tartaruga = sql.Table("tartaruga", sql.MetaData(), autoload_with=database)
+    done, cursor = 0, 0
+    while True:
+        with database.begin() as conn:
+            rows = conn.execute(
+                sql.select([
+                    tartaruga.c.identificador,
+                    tartaruga.c.ultima_imagem_cabeca
+                ]).where(
+                    tartaruga.c.identificador > cursor,
+                    tartaruga.c.cabeca_normalizada.is_(None)
+                ).order_by(tartaruga.c.identificador).limit(batch)
+            ).fetchall()
+            for row in rows:
+                conn.execute(
+                    tartaruga.update().where(
+                        tartaruga.c.identificador == row.identificador
+                    ).values(
+                        cabeca_normalizada=normalized_head(store, row.ultima_imagem_cabeca)
+                    )
+                )
+        if not rows:
+            return done
+        done += len(rows)
+        cursor = rows[-1].identificador
+        print(f"tartaruga: {done}")
+
+
+# Unreadable originals are left NULL and keep being used as they are
+
+def thumbnail(store, value):
+    try:
+        return store.put(ingest_image(store.get(value), with_matching=False).thumbnail)
+    except ValueError:
+        return None
+
+
+def normalized_head(store, value):
+    try:
+        return store.put(ingest_image(store.get(value)).matching)
+    except ValueError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--batch", type=int, default=50)
+    args = parser.parse_args()
+
+    database = connect_db()
+    store = ImageStore()
+    backfill_tartarugas(database, store, args.batch)
+    backfill_encontros(database, store, args.batch)
@@ -0,0 +1,37 @@
+"""
+Gunicorn settings for the backend. The app is loaded once in the master
+(see wsgi.py) and the workers are forked from it, so the models and the
+recognition index are shared copy-on-write instead of built per worker.
+"""
+import os
+import tempfile
+from os import getenv, path
+
+bind = f"{getenv('HOST', '0.0.0.0')}:{getenv('PORT', '5000')}"
+workers = int(getenv("WEB_WORKERS", "2"))
+threads = int(getenv("WEB_THREADS", "4"))
+# A synchronous submission runs recognition, which can take seconds
+timeout = int(getenv("WEB_TIMEOUT", "120"))
+# Recycle workers after this many requests; 0 never does
+max_requests = int(getenv("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+# The workers add up their metrics through files in METRICS_DIR, so every
+# scrape of /metrics reports the whole server. Those of a previous run go
+metrics_dir = getenv("METRICS_DIR") or path.join(tempfile.gettempdir(), "backend-metrics")
+os.makedirs(metrics_dir, exist_ok=True)
+for name in os.listdir(metrics_dir):
+    if name.startswith("metrics-"):
+        os.remove(path.join(metrics_dir, name))
+os.environ["METRICS_DIR"] = metrics_dir
+
+preload_app = getenv("WEB_PRELOAD", "1") == "1"
+if preload_app:
+    # server.py leaves the per-process resources to post_fork
+    os.environ["SERVER_PRELOAD"] = "1"
+
+
+def post_fork(arbiter, worker):
+    if preload_app:
+        from server import init_process
+        init_process()
@@ -0,0 +1,305 @@
+"""
+This module implements the reading side of bulk imports: listing the photos
+of a directory or archive, their EXIF metadata, the parallel extraction of
+their features and the progress log that makes an import resumable.
+"""
+import csv
+import io
+import os
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Set, Union
+
+import numpy as np
+from PIL import Image
+
+from helpers.images import ingest_image
+from helpers.utils import coordinates_extractor, verify_date
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff")
+
+# EXIF tags
+GPS_IFD = 0x8825
+EXIF_IFD = 0x8769
+DATE_TIME = 306
+DATE_TIME_ORIGINAL = 36867
+
+
+class ImportItem(NamedTuple):
+    """A photo of the source: its key (path inside the directory or archive),
+    the folder label naming its turtle and the manifest overrides."""
+
+    key: str
+    label: Union[str, None] = None
+    latitude: Union[str, None] = None
+    longitude: Union[str, None] = None
+    data: Union[str, None] = None
+
+
+class ExtractedPhoto(NamedTuple):
+    """What the workers compute for an item. skipped holds the reason an item
+    cannot be imported, and then the other fields are None."""
+
+    item: ImportItem
+    skipped: Union[str, None] = None
+    latitude: Union[str, None] = None
+    longitude: Union[str, None] = None
+    data: Union[str, None] = None
+    matching: Union[bytes, None] = None
+    thumbnail: Union[bytes, None] = None
+    descritor: Union[np.ndarray, None] = None
+    assinatura: Union[int, None] = None
+
+
+def _is_image(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not path.basename(name).startswith(".")
+
+
+def _label(key: str) -> Union[str, None]:
+    # The folder holding a photo names its turtle, as in notebooks/imgs/CM001
+    folder = path.basename(path.dirname(key))
+    return folder or None
+
+
+def source_keys(source: str) -> List[str]:
+    """Sorted keys of the photos of a directory, zip or tar archive.
+
+    Args:
+        source (str): Path of the directory or archive.
+
+    Returns:
+        List[str]: Paths of the photos, relative to the source.
+    """
+    if path.isdir(source):
+        keys = [
+            path.relpath(path.join(root, name), source)
+            for root, _, names in os.walk(source)
+            for name in names
+        ]
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            keys = [info.filename for info in archive.infolist() if not info.is_dir()]
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            keys = [member.name for member in archive.getmembers() if member.isfile()]
+    else:
+        raise ValueError(f"{source} não é um diretório nem um arquivo zip ou tar")
+    return sorted(key.replace(os.sep, "/") for key in keys if _is_image(key))
+
+
+def read_manifest(manifest: str) -> Dict[str, dict]:
+    """Read a CSV manifest with a foto column (key of the photo) and optional
+    nome, latitude, longitude and data (YYYY-MM-DD) columns.
+
+    Args:
+        manifest (str): Path of the CSV file.
+
+    Returns:
+        Dict[str, dict]: The non-empty values of each row, by photo key.
+    """
+    with open(manifest, encoding="utf-8-sig", newline="") as file:
+        return {
+            row["foto"]: {column: value for column, value in row.items() if value}
+            for row in csv.DictReader(file)
+        }
+
+
+def list_items(source: str, manifest: Union[str, None] = None) -> Iterator[ImportItem]:
+    """The photos of a source, labelled by their folder or by the manifest."""
+    overrides = read_manifest(manifest) if manifest else {}
+    for key in source_keys(source):
+        row = overrides.get(key, {})
+        yield ImportItem(
+            key,
+            row.get("nome", _label(key)),
+            row.get("latitude"),
+            row.get("longitude"),
+            row.get("data")
+        )
+
+
+# Archives already opened by this process, so members are read without
+# listing the archive again, until close_archive
+_archives = {}
+
+
+def read_photo(source: str, key: str) -> bytes:
+    """Bytes of a photo of a directory, zip or tar archive."""
+    if path.isdir(source):
+        with open(path.join(source, key), "rb") as file:
+            return file.read()
+    archive = _archives.get(source)
+    if archive is None:
+        archive = zipfile.ZipFile(source) if zipfile.is_zipfile(source) else tarfile.open(source)
+        _archives[source] = archive
+    if isinstance(archive, zipfile.ZipFile):
+        return archive.read(key)
+    return archive.extractfile(key).read()
+
+
+def close_archive(source: str) -> None:
+    """Close an archive opened by read_photo, once its import is over."""
+    archive = _archives.pop(source, None)
+    if archive is not None:
+        archive.close()
+
+
+def photo_metadata(data: bytes) -> tuple:
+    """Latitude, longitude and date (YYYY-MM-DD) from the EXIF of a photo.
+
+    Args:
+        data (bytes): The photo.
+
+    Returns:
+        tuple: The three values as strings, each None when missing.
+    """
+    latitude = longitude = date = None
+    try:
+        exif = Image.open(io.BytesIO(data)).getexif()
+    except Exception:
+        return latitude, longitude, date
+
+    gps = exif.get_ifd(GPS_IFD)
+    try:
+        latitude = str(coordinates_extractor([float(v) for v in gps[2]], gps[1]))
+        longitude = str(coordinates_extractor([float(v) for v in gps[4]], gps[3]))
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        latitude = longitude = None
+
+    taken = exif.get_ifd(EXIF_IFD).get(DATE_TIME_ORIGINAL) or exif.get(DATE_TIME)
+    if isinstance(taken, str):
+        # "2022:07:29 11:59:34"
+        date = taken[:10].replace(":", "-")
+        if verify_date(date):
+            date = None
+    return latitude, longitude, date
+
+
+def extract_photo(
+    source: str,
+    item: ImportItem,
+    features: Callable,
+    signature: Union[Callable, None] = None,
+    defaults: Union[dict, None] = None
+) -> ExtractedPhoto:
+    """Metadata, normalized images and head features of an item. Runs in
+    the extraction workers.
+
+    Args:
+        source (str): Path of the directory or archive.
+        item (ImportItem): The photo.
+        features (Callable): Head descriptor of a matching image.
+        signature (Callable, optional): Perceptual hash of a matching image.
+        Defaults to None.
+        defaults (dict, optional): latitude, longitude and data for photos
+        that carry none. Defaults to None.
+
+    Returns:
+        ExtractedPhoto: The extracted photo, or the reason it is skipped.
+    """
+    defaults = defaults or {}
+    data = read_photo(source, item.key)
+    latitude, longitude, date = photo_metadata(data)
+    # The manifest wins over the EXIF, which wins over the defaults
+    latitude = item.latitude or latitude or defaults.get("latitude")
+    longitude = item.longitude or longitude or defaults.get("longitude")
+    date = item.data or date or defaults.get("data")
+    if latitude is None or longitude is None:
+        return ExtractedPhoto(item, "sem coordenadas")
+    if date is None or verify_date(date):
+        return ExtractedPhoto(item, "sem data")
+
+    try:
+        ingested = ingest_image(data)
+    except ValueError:
+        return ExtractedPhoto(item, "imagem inválida")
+    return ExtractedPhoto(
+        item,
+        None,
+        latitude,
+        longitude,
+        date,
+        ingested.matching,
+        ingested.thumbnail,
+        features(ingested.matching),
+        signature(ingested.matching) if signature is not None else None
+    )
+
+
+def extract_batches(
+    source: str,
+    items: Iterator[ImportItem],
+    batch_size: int,
+    workers: int,
+    **kwargs
+) -> Iterator[List[ExtractedPhoto]]:
+    """Extract the items in batches on a process pool.
+
+    The next batch is already being extracted while the caller handles the
+    current one, and at most two batches are in memory.
+
+    Args:
+        source (str): Path of the directory or archive.
+        items (Iterator[ImportItem]): The photos to extract.
+        batch_size (int): Photos per batch.
+        workers (int): Extraction processes; 0 extracts in this process.
+        **kwargs: features, signature and defaults for extract_photo.
+
+    Yields:
+        List[ExtractedPhoto]: The extracted photos, in the order of items.
+    """
+    def batches():
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    if workers <= 0:
+        for batch in batches():
+            yield [extract_photo(source, item, **kwargs) for item in batch]
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = None
+        for batch in batches():
+            futures = [executor.submit(extract_photo, source, item, **kwargs) for item in batch]
+            if pending is not None:
+                yield [future.result() for future in pending]
+            pending = futures
+        if pending is not None:
+            yield [future.result() for future in pending]
+
+
+class ResumeLog:
+    """Keys of the photos already imported, one per line, so an interrupted
+    import skips them when run again.
+
+    Args:
+        path (str | None): The log file. None keeps no log.
+    """
+
+    def __init__(self, path: Union[str, None]):
+        self.path = path
+        self.done: Set[str] = set()
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.done = {line.rstrip("\n") for line in file if line.strip()}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.done
+
+    def record(self, keys: List[str]) -> None:
+        """Append the keys of a committed batch."""
+        self.done.update(keys)
+        if self.path is None or not keys:
+            return
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write("".join(f"{key}\n" for key in keys))
+            file.flush()
+            os.fsync(file.fileno())
@@ -0,0 +1,143 @@
+"""
+This module implements the geographic helpers behind the spatial queries:
+geohash encoding, bounding boxes and great-circle distances.
+"""
+import math
+from typing import List, Tuple
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.sql.elements import ColumnElement
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Precision of the geohash stored for each encounter (about 5 m)
+GEOHASH_PRECISION = 9
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points.
+
+    Returns:
+        float: The distance in kilometres.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Encode a coordinate as a geohash.
+
+    Same algorithm as the geohash_encode SQL function of the migrations.
+
+    Args:
+        latitude (float): The latitude.
+        longitude (float): The longitude.
+        precision (int, optional): Number of characters. Defaults to GEOHASH_PRECISION.
+
+    Returns:
+        str: The geohash.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    char, bits, even = 0, 0, True
+    while len(geohash) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        if value >= mid:
+            char = char * 2 + 1
+            interval[0] = mid
+        else:
+            char = char * 2
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            geohash.append(BASE32[char])
+            char, bits = 0, 0
+    return "".join(geohash)
+
+
+def split_bbox(south: float, west: float, north: float, east: float) -> List[Tuple[float, float, float, float]]:
+    """Split a bounding box crossing the antimeridian (west > east) in two."""
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+
+def bbox_filter(
+    longitude: ColumnElement,
+    latitude: ColumnElement,
+    bbox: Tuple[float, float, float, float],
+    dialect: str = "postgresql"
+) -> ColumnElement:
+    """Condition for a point column pair to lie inside a bounding box.
+
+    On PostgreSQL the test is point(longitude, latitude) <@ box, answered by
+    the GiST index of 0003_encontro_coordenadas. Other databases, such as
+    the SQLite used by quick local runs, compare the columns with BETWEEN.
+
+    Args:
+        longitude (ColumnElement): The longitude column.
+        latitude (ColumnElement): The latitude column.
+        bbox (Tuple[float, float, float, float]): (south, west, north, east),
+            with west > east when it crosses the antimeridian.
+        dialect (str, optional): The SQLAlchemy dialect name. Defaults to "postgresql".
+
+    Returns:
+        ColumnElement: The condition.
+    """
+    if dialect == "postgresql":
+        point = func.point(longitude, latitude)
+        return or_(*[
+            point.op("<@")(func.box(func.point(west, south), func.point(east, north)))
+            for south, west, north, east in split_bbox(*bbox)
+        ])
+    return or_(*[
+        and_(latitude.between(south, north), longitude.between(west, east))
+        for south, west, north, east in split_bbox(*bbox)
+    ])
+
+
+def radius_bbox(latitude: float, longitude: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """Bounding box (south, west, north, east) enclosing a circle.
+
+    Args:
+        latitude (float): Center latitude.
+        longitude (float): Center longitude.
+        radius_km (float): Radius in kilometres.
+
+    Returns:
+        Tuple[float, float, float, float]: The bounding box.
+    """
+    # Same sphere as haversine_km, so every point within radius_km is inside
+    angle = radius_km / EARTH_RADIUS_KM
+    dlat = math.degrees(angle)
+    south, north = max(latitude - dlat, -90.0), min(latitude + dlat, 90.0)
+    if south == -90.0 or north == 90.0:
+        return south, -180.0, north, 180.0
+
+    # Widest longitude of the circle, reached north or south of the center
+    ratio = math.sin(angle) / math.cos(math.radians(latitude))
+    if ratio >= 1:
+        return south, -180.0, north, 180.0
+    dlon = math.degrees(math.asin(ratio))
+    west = (longitude - dlon + 540) % 360 - 180
+    east = (longitude + dlon + 540) % 360 - 180
+    return south, west, north, east
+
+
+def zoom_precision(zoom: int) -> int:
+    """Geohash precision used to cluster encounters at a map zoom level.
+
+    Args:
+        zoom (int): The web map zoom level (0 shows the whole world).
+
+    Returns:
+        int: The precision, between 1 and 8.
+    """
+    return max(1, min(8, (zoom + 1) // 2))
@@ -0,0 +1,264 @@
+"""
+This module implements reverse geocoding of encounter coordinates, with an
+in-memory cache, a persistent cache table and pluggable providers.
+"""
+import csv
+import datetime as dt
+import math
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, List, Tuple, Union
+
+import sqlalchemy as sql
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from helpers.geo import haversine_km
+
+UNDEFINED = ("indefinido", "indefinido")
+
+BIGDATACLOUD_URL = "https://api.bigdatacloud.net/data/reverse-geocode-client"
+
+# Persistent cache of resolved (rounded) coordinates
+geocoding_metadata = sql.MetaData()
+geocodificacao = sql.Table(
+    "geocodificacao",
+    geocoding_metadata,
+    sql.Column("latitude", sql.Float, primary_key=True),
+    sql.Column("longitude", sql.Float, primary_key=True),
+    sql.Column("cidade", sql.String, nullable=False),
+    sql.Column("estado", sql.String, nullable=False),
+    sql.Column("criado_em", sql.DateTime, nullable=False),
+)
+
+
+class HttpGeocoder:
+    """Reverse geocoding through the bigdatacloud client API.
+
+    Args:
+        timeout (float, optional): Request timeout in seconds. Defaults to 3.
+        url (str, optional): The API endpoint. Defaults to BIGDATACLOUD_URL.
+    """
+
+    def __init__(self, timeout: float = 3, url: str = BIGDATACLOUD_URL):
+        self.url = url
+        self.timeout = timeout
+        self._session = None
+
+    @property
+    def session(self):
+        # requests is imported on the first lookup, not at server startup.
+        # The session reuses the connection between submissions
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def __call__(self, latitude: float, longitude: float) -> Union[Tuple[str, str], None]:
+        try:
+            response = self.session.get(
+                self.url,
+                params={"latitude": latitude, "longitude": longitude},
+                timeout=self.timeout
+            )
+            administrative = response.json()["localityInfo"]["administrative"]
+        except Exception:
+            return None
+
+        estado = cidade = None
+        for adm in administrative:
+            if adm.get("adminLevel") == 4:
+                estado = adm["name"]
+            if adm.get("adminLevel") == 8:
+                cidade = adm["name"]
+        if estado is None or cidade is None:
+            return None
+        return cidade, estado
+
+
+class CentroidGeocoder:
+    """Offline reverse geocoding to the nearest city centroid.
+
+    The centroids are bucketed in a regular latitude/longitude grid, so a
+    lookup only measures the distance to the cities in the neighbouring cells.
+
+    Args:
+        centroids (List[tuple]): (cidade, estado, latitude, longitude) rows.
+        max_km (float, optional): Largest accepted distance. Defaults to 30.
+        cell (float, optional): Grid cell size in degrees. Defaults to 0.5.
+    """
+
+    def __init__(self, centroids: List[tuple], max_km: float = 30, cell: float = 0.5):
+        self.max_km = max_km
+        self.cell = cell
+        self.grid = {}
+        for cidade, estado, latitude, longitude in centroids:
+            self.grid.setdefault(self._cell(latitude, longitude), []).append(
+                (cidade, estado, float(latitude), float(longitude))
+            )
+
+    @classmethod
+    def from_csv(cls, path: str, **kwargs) -> "CentroidGeocoder":
+        """Load centroids from a CSV with cidade, estado, latitude and longitude columns.
+
+        Args:
+            path (str): Path to the CSV file.
+
+        Returns:
+            CentroidGeocoder: The offline resolver.
+        """
+        with open(path, newline="", encoding="utf-8") as file:
+            return cls([
+                (row["cidade"], row["estado"], float(row["latitude"]), float(row["longitude"]))
+                for row in csv.DictReader(file)
+            ], **kwargs)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return math.floor(float(latitude) / self.cell), math.floor(float(longitude) / self.cell)
+
+    def __call__(self, latitude: float, longitude: float) -> Union[Tuple[str, str], None]:
+        # Cells to search on each side, enough to cover max_km
+        reach = int(math.ceil(self.max_km / (111.0 * self.cell * max(
+            math.cos(math.radians(latitude)), 0.01
+        ))))
+        row, column = self._cell(latitude, longitude)
+
+        best, best_km = None, self.max_km
+        for i in range(row - reach, row + reach + 1):
+            for j in range(column - reach, column + reach + 1):
+                for cidade, estado, lat, lon in self.grid.get((i, j), ()):
+                    distance = haversine_km(latitude, longitude, lat, lon)
+                    if distance <= best_km:
+                        best, best_km = (cidade, estado), distance
+        return best
+
+
+class Geocoder:
+    """Resolve coordinates to (cidade, estado) through caches and providers.
+
+    Coordinates are rounded before lookup, so encounters a few metres apart
+    share the same entry. The lookup order is the in-memory LRU cache, the
+    persistent table and then each provider in turn.
+
+    Args:
+        providers (List[Callable]): Functions (latitude, longitude) -> (cidade, estado) | None.
+        database (Engine, optional): Engine for the persistent cache. Defaults to None.
+        precision (int, optional): Decimal places kept from coordinates. Defaults to 3.
+        max_entries (int, optional): In-memory cache size. Defaults to 10000.
+        ttl (float, optional): Seconds an entry stays valid. Defaults to 30 days.
+    """
+
+    def __init__(
+        self,
+        providers: List[Callable],
+        database: Union[Engine, None] = None,
+        precision: int = 3,
+        max_entries: int = 10000,
+        ttl: float = 30 * 24 * 3600
+    ):
+        self.providers = providers
+        self.database = database
+        self.precision = precision
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = Lock()
+        self._cache = OrderedDict()
+
+    def _get_cached(self, key: Tuple[float, float]) -> Union[Tuple[str, str], None]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return entry[0]
+
+    def _set_cached(self, key: Tuple[float, float], value: Tuple[str, str]) -> None:
+        with self._lock:
+            self._cache[key] = (value, time.time() + self.ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _get_stored(self, key: Tuple[float, float]) -> Union[Tuple[str, str], None]:
+        if self.database is None:
+            return None
+        oldest = dt.datetime.now() - dt.timedelta(seconds=self.ttl)
+        try:
+            with self.database.connect() as conn:
+                row = conn.execute(
+                    sql.select([geocodificacao.c.cidade, geocodificacao.c.estado]).where(
+                        geocodificacao.c.latitude == key[0],
+                        geocodificacao.c.longitude == key[1],
+                        geocodificacao.c.criado_em >= oldest
+                    )
+                ).first()
+        except SQLAlchemyError:
+            # Without the cache table (migration 0001) every lookup is a miss
+            return None
+        return None if row is None else (row.cidade, row.estado)
+
+    def _store(self, key: Tuple[float, float], value: Tuple[str, str]) -> None:
+        if self.database is None:
+            return
+        dialect = postgresql if self.database.dialect.name == "postgresql" else sqlite
+        statement = dialect.insert(geocodificacao).values(
+            latitude=key[0],
+            longitude=key[1],
+            cidade=value[0],
+            estado=value[1],
+            criado_em=dt.datetime.now()
+        )
+        # Concurrent misses on the same coordinate both store it
+        statement = statement.on_conflict_do_update(
+            index_elements=[geocodificacao.c.latitude, geocodificacao.c.longitude],
+            set_={
+                "cidade": statement.excluded.cidade,
+                "estado": statement.excluded.estado,
+                "criado_em": statement.excluded.criado_em,
+            }
+        )
+        try:
+            with self.database.begin() as conn:
+                conn.execute(statement)
+        except SQLAlchemyError:
+            # The value is still cached in memory, and a failed cache write
+            # must not fail the submission that asked for it
+            pass
+
+    def resolve(self, latitude, longitude) -> Tuple[str, str]:
+        """Return the (cidade, estado) of a coordinate.
+
+        Args:
+            latitude: The latitude, as a number or numeric string.
+            longitude: The longitude, as a number or numeric string.
+
+        Returns:
+            Tuple[str, str]: City and state, or ("indefinido", "indefinido").
+        """
+        try:
+            key = (round(float(latitude), self.precision), round(float(longitude), self.precision))
+        except (TypeError, ValueError):
+            return UNDEFINED
+
+        value = self._get_cached(key)
+        if value is not None:
+            return value
+
+        value = self._get_stored(key)
+        if value is None:
+            for provider in self.providers:
+                value = provider(*key)
+                if value is not None:
+                    self._store(key, value)
+                    break
+        if value is None:
+            # Not cached, so a provider that is down gets retried next time
+            return UNDEFINED
+
+        self._set_cached(key, value)
+        return value
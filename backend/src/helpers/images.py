@@ -0,0 +1,197 @@
+"""
+This module implements helpers to handle the stored encounter and turtle images.
+"""
+import io
+import os
+import re
+from base64 import b64decode
+from hashlib import sha256
+from os import getenv, path
+from typing import NamedTuple, Union
+
+from PIL import Image, ImageOps, features
+
+# Longest side of the head image used for recognition
+MATCHING_SIZE = int(getenv("MATCHING_SIZE", "800"))
+MATCHING_QUALITY = 90
+
+# Longest side and encoding of the thumbnails served to listings
+THUMBNAIL_SIZE = int(getenv("THUMBNAIL_SIZE", "320"))
+THUMBNAIL_QUALITY = int(getenv("THUMBNAIL_QUALITY", "75"))
+THUMBNAIL_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+
+# Directory of the content-addressed image store; unset keeps images in the database
+IMAGE_STORE_PATH = getenv("IMAGE_STORE_PATH") or None
+
+# Column value pointing to a file of the image store
+REFERENCE_PREFIX = b"sha256:"
+
+BASE64_PREFIX = re.compile(rb"[A-Za-z0-9+/=]+")
+
+# Leading bytes of the image formats the app receives
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+)
+
+
+def image_mimetype(data: bytes) -> str:
+    """Guess the MIME type of raw image bytes.
+
+    Args:
+        data (bytes): The image bytes.
+
+    Returns:
+        str: The MIME type, or application/octet-stream if unknown.
+    """
+    for signature, mimetype in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mimetype
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def stored_image_bytes(value: Union[bytes, memoryview]) -> bytes:
+    """Return the raw image bytes of a bytea value stored in the database.
+
+    Rows written before raw storage hold base64 text, which is told apart
+    by its first bytes, the same test the 0006 migration uses to convert them.
+
+    Args:
+        value (bytes | memoryview): The column value, raw or base64.
+
+    Returns:
+        bytes: The image.
+    """
+    value = bytes(value)
+    if value and BASE64_PREFIX.fullmatch(value[:64]):
+        return b64decode(value)
+    return value
+
+
+class ImageStore:
+    """Maps image bytes to the values kept in the image columns.
+
+    Without a path, the columns hold the raw bytes. With a path, each image
+    is written once to a file named by its SHA-256, so identical images
+    (such as a new turtle's head and its first encounter) share one file,
+    and the columns hold a short sha256:<hex> reference.
+
+    Args:
+        path (str | None, optional): The store directory. Defaults to IMAGE_STORE_PATH.
+    """
+
+    def __init__(self, path: Union[str, None] = IMAGE_STORE_PATH):
+        self.path = path
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def _file(self, digest: str) -> str:
+        # Two-level fan-out keeps directories small
+        return path.join(self.path, digest[:2], digest)
+
+    def put(self, data: bytes) -> bytes:
+        """Store an image.
+
+        Args:
+            data (bytes): The raw image.
+
+        Returns:
+            bytes: The value to save in the image column.
+        """
+        if self.path is None:
+            return data
+        digest = sha256(data).hexdigest()
+        file = self._file(digest)
+        if not path.exists(file):
+            os.makedirs(path.dirname(file), exist_ok=True)
+            temporary = f"{file}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as output:
+                output.write(data)
+            # Atomic, so concurrent writers of the same image never see a partial file
+            os.replace(temporary, file)
+        return REFERENCE_PREFIX + digest.encode()
+
+    def get(self, value: Union[bytes, memoryview]) -> bytes:
+        """Read an image from its column value.
+
+        Args:
+            value (bytes | memoryview): A reference, raw bytes or legacy base64.
+
+        Returns:
+            bytes: The raw image.
+        """
+        value = bytes(value)
+        if value.startswith(REFERENCE_PREFIX):
+            if self.path is None:
+                raise RuntimeError("IMAGE_STORE_PATH is required to read stored image files")
+            with open(self._file(value[len(REFERENCE_PREFIX):].decode()), "rb") as file:
+                return file.read()
+        return stored_image_bytes(value)
+
+
+class IngestedImage(NamedTuple):
+    """The images derived from one uploaded photo."""
+
+    matching: Union[bytes, None]
+    thumbnail: bytes
+
+
+def _encode(image: Image.Image, format: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format, quality=quality)
+    return buffer.getvalue()
+
+
+def _fit(image: Image.Image, size: int) -> Image.Image:
+    if max(image.size) <= size:
+        return image
+    image = image.copy()
+    image.thumbnail((size, size), Image.LANCZOS)
+    return image
+
+
+def ingest_image(
+    data: bytes,
+    matching_size: int = MATCHING_SIZE,
+    thumbnail_size: int = THUMBNAIL_SIZE,
+    with_matching: bool = True
+) -> IngestedImage:
+    """Decode an uploaded photo once and derive its normalized versions.
+
+    JPEGs are decoded straight at a reduced scale (draft mode), since no
+    output needs more than matching_size pixels. The EXIF orientation is
+    applied, so every derived image is upright and without metadata.
+
+    Args:
+        data (bytes): The raw uploaded image.
+        matching_size (int, optional): Longest side of the recognition image.
+        Defaults to MATCHING_SIZE.
+        thumbnail_size (int, optional): Longest side of the thumbnail.
+        Defaults to THUMBNAIL_SIZE.
+        with_matching (bool, optional): Also encode the recognition image.
+        Defaults to True.
+
+    Raises:
+        ValueError: If the data is not a readable image.
+
+    Returns:
+        IngestedImage: The recognition image (JPEG, or None) and the thumbnail.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        # Rotated photos have their width and height swapped, hence the square box
+        image.draft("RGB", (matching_size, matching_size))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    except (OSError, SyntaxError, Image.DecompressionBombError) as error:
+        raise ValueError("Imagem inválida") from error
+
+    matching = _fit(image, matching_size)
+    thumbnail = _fit(matching, thumbnail_size)
+    return IngestedImage(
+        matching=_encode(matching, "JPEG", MATCHING_QUALITY) if with_matching else None,
+        thumbnail=_encode(thumbnail, THUMBNAIL_FORMAT, THUMBNAIL_QUALITY)
+    )
+
@@ -0,0 +1,54 @@
+"""
+This module implements SQL statement instrumentation through SQLAlchemy events.
+"""
+from contextlib import contextmanager
+from threading import Lock
+from typing import Iterator, List
+
+from sqlalchemy import event
+from sqlalchemy.engine.base import Engine
+
+
+class QueryCounter:
+    """Counts the statements executed on an engine while attached.
+
+    Args:
+        engine (Engine): The connection engine to the database.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.count = 0
+        self.statements: List[str] = []
+        self._lock = Lock()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.count += 1
+            self.statements.append(statement)
+
+    def attach(self) -> None:
+        """Start counting statements."""
+        event.listen(self.engine, "before_cursor_execute", self._before_cursor_execute)
+
+    def detach(self) -> None:
+        """Stop counting statements."""
+        event.remove(self.engine, "before_cursor_execute", self._before_cursor_execute)
+
+
+@contextmanager
+def count_queries(engine: Engine) -> Iterator[QueryCounter]:
+    """Count the statements executed on an engine inside a with block.
+
+    Args:
+        engine (Engine): The connection engine to the database.
+
+    Yields:
+        QueryCounter: The counter, whose count is final when the block exits.
+    """
+    counter = QueryCounter(engine)
+    counter.attach()
+    try:
+        yield counter
+    finally:
+        counter.detach()
@@ -0,0 +1,125 @@
+"""
+This module implements a store for background jobs, run on a thread pool
+and tracked in a table shared by every server process.
+"""
+import datetime as dt
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Union
+
+import sqlalchemy as sql
+from sqlalchemy.engine.base import Engine
+
+# State of the background jobs of every process
+jobs_metadata = sql.MetaData()
+trabalho = sql.Table(
+    "trabalho",
+    jobs_metadata,
+    sql.Column("identificador", sql.String, primary_key=True),
+    sql.Column("situacao", sql.String, nullable=False),
+    sql.Column("codigo", sql.Integer),
+    sql.Column("resultado", sql.JSON),
+    sql.Column("erro", sql.Text),
+    sql.Column("criado_em", sql.DateTime, nullable=False),
+    sql.Column("concluido_em", sql.DateTime),
+)
+
+PENDING = ("queued", "running")
+
+
+class JobStore:
+    """Runs jobs on a thread pool and keeps their outcome for polling.
+
+    A job runs in the process that accepted it, while its state is kept in
+    the trabalho table (migration 0008), so any process of the server can
+    answer a poll. Jobs are dropped ttl seconds after they finish, or after
+    they were created when their process stopped before finishing them.
+
+    Args:
+        workers (int): Number of threads running jobs.
+        database (Engine): The connection engine to the database.
+        ttl (float, optional): Seconds a finished job is kept. Defaults to 3600.
+    """
+
+    def __init__(self, workers: int, database: Engine, ttl: float = 3600):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.database = database
+        self.ttl = ttl
+
+    def _oldest(self) -> dt.datetime:
+        return dt.datetime.now() - dt.timedelta(seconds=self.ttl)
+
+    def _set(self, job_id: str, **fields) -> None:
+        with self.database.begin() as conn:
+            conn.execute(
+                trabalho.update().where(trabalho.c.identificador == job_id).values(**fields)
+            )
+
+    def _run(self, job_id: str, function: Callable, args: tuple) -> None:
+        self._set(job_id, situacao="running")
+        try:
+            result, code = function(*args)
+            self._set(
+                job_id, situacao="done", resultado=result, codigo=code,
+                concluido_em=dt.datetime.now()
+            )
+        except Exception as error:
+            self._set(job_id, situacao="failed", erro=repr(error), concluido_em=dt.datetime.now())
+
+    def _expire(self) -> None:
+        with self.database.begin() as conn:
+            conn.execute(trabalho.delete().where(
+                sql.func.coalesce(trabalho.c.concluido_em, trabalho.c.criado_em) < self._oldest()
+            ))
+
+    def submit(self, function: Callable, *args) -> str:
+        """Queue a job returning a (body, status code) pair.
+
+        Args:
+            function (Callable): The job function.
+
+        Returns:
+            str: The job ID.
+        """
+        self._expire()
+        job_id = uuid.uuid4().hex
+        with self.database.begin() as conn:
+            conn.execute(trabalho.insert().values(
+                identificador=job_id, situacao="queued", criado_em=dt.datetime.now()
+            ))
+        self.executor.submit(self._run, job_id, function, args)
+        return job_id
+
+    def get(self, job_id: str) -> Union[dict, None]:
+        """Return a job state, or None if it is unknown or expired.
+
+        Args:
+            job_id (str): The job ID.
+
+        Returns:
+            dict | None: The job state.
+        """
+        with self.database.connect() as conn:
+            job = conn.execute(
+                sql.select([trabalho]).where(trabalho.c.identificador == job_id)
+            ).first()
+        if job is None:
+            return None
+        state = {"status": job.situacao, "created": job.criado_em.timestamp()}
+        if job.concluido_em is not None:
+            state["finished"] = job.concluido_em.timestamp()
+        if job.situacao == "done":
+            state.update(result=job.resultado, code=job.codigo)
+        elif job.situacao == "failed":
+            state["error"] = job.erro
+        return state
+
+    def pending(self) -> int:
+        """Return the number of queued or running jobs of every process."""
+        with self.database.connect() as conn:
+            return conn.execute(
+                sql.select([sql.func.count()]).select_from(trabalho).where(
+                    trabalho.c.situacao.in_(PENDING),
+                    trabalho.c.criado_em >= self._oldest()
+                )
+            ).scalar()
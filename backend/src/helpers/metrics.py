@@ -0,0 +1,408 @@
+"""
+This module implements request, stage and SQL timings, kept as histograms
+and exported in the Prometheus text format.
+"""
+import atexit
+import json
+import os
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock, Thread
+from typing import Dict, Iterator, List, Sequence, Tuple, Union
+
+from flask import Flask, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine.base import Engine
+
+# Seconds, from a cache hit to a slow recognition
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30
+)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+SQL_OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+POOL_GAUGES = {
+    "db_pool_size": "Connections the pool keeps open.",
+    "db_pool_checked_out": "Connections in use.",
+    "db_pool_overflow": "Connections open beyond the pool size.",
+}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _endpoint() -> str:
+    """URL rule of the current request, to label its metrics."""
+    if not has_request_context():
+        # Background jobs and startup
+        return "none"
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Histogram:
+    """A Prometheus histogram with labels.
+
+    Args:
+        name (str): The metric name.
+        documentation (str): The HELP text.
+        labels (Sequence[str], optional): Label names. Defaults to none.
+        buckets (Sequence[float], optional): Upper bounds. Defaults to DURATION_BUCKETS.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = Lock()
+        # Label values -> observations per bucket (the last one is +Inf), sum
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[position] += 1
+            series[-1] += value
+
+    def snapshot(self) -> Dict[tuple, list]:
+        """A copy of the observations of every label combination."""
+        with self._lock:
+            return {labels: list(values) for labels, values in self._series.items()}
+
+    def reset(self) -> None:
+        """Forget every observation, in a forked process."""
+        # The lock may have been held by another thread of the parent
+        self._lock = Lock()
+        self._series = {}
+
+    def render(self, series: Union[Dict[tuple, list], None] = None) -> List[str]:
+        """Lines of the histogram in the Prometheus text format.
+
+        Args:
+            series (Dict[tuple, list], optional): Observations to render
+            instead of the ones of this process. Defaults to None.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        if series is None:
+            series = self.snapshot()
+        for label_values, values in sorted(series.items()):
+            labels = ",".join(
+                f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values)
+            )
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                le = bound if bound == "+Inf" else _number(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {_number(values[-1])}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class RequestTimings:
+    """Stage and SQL time spent by one request, for the Server-Timing header."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.statements = 0
+        self.sql_seconds = 0.0
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def header(self, total: float) -> str:
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        entries.append(f'sql;dur={self.sql_seconds * 1000:.1f};desc="{self.statements} statements"')
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+class Metrics:
+    """Timings of requests, of the stages inside them and of SQL statements.
+
+    Each process keeps its own histograms. With a directory, every process
+    also writes them to a file of its own there, every interval seconds, and
+    a scrape of /metrics adds up the files, so several gunicorn workers report
+    the whole server whichever of them answers. The files of stopped workers
+    keep counting, so the totals never go down while the server runs, while
+    the pool gauges are summed over the running processes only.
+
+    Args:
+        server_timing (bool, optional): Add a Server-Timing header with the
+        stages of each request. Defaults to False.
+        directory (str, optional): Directory shared by the processes of the
+        server. Defaults to None, for metrics of this process only.
+        interval (float, optional): Seconds between writes of the file of
+        this process. Defaults to 1.
+    """
+
+    def __init__(
+        self,
+        server_timing: bool = False,
+        directory: Union[str, None] = None,
+        interval: float = 1
+    ):
+        self.server_timing = server_timing
+        self.requests = Histogram(
+            "http_request_duration_seconds",
+            "Time to produce a response, up to the first byte of streamed ones.",
+            ("method", "endpoint", "status")
+        )
+        self.stages = Histogram(
+            "stage_duration_seconds",
+            "Time spent in each stage of the submission and listing paths.",
+            ("endpoint", "stage")
+        )
+        self.statements = Histogram(
+            "sql_statement_duration_seconds",
+            "Time to execute each SQL statement.",
+            ("operation",)
+        )
+        self.request_statements = Histogram(
+            "http_request_sql_statements",
+            "SQL statements executed per request.",
+            ("endpoint",),
+            STATEMENT_BUCKETS
+        )
+        self._current: ContextVar = ContextVar("request_timings", default=None)
+        self._pool = None
+        self._serving = False
+
+        self.directory = directory
+        self.interval = interval
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._start_process()
+            # A preloading server forks its workers after this
+            os.register_at_fork(after_in_child=self._after_fork)
+            # A recycled worker writes what it observed since the last write
+            atexit.register(self.flush)
+
+    def _histograms(self) -> Tuple[Histogram, ...]:
+        return (self.requests, self.stages, self.statements, self.request_statements)
+
+    def _start_process(self) -> None:
+        # A new name per process, so a recycled pid never replaces the file
+        # of a stopped worker
+        self._file = os.path.join(
+            self.directory, f"metrics-{os.getpid()}-{uuid.uuid4().hex}.json"
+        )
+        self._flush_lock = Lock()
+        Thread(target=self._flush_loop, daemon=True).start()
+
+    def _after_fork(self) -> None:
+        # The parent keeps reporting what it observed before the fork
+        for histogram in self._histograms():
+            histogram.reset()
+        self._start_process()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the histograms and gauges of this process to its file."""
+        if self.directory is None:
+            return
+        state = {
+            "pid": os.getpid(),
+            "histograms": {
+                histogram.name: [
+                    [list(labels), values] for labels, values in histogram.snapshot().items()
+                ]
+                for histogram in self._histograms()
+            },
+            # Only the pools of the processes answering requests, not the
+            # one of a preloading master
+            "gauges": self.pool_gauges() if self._serving else {},
+        }
+        with self._flush_lock:
+            temporary = self._file + ".tmp"
+            with open(temporary, "w", encoding="utf-8") as file:
+                json.dump(state, file)
+            # Readers see the previous file or this one, never a partial one
+            os.replace(temporary, self._file)
+
+    def _collect(self) -> Tuple[Dict[str, Dict[tuple, list]], Dict[str, int]]:
+        """Histograms of every process that wrote to the directory, and
+        gauges of the running ones, added up."""
+        histograms = {histogram.name: {} for histogram in self._histograms()}
+        gauges = {}
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith("metrics-") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as file:
+                    state = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for histogram, rows in state["histograms"].items():
+                series = histograms.get(histogram)
+                if series is None:
+                    continue
+                for labels, values in rows:
+                    current = series.get(tuple(labels))
+                    series[tuple(labels)] = values if current is None else [
+                        total + value for total, value in zip(current, values)
+                    ]
+            if _alive(state["pid"]):
+                for gauge, value in state["gauges"].items():
+                    gauges[gauge] = gauges.get(gauge, 0) + value
+        return histograms, gauges
+
+    def _timings(self) -> Union[RequestTimings, None]:
+        return self._current.get()
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Time a stage, for its histogram and the current request.
+
+        Args:
+            stage (str): The stage name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages.observe(elapsed, _endpoint(), stage)
+            timings = self._timings()
+            if timings is not None:
+                timings.add(stage, elapsed)
+
+    def instrument_engine(self, engine: Engine) -> None:
+        """Time every statement executed on an engine, and export the state
+        of its connection pool.
+
+        Args:
+            engine (Engine): The connection engine to the database.
+        """
+        self._pool = engine.pool
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info["metrics_start"].pop()
+            words = statement.lstrip().split(None, 1)
+            operation = words[0].upper() if words else ""
+            self.statements.observe(elapsed, operation if operation in SQL_OPERATIONS else "OTHER")
+            timings = self._timings()
+            if timings is not None:
+                timings.statements += 1
+                timings.sql_seconds += elapsed
+
+        @event.listens_for(engine, "handle_error")
+        def handle_error(context):
+            starts = context.connection.info.get("metrics_start") if context.connection else None
+            if starts:
+                starts.pop()
+
+    def instrument_app(self, app: Flask) -> None:
+        """Time every request of a Flask app.
+
+        Args:
+            app (Flask): The app.
+        """
+        @app.before_request
+        def start_request():
+            self._serving = True
+            g.metrics_start = time.perf_counter()
+            g.metrics_token = self._current.set(RequestTimings())
+
+        @app.after_request
+        def finish_request(response):
+            timings = self._timings()
+            start = g.get("metrics_start")
+            if timings is None or start is None:
+                return response
+            elapsed = time.perf_counter() - start
+            endpoint = _endpoint()
+            self.requests.observe(elapsed, request.method, endpoint, str(response.status_code))
+            self.request_statements.observe(timings.statements, endpoint)
+            if self.server_timing:
+                response.headers["Server-Timing"] = timings.header(elapsed)
+            return response
+
+        @app.teardown_request
+        def end_request(error=None):
+            token = g.pop("metrics_token", None)
+            if token is None:
+                return
+            try:
+                self._current.reset(token)
+            except ValueError:
+                # Torn down from another context, e.g. after a streamed body
+                self._current.set(None)
+
+    def pool_gauges(self) -> Dict[str, int]:
+        """Gauges of the connection pool, read now."""
+        # Only queue pools count their connections
+        if not hasattr(self._pool, "checkedout"):
+            return {}
+        return {
+            "db_pool_size": self._pool.size(),
+            "db_pool_checked_out": self._pool.checkedout(),
+            # overflow() starts at -size and grows with every connection opened
+            "db_pool_overflow": max(self._pool.overflow(), 0),
+        }
+
+    def render_pool(self, gauges: Union[Dict[str, int], None] = None) -> List[str]:
+        """Gauges of the connection pool, read when scraped."""
+        if gauges is None:
+            gauges = self.pool_gauges()
+        lines = []
+        for name, value in gauges.items():
+            lines += [f"# HELP {name} {POOL_GAUGES[name]}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return lines
+
+    def render(self) -> str:
+        """All histograms and gauges in the Prometheus text format."""
+        lines = []
+        if self.directory is None:
+            for histogram in self._histograms():
+                lines += histogram.render()
+            lines += self.render_pool()
+        else:
+            self.flush()
+            histograms, gauges = self._collect()
+            for histogram in self._histograms():
+                lines += histogram.render(histograms[histogram.name])
+            lines += self.render_pool(gauges)
+        return "\n".join(lines) + "\n"
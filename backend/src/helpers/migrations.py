@@ -0,0 +1,98 @@
+"""
+This module implements a versioned schema migration runner.
+
+Migrations are the SQL files in backend/migrations, applied in file name
+order. Each one runs in its own transaction and is recorded in the
+schema_migrations table, so it is applied only once per database.
+"""
+from os import listdir, path
+from typing import List, Union
+
+import sqlalchemy as sql
+from sqlalchemy.engine.base import Engine
+
+MIGRATIONS_DIR = path.join(path.dirname(__file__), "..", "..", "migrations")
+
+# Arbitrary key for the advisory lock serializing concurrent runners
+MIGRATIONS_LOCK = 580_001
+
+
+def list_migrations(directory: str = MIGRATIONS_DIR) -> List[str]:
+    """List the migration versions available on disk.
+
+    Args:
+        directory (str, optional): The migrations directory. Defaults to MIGRATIONS_DIR.
+
+    Returns:
+        List[str]: The file names, in application order.
+    """
+    return sorted(name for name in listdir(directory) if name.endswith(".sql"))
+
+
+def applied_migrations(database: Engine, schema: Union[str, None] = None) -> List[str]:
+    """List the migration versions already applied to a database.
+
+    Args:
+        database (Engine): The connection engine to the database.
+        schema (str | None, optional): The schema to migrate. Defaults to None.
+
+    Returns:
+        List[str]: The applied versions.
+    """
+    with database.begin() as conn:
+        _prepare(conn, schema)
+        return [
+            row[0] for row in conn.execute(
+                sql.text("SELECT versao FROM schema_migrations ORDER BY versao")
+            )
+        ]
+
+
+def _prepare(conn, schema: Union[str, None]) -> None:
+    if schema is not None:
+        conn.execute(sql.text(f'SET LOCAL search_path TO "{schema}"'))
+    conn.execute(sql.text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations("
+        "versao varchar PRIMARY KEY, "
+        "aplicada_em timestamp NOT NULL DEFAULT now())"
+    ))
+
+
+def run_migrations(
+    database: Engine,
+    directory: str = MIGRATIONS_DIR,
+    schema: Union[str, None] = None
+) -> List[str]:
+    """Apply every pending migration.
+
+    Args:
+        database (Engine): The connection engine to the database.
+        directory (str, optional): The migrations directory. Defaults to MIGRATIONS_DIR.
+        schema (str | None, optional): The schema to migrate. Defaults to None.
+
+    Returns:
+        List[str]: The versions applied by this call.
+    """
+    applied = []
+    for version in list_migrations(directory):
+        with open(path.join(directory, version), encoding="utf-8") as file:
+            statements = file.read()
+
+        with database.begin() as conn:
+            _prepare(conn, schema)
+            # Other processes starting at the same time wait here
+            conn.execute(sql.text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATIONS_LOCK})
+            done = conn.execute(
+                sql.text("SELECT 1 FROM schema_migrations WHERE versao = :versao"),
+                {"versao": version}
+            ).first()
+            if done is not None:
+                continue
+            # Straight to the driver, so a % in the file is not a placeholder
+            conn.connection.cursor().execute(statements)
+            conn.execute(
+                sql.text("INSERT INTO schema_migrations (versao) VALUES (:versao)"),
+                {"versao": version}
+            )
+        applied.append(version)
+    return applied
@@ -0,0 +1,105 @@
+"""
+This module declares the database tables as classes, matching
+database/create_db.sql plus the migrations, so the server can map them
+without reflecting the live schema at startup.
+"""
+from types import SimpleNamespace
+from typing import List
+
+import sqlalchemy as sql
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.orm import declarative_base
+
+Base = declarative_base()
+
+
+class Tartaruga(Base):
+    __tablename__ = "tartaruga"
+
+    identificador = sql.Column(sql.Integer, primary_key=True)
+    nome = sql.Column(sql.String, nullable=False)
+    ultimo_encontro = sql.Column(sql.Date)
+    ultima_imagem_cabeca = sql.Column(sql.LargeBinary, nullable=False)
+    # 0005_imagens_normalizadas
+    cabeca_normalizada = sql.Column(sql.LargeBinary)
+
+
+class Encontro(Base):
+    __tablename__ = "encontro"
+
+    identificador = sql.Column(sql.Integer, primary_key=True)
+    latitude = sql.Column(sql.String, nullable=False)
+    longitude = sql.Column(sql.String, nullable=False)
+    cidade = sql.Column(sql.String, nullable=False)
+    estado = sql.Column(sql.String, nullable=False)
+    tartaruga_identificador = sql.Column(
+        sql.Integer,
+        sql.ForeignKey("tartaruga.identificador"),
+        nullable=False
+    )
+    imagem_corpo = sql.Column(sql.LargeBinary, nullable=False)
+    imagem_cabeca = sql.Column(sql.LargeBinary, nullable=False)
+    data = sql.Column(sql.Date, nullable=False)
+    # 0003_encontro_coordenadas
+    latitude_num = sql.Column(sql.Float)
+    longitude_num = sql.Column(sql.Float)
+    # 0004_encontro_geohash
+    geohash = sql.Column(sql.String(12))
+    # 0005_imagens_normalizadas
+    miniatura_corpo = sql.Column(sql.LargeBinary)
+    miniatura_cabeca = sql.Column(sql.LargeBinary)
+
+
+# 0007_estatisticas: summaries of encontro, kept up to date by triggers
+class EstatisticaLocal(Base):
+    __tablename__ = "estatistica_local"
+
+    estado = sql.Column(sql.String, primary_key=True)
+    cidade = sql.Column(sql.String, primary_key=True)
+    encontros = sql.Column(sql.BigInteger, nullable=False)
+
+
+class EstatisticaTartaruga(Base):
+    __tablename__ = "estatistica_tartaruga"
+
+    tartaruga_identificador = sql.Column(sql.Integer, primary_key=True)
+    encontros = sql.Column(sql.BigInteger, nullable=False)
+    primeiro_encontro = sql.Column(sql.Date)
+    ultimo_encontro = sql.Column(sql.Date)
+
+
+class EstatisticaMes(Base):
+    __tablename__ = "estatistica_mes"
+
+    mes = sql.Column(sql.Date, primary_key=True)
+    encontros = sql.Column(sql.BigInteger, nullable=False)
+
+
+# Same access path as an automap base: classes.tartaruga, classes.encontro
+classes = SimpleNamespace(
+    tartaruga=Tartaruga,
+    encontro=Encontro,
+    estatistica_local=EstatisticaLocal,
+    estatistica_tartaruga=EstatisticaTartaruga,
+    estatistica_mes=EstatisticaMes
+)
+
+
+def schema_differences(database: Engine) -> List[str]:
+    """Compare the declared tables with the live schema.
+
+    Args:
+        database (Engine): The connection engine to the database.
+
+    Returns:
+        List[str]: "table.column" of every column missing on either side, empty
+        when the declarations are up to date.
+    """
+    inspector = sql.inspect(database)
+    differences = []
+    for table in Base.metadata.sorted_tables:
+        live = {column["name"] for column in inspector.get_columns(table.name)}
+        declared = set(table.columns.keys())
+        differences += [f"{table.name}.{name} (not declared)" for name in sorted(live - declared)]
+        differences += [f"{table.name}.{name} (not in database)" for name in sorted(declared - live)]
+    return differences
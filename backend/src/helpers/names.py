@@ -0,0 +1,150 @@
+"""
+This module implements an in-memory directory of turtle names and IDs.
+"""
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+from threading import Lock
+from typing import Dict, List, Tuple, Union
+
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+
+
+def _fold(text: str) -> str:
+    # Case and accent insensitive form: "Álvaro" -> "alvaro"
+    return "".join(
+        char for char in unicodedata.normalize("NFKD", text.casefold())
+        if not unicodedata.combining(char)
+    )
+
+
+def _key(nome: str) -> Tuple[str, str]:
+    # Case and accent insensitive order, with the exact name breaking ties
+    return _fold(nome), nome
+
+
+class NameDirectory:
+    """Sorted turtle names with their IDs, for lookups and autocomplete.
+
+    The directory is loaded with a single two-column query, kept up to date
+    by add() in this process and reloaded after ttl seconds, so names
+    inserted by other processes show up too. A lookup that misses reloads
+    it at most once every min_refresh seconds.
+
+    Args:
+        database (Engine): The connection engine to the database.
+        id_column (InstrumentedAttribute): The turtle ID column.
+        name_column (InstrumentedAttribute): The turtle name column.
+        ttl (float, optional): Seconds before a full reload. Defaults to 60.
+        min_refresh (float, optional): Seconds between reloads caused by
+        misses. Defaults to 1.
+    """
+
+    def __init__(
+        self,
+        database: Engine,
+        id_column: InstrumentedAttribute,
+        name_column: InstrumentedAttribute,
+        ttl: float = 60,
+        min_refresh: float = 1
+    ):
+        self.database = database
+        self.id_column = id_column
+        self.name_column = name_column
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self._lock = Lock()
+        self._loaded_at = None
+        self._keys: List[Tuple[str, str]] = []
+        self._ids: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+
+    def _load(self) -> None:
+        with Session(self.database) as session:
+            rows = session.query(self.id_column, self.name_column).all()
+        keys = sorted(_key(nome) for _, nome in rows)
+        with self._lock:
+            self._keys = keys
+            self._ids = {nome: identificador for identificador, nome in rows}
+            self._names = {identificador: nome for identificador, nome in rows}
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self) -> None:
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            self._load()
+
+    def _reload_on_miss(self) -> bool:
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < self.min_refresh:
+            return False
+        self._load()
+        return True
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+
+    def add(self, identificador: int, nome: str) -> None:
+        """Register a turtle inserted by this process."""
+        with self._lock:
+            if self._loaded_at is None or nome in self._ids:
+                return
+            # Copy on write: readers bisect the old list without locking
+            keys = list(self._keys)
+            insort(keys, _key(nome))
+            self._keys = keys
+            self._ids[nome] = identificador
+            self._names[identificador] = nome
+
+    def id_of(self, nome: str) -> Union[int, None]:
+        """Return the ID of a turtle name, or None if there is no such turtle."""
+        self._ensure_loaded()
+        identificador = self._ids.get(nome)
+        if identificador is None and self._reload_on_miss():
+            identificador = self._ids.get(nome)
+        return identificador
+
+    def name_of(self, identificador: int) -> Union[str, None]:
+        """Return the name of a turtle ID, or None if there is no such turtle."""
+        self._ensure_loaded()
+        nome = self._names.get(identificador)
+        if nome is None and self._reload_on_miss():
+            nome = self._names.get(identificador)
+        return nome
+
+    def names(
+        self,
+        limit: int,
+        cursor: Union[str, None] = None,
+        prefix: Union[str, None] = None
+    ) -> Tuple[List[str], Union[str, None]]:
+        """One page of names in case and accent insensitive order.
+
+        Args:
+            limit (int): The page size.
+            cursor (str | None, optional): Last name of the previous page. Defaults to None.
+            prefix (str | None, optional): Only names starting with it, ignoring
+            case and accents. Defaults to None.
+
+        Returns:
+            Tuple[List[str], str | None]: The names and the cursor of the next
+            page, or None when this is the last page.
+        """
+        self._ensure_loaded()
+        keys = self._keys
+        start, end = 0, len(keys)
+        if prefix:
+            folded = _fold(prefix)
+            start = bisect_left(keys, (folded, ""))
+            # Every key starting with the prefix sorts before prefix + U+10FFFF
+            end = bisect_left(keys, (folded + "\U0010ffff", ""), start)
+        if cursor is not None:
+            start = max(start, bisect_right(keys, _key(cursor)))
+
+        page = [nome for _, nome in keys[start:min(start + limit, end)]]
+        if start + limit >= end:
+            return page, None
+        return page, page[-1]
@@ -0,0 +1,148 @@
+"""
+This module implements keyset pagination and row counting for list endpoints.
+"""
+import time
+from os import getenv
+from threading import Lock
+from typing import Any, Callable, List, Tuple, Union
+
+from sqlalchemy import func, text
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.orm import Query
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+
+MAX_PAGE_SIZE = int(getenv("MAX_PAGE_SIZE", "500"))
+
+
+def page_size(value: Union[str, int, None]) -> int:
+    """Clamp a requested page size to [1, MAX_PAGE_SIZE].
+
+    Args:
+        value (str | int | None): The requested size. None means the maximum.
+
+    Returns:
+        int: The page size to use.
+    """
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return MAX_PAGE_SIZE
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+
+def int_cursor(value: Union[str, None]) -> Union[int, None]:
+    """Parse an integer cursor from a query string value.
+
+    Args:
+        value (str | None): The cursor argument.
+
+    Returns:
+        int | None: The cursor, or None if missing or invalid.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def keyset_page(
+    query: Query,
+    column: InstrumentedAttribute,
+    cursor: Any,
+    limit: int,
+    descending: bool = False,
+    key: Callable[[Any], Any] = None
+) -> Tuple[List, Any]:
+    """Fetch one page of a query ordered by a unique column.
+
+    Args:
+        query (Query): The query to paginate.
+        column (InstrumentedAttribute): The unique column to order by.
+        cursor (Any): Key of the last row of the previous page, or None.
+        limit (int): The page size.
+        descending (bool, optional): Order from the largest key. Defaults to False.
+        key (Callable, optional): Extracts the key from a row. Defaults to the
+        column attribute of the row.
+
+    Returns:
+        Tuple[List, Any]: The rows and the cursor of the next page, or None
+        when this is the last page.
+    """
+    if cursor is not None:
+        query = query.filter(column < cursor if descending else column > cursor)
+    rows = query.order_by(
+        column.desc() if descending else column.asc()
+    ).limit(limit).all()
+
+    if len(rows) < limit:
+        return rows, None
+    if key is None:
+        key = lambda row: getattr(row, column.key)
+    return rows, key(rows[-1])
+
+
+class RowCounter:
+    """Counts the rows of a table in exact, cached or approximate mode.
+
+    Cached counts are reused for ttl seconds or until invalidated. Approximate
+    counts come from the Postgres planner statistics, which cost nothing to read
+    but only refresh on ANALYZE/autovacuum.
+
+    Args:
+        database (Engine): The connection engine to the database.
+        column (InstrumentedAttribute): A column of the table to count.
+        ttl (float, optional): Seconds a cached count is reused. Defaults to 30.
+    """
+
+    def __init__(self, database: Engine, column: InstrumentedAttribute, ttl: float = 30):
+        self.database = database
+        self.column = column
+        self.ttl = ttl
+        self._lock = Lock()
+        self._cached = None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._cached = None
+
+    def exact(self, session) -> int:
+        return session.query(func.count(self.column)).scalar()
+
+    def cached(self, session) -> int:
+        with self._lock:
+            if self._cached is not None and self._cached[1] > time.time():
+                return self._cached[0]
+        count = self.exact(session)
+        with self._lock:
+            self._cached = (count, time.time() + self.ttl)
+        return count
+
+    def approximate(self, session) -> int:
+        if self.database.dialect.name != "postgresql":
+            return self.cached(session)
+        estimate = session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"),
+            {"table": self.column.class_.__table__.name}
+        ).scalar()
+        # Never analyzed tables report -1 (or 0 before Postgres 14)
+        if estimate is None or estimate <= 0:
+            return self.cached(session)
+        return estimate
+
+    def count(self, session, mode: Union[str, None]) -> Union[int, None]:
+        """Count rows in the requested mode.
+
+        Args:
+            session (Session): The open session.
+            mode (str | None): exact, cached, approx or none. Defaults to cached.
+
+        Returns:
+            int | None: The count, or None in none mode.
+        """
+        if mode == "none":
+            return None
+        if mode == "exact":
+            return self.exact(session)
+        if mode == "approx":
+            return self.approximate(session)
+        return self.cached(session)
@@ -0,0 +1,79 @@
+"""
+This module implements the session-per-request lifecycle: one SQLAlchemy
+session per Flask request, shared by everything the request calls and
+closed when it ends.
+"""
+from contextlib import contextmanager
+from typing import Iterator
+
+from flask import Flask, g, has_app_context
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+
+class RequestSessions:
+    """Sessions bound to the request that uses them.
+
+    The session of a request is opened on first use and closed on teardown,
+    which rolls back whatever the request left uncommitted and returns its
+    connection to the pool. Code that also runs outside requests (submission
+    jobs, bulk imports, CLIs) uses scope(), which falls back to a private
+    session there.
+
+    Args:
+        database (Engine): The connection engine to the database.
+        app (Flask, optional): The app whose requests get sessions. Defaults
+        to None, to be set with init_app.
+    """
+
+    def __init__(self, database: Engine, app: Flask = None):
+        self.factory = sessionmaker(bind=database)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Close the session of each request when its context is torn down.
+
+        Args:
+            app (Flask): The app.
+        """
+        app.teardown_appcontext(self.close)
+
+    def current(self) -> Session:
+        """The session of the running request, opened on first use.
+
+        Returns:
+            Session: The session.
+        """
+        if "db_session" not in g:
+            g.db_session = self.factory()
+        return g.db_session
+
+    @contextmanager
+    def scope(self) -> Iterator[Session]:
+        """The session of the running request, or outside one a private
+        session closed on exit.
+
+        Yields:
+            Session: The session.
+        """
+        if has_app_context():
+            yield self.current()
+            return
+        with self.factory() as session:
+            yield session
+
+    def release(self) -> None:
+        """End the read-only transaction of the request session, so its
+        connection goes back to the pool while the request computes. It
+        rolls back: writes are committed explicitly by the code that makes
+        them, never as a side effect of releasing a connection."""
+        session = g.get("db_session") if has_app_context() else None
+        if session is not None:
+            session.rollback()
+
+    def close(self, error: BaseException = None) -> None:
+        """Close the session of the request, if it opened one."""
+        session = g.pop("db_session", None)
+        if session is not None:
+            session.close()
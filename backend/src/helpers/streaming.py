@@ -0,0 +1,104 @@
+"""
+This module implements streamed list responses, written while the rows are
+still being fetched through a server-side cursor.
+"""
+from os import getenv
+from typing import Any, Iterator, Union
+
+from flask import Response, json, stream_with_context
+from sqlalchemy.orm import Query
+
+# Rows fetched per round trip of the server-side cursor
+STREAM_BATCH_SIZE = int(getenv("STREAM_BATCH_SIZE", "500"))
+
+# Bytes buffered before a chunk is written to the client
+CHUNK_SIZE = 64 * 1024
+
+STREAM_MIMETYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def stream_mode(value: Union[str, None]) -> Union[str, None]:
+    """Parse the stream argument of a list endpoint.
+
+    Args:
+        value (str | None): The argument: 1 or json, ndjson, or anything else.
+
+    Returns:
+        str | None: json, ndjson or None for a regular response.
+    """
+    if value in ("1", "json"):
+        return "json"
+    if value == "ndjson":
+        return "ndjson"
+    return None
+
+
+def stream_query(query: Query, batch: int = STREAM_BATCH_SIZE) -> Query:
+    """Make a query fetch its rows batch by batch from a server-side cursor,
+    instead of loading the whole result first.
+
+    Args:
+        query (Query): The query to stream.
+        batch (int, optional): Rows per fetch. Defaults to STREAM_BATCH_SIZE.
+
+    Returns:
+        Query: The streaming query.
+    """
+    return query.execution_options(stream_results=True, max_row_buffer=batch).yield_per(batch)
+
+
+def _chunks(parts: Iterator[str]) -> Iterator[str]:
+    buffer, size = [], 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def stream_response(rows: Iterator[dict], mode: str, key: str = "Samples", **fields: Any) -> Response:
+    """Stream rows as one JSON object per line (ndjson), or as the usual
+    {key: [...], **fields} body (json) written incrementally.
+
+    rows is consumed while the response is sent. The request context, and
+    with it the session of the request, stays open until the last row.
+
+    Args:
+        rows (Iterator[dict]): The serializable rows.
+        mode (str): json or ndjson.
+        key (str, optional): Key of the list in json mode. Defaults to "Samples".
+        **fields: Other members of the json body, written after the list.
+
+    Returns:
+        Response: The streamed response.
+    """
+    def dumps(value):
+        # Compact, like jsonify outside debug mode
+        return json.dumps(value, separators=(",", ":"))
+
+    def ndjson():
+        for row in rows:
+            yield dumps(row) + "\n"
+
+    def envelope():
+        yield "{" + dumps(key) + ":["
+        separator = ""
+        for row in rows:
+            yield separator + dumps(row)
+            separator = ","
+        yield "]"
+        for name, value in fields.items():
+            yield "," + dumps(name) + ":" + dumps(value)
+        yield "}"
+
+    parts = ndjson() if mode == "ndjson" else envelope()
+    return Response(
+        stream_with_context(_chunks(parts)),
+        mimetype=STREAM_MIMETYPES[mode]
+    )
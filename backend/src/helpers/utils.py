@@ -3,7 +3,7 @@ This module implements the utility functions to help the major functions of the
 """
 from os import getenv
 import datetime as dt
-from typing import List, Union
+from typing import TYPE_CHECKING, List, Union
 import re
 
 import sqlalchemy as sql
@@ -12,12 +12,21 @@ from sqlalchemy.engine.base import Engine
 from sqlalchemy.orm.decl_api import DeclarativeMeta
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 from sqlalchemy.orm import Session
-from pandas.core.series import Series
+
+if TYPE_CHECKING:
+    # Only for annotations: importing pandas costs a third of a second
+    from pandas import Series
 
 
 def connect_db() -> Engine:
     """Create engine to connect to database.
 
+    Each process keeps DB_POOL_SIZE connections open and opens up to
+    DB_MAX_OVERFLOW more under load; a request waits DB_POOL_TIMEOUT seconds
+    for one before failing. Connections are replaced after DB_POOL_RECYCLE
+    seconds, and with DB_POOL_PRE_PING=1 tested before each checkout, so a
+    database restart does not fail the next requests.
+
     Returns:
         Engine: The connection engine to the database.
     """
@@ -31,7 +40,12 @@ def connect_db() -> Engine:
         ":" +
         getenv('SQL_PORT') +
         "/" +
-        getenv('SQL_DATABASE')
+        getenv('SQL_DATABASE'),
+        pool_size=int(getenv('DB_POOL_SIZE', '5')),
+        max_overflow=int(getenv('DB_MAX_OVERFLOW', '10')),
+        pool_timeout=float(getenv('DB_POOL_TIMEOUT', '30')),
+        pool_recycle=int(getenv('DB_POOL_RECYCLE', '1800')),
+        pool_pre_ping=getenv('DB_POOL_PRE_PING', '1') == '1'
     )
 
 def get_next_table_id(database: Engine, table: DeclarativeMeta) -> int:
@@ -150,7 +164,7 @@ def get_db_ids(
                 ).fetchall()
             )
 
-def to_db_id(column: Series, db_ids: dict) -> Series:
+def to_db_id(column: "Series", db_ids: dict) -> "Series":
     """Returns a Pandas' Series converted from values to database IDs.
 
     Args:
@@ -212,6 +226,23 @@ def verify_date(date):
     if not bool(re.fullmatch('[0-9]{4}-[0-9]{2}-[0-9]{2}', date)):
         return True
 
+def normalize_date(date):
+    """Date of a submission as YYYY-MM-DD, or None when it is not a date.
+
+    Accepts a bare date or a full ISO 8601 timestamp, such as the output of
+    JavaScript's Date.toISOString(), keeping only its date part."""
+    if not isinstance(date, str):
+        return None
+    match = re.fullmatch(
+        r'([0-9]{4}-[0-9]{2}-[0-9]{2})([T ][0-9:.]+(Z|[+-][0-9]{2}:?[0-9]{2})?)?', date
+    )
+    if match is None:
+        return None
+    try:
+        return dt.date.fromisoformat(match.group(1)).isoformat()
+    except ValueError:
+        return None
+
 def verify_vector(vector):
 
 
@@ -0,0 +1,54 @@
+"""
+Imports a directory, zip or tar archive of photos as encounters.
+
+Each photo becomes one encounter, and the folder holding it names its turtle,
+as in notebooks/imgs (CM001/CM001F1.JPG). Coordinates and dates come from the
+EXIF, a CSV manifest (foto, nome, latitude, longitude, data) or the defaults.
+With --resume, an interrupted import skips what it already stored:
+
+    python import_photos.py ../../notebooks/imgs --resume imgs.progress
+"""
+import argparse
+import json
+import os
+import sys
+
+import server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("source", help="directory, zip or tar archive")
+    parser.add_argument("--manifest", help="CSV with per-photo name, coordinates and date")
+    parser.add_argument("--resume", help="progress file of the photos already imported")
+    parser.add_argument("--batch", type=int, default=server.IMPORT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--latitude", help="for photos without GPS data")
+    parser.add_argument("--longitude", help="for photos without GPS data")
+    parser.add_argument("--date", help="YYYY-MM-DD, for photos without a date")
+    parser.add_argument("--output", help="JSON file for the report (default: stdout)")
+    args = parser.parse_args()
+
+    defaults = {
+        key: value
+        for key, value in (("latitude", args.latitude), ("longitude", args.longitude), ("data", args.date))
+        if value
+    }
+    report, _ = server.import_archive(
+        args.source,
+        manifest=args.manifest,
+        resume=args.resume,
+        batch_size=args.batch,
+        workers=args.workers,
+        defaults=defaults,
+        progress=lambda report: print(
+            f"{report['imported']} imported, {sum(report['skipped'].values())} skipped",
+            file=sys.stderr
+        )
+    )
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output)
+    else:
+        print(output)
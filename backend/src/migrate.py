@@ -0,0 +1,12 @@
+"""
+Applies the pending schema migrations to the configured database.
+"""
+from helpers.utils import connect_db
+from helpers.migrations import applied_migrations, list_migrations, run_migrations
+
+if __name__ == "__main__":
+    database = connect_db()
+    for version in run_migrations(database):
+        print(f"applied {version}")
+    pending = set(list_migrations()) - set(applied_migrations(database))
+    print(f"{len(pending)} pending migrations")
@@ -0,0 +1,63 @@
+"""
+Moves the stored images between the database and the content-addressed file
+store. With IMAGE_STORE_PATH set, images kept in the database are written to
+the store; with --to-database, stored files are copied back into the rows.
+Safe to interrupt and run again.
+"""
+import argparse
+
+import sqlalchemy as sql
+
+from helpers.utils import connect_db
+from helpers.images import IMAGE_STORE_PATH, REFERENCE_PREFIX, ImageStore
+
+IMAGE_COLUMNS = {
+    "encontro": ("imagem_corpo", "imagem_cabeca", "miniatura_corpo", "miniatura_cabeca"),
+    "tartaruga": ("ultima_imagem_cabeca", "cabeca_normalizada"),
+}
+
+
+def relocate(database, table_name, source, target, batch):
+    table = sql.Table(table_name, sql.MetaData(), autoload_with=database)
+    moved, cursor = 0, 0
+    while True:
+        with database.begin() as conn:
+            rows = conn.execute(
+                sql.select([
+                    table.c.identificador,
+                    *(table.c[column] for column in IMAGE_COLUMNS[table_name])
+                ]).where(
+                    table.c.identificador > cursor
+                ).order_by(table.c.identificador).limit(batch)
+            ).fetchall()
+            for row in rows:
+                values = {
+                    column: target.put(source.get(row[column]))
+                    for column in IMAGE_COLUMNS[table_name]
+                    if row[column] is not None
+                    and bytes(row[column]).startswith(REFERENCE_PREFIX) != (target.path is not None)
+                }
+                if values:
+                    conn.execute(
+                        table.update().where(table.c.identificador == row.identificador).values(**values)
+                    )
+                    moved += 1
+        if not rows:
+            return moved
+        cursor = rows[-1].identificador
+        print(f"{table_name}: {moved} rows moved, up to {cursor}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--to-database", action="store_true")
+    parser.add_argument("--batch", type=int, default=50)
+    args = parser.parse_args()
+    if IMAGE_STORE_PATH is None:
+        parser.error("IMAGE_STORE_PATH is not set")
+
+    database = connect_db()
+    source = ImageStore()
+    target = ImageStore(None) if args.to_database else source
+    for table_name in IMAGE_COLUMNS:
+        relocate(database, table_name, source, target, args.batch)
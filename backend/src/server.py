@@ -2,33 +2,69 @@
 Implements a backend server
 """
 # Imports
-from base64 import b64encode, b64decode
-import requests
+from base64 import b64decode
+import datetime as dt
 import re
-import numpy as np
+import math
+from hashlib import sha1
+from functools import partial
+from threading import Lock
+from os import getenv, path
+import os
+import tempfile
+import time
 
 from helpers.utils import (
     connect_db,
     generate_token,
     validate_token,
     verify_status,
-    verify_date,
+    normalize_date,
     verify_id,
     verify_vector,
     coordinates_extractor
 )
+from helpers.jobs import JobStore
+from helpers.metrics import Metrics
+from helpers.bulk_import import (
+    ResumeLog,
+    close_archive,
+    extract_batches,
+    list_items,
+    read_photo,
+    source_keys
+)
+from helpers.migrations import run_migrations
+from helpers import models
+from helpers.names import NameDirectory
+from helpers.sessions import RequestSessions
+from helpers.pagination import RowCounter, int_cursor, keyset_page, page_size
+from helpers.streaming import stream_mode, stream_query, stream_response
+from helpers.geo import (
+    bbox_filter,
+    geohash_encode,
+    haversine_km,
+    radius_bbox,
+    zoom_precision
+)
+from helpers.images import ImageStore, image_mimetype, ingest_image
+from helpers.geocoding import Geocoder, HttpGeocoder, CentroidGeocoder
 
-from flask import Flask, request
+from flask import Flask, Response, request, url_for
 from werkzeug.security import (
     generate_password_hash,
     check_password_hash
 )
-from sqlalchemy import or_
-from sqlalchemy.orm import Session
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import defer
 from sqlalchemy.ext.automap import automap_base
 from flask_cors import CORS
 
-from vision_models.contour_recognition import contour_matching
+from vision_models.descriptor_index import HuMomentsIndex
+from vision_models.hash_index import HashIndex, perceptual_hash
+from vision_models.sift_index import SiftIndex
+from vision_models.recognition_pool import RecognitionPool, head_features
 
 
 # Server instantiation and configuration
@@ -36,298 +72,1369 @@ server = Flask(__name__)
 CORS(server)
 server.config['JSON_SORT_KEYS'] = False
 
+# Request, stage and SQL timings for /metrics and the Server-Timing header,
+# shared by the worker processes through the files in METRICS_DIR
+metrics = Metrics(getenv("SERVER_TIMING", "0") == "1", getenv("METRICS_DIR") or None)
+metrics.instrument_app(server)
+
 # Create connection engine with database
 database = connect_db()
+metrics.instrument_engine(database)
+
+# One session per request, closed on teardown
+sessions = RequestSessions(database, server)
+
+# Bring the schema up to date before mapping it
+if getenv("RUN_MIGRATIONS", "1") == "1" and database.dialect.name == "postgresql":
+    run_migrations(database)
+
+# Map database tables as classes: declared in helpers/models.py, or
+# reflected from the live schema with REFLECT_SCHEMA=1
+if getenv("REFLECT_SCHEMA", "0") == "1":
+    model = automap_base()
+    model.prepare(database, reflect=True)
+else:
+    model = models
+
+# Head descriptors of every known turtle, filled on first use. MATCHER picks
+# between contour (Hu moments) and SIFT/FLANN recognition
+MATCHER = getenv("MATCHER", "contour")
+if MATCHER == "sift":
+    head_index = SiftIndex(getenv("SIFT_INDEX_PATH"))
+    match_threshold = int(getenv("SIFT_MIN_MATCHES", "60"))
+else:
+    head_index = HuMomentsIndex()
+    match_threshold = 0.1
+head_index_loaded = False
+head_index_lock = Lock()
+# Turtles committed by other workers reach the index before each match: the
+# ones above the highest ID seen, and every HEAD_INDEX_TTL seconds any other
+# missing one, such as a lower ID committed late
+HEAD_INDEX_TTL = float(getenv("HEAD_INDEX_TTL", "60"))
+head_index_max_id = 0
+head_index_scanned_at = None
+
+# Optional first recognition stage: with CASCADE_TOP_K > 0, only the turtles
+# with the closest perceptual hashes go through the matcher above
+cascade_top_k = int(getenv("CASCADE_TOP_K", "0"))
+cascade_max_distance = int(getenv("CASCADE_MAX_DISTANCE", "64"))
+hash_index = HashIndex()
+
+# Optional geo-temporal prior: with GEO_PRIOR=1 a submission is first matched
+# against the turtles seen close enough, for the time elapsed since, to have
+# travelled to it, and against everyone only when none of them matches
+geo_prior = getenv("GEO_PRIOR", "0") == "1"
+GEO_PRIOR_SPEED_KM_DAY = float(getenv("GEO_PRIOR_SPEED_KM_DAY", "30"))
+GEO_PRIOR_MIN_KM = float(getenv("GEO_PRIOR_MIN_KM", "10"))
+GEO_PRIOR_MAX_KM = float(getenv("GEO_PRIOR_MAX_KM", "300"))
+geo_prior_stats = {"regional": 0, "fallback": 0, "no_candidates": 0}
+geo_prior_lock = Lock()
+
+# Process pool for recognition jobs, started by init_process;
+# RECOGNITION_WORKERS=0 keeps them inline
+recognition_workers = int(getenv("RECOGNITION_WORKERS", "0"))
+recognition_pool = None
+
+# Reverse geocoding of encounters: cached, optionally offline, HTTP as fallback
+geocoding_providers = []
+if getenv("GEOCODER_CENTROIDS"):
+    geocoding_providers.append(CentroidGeocoder.from_csv(
+        getenv("GEOCODER_CENTROIDS"),
+        max_km=float(getenv("GEOCODER_OFFLINE_MAX_KM", "30"))
+    ))
+if getenv("GEOCODER_HTTP", "1") == "1":
+    geocoding_providers.append(HttpGeocoder())
+geocoder = Geocoder(geocoding_providers, database)
+
+# Encounter count for /samples, refreshed on insert
+encontro_counter = RowCounter(
+    database,
+    model.classes.encontro.identificador,
+    float(getenv("COUNT_CACHE_TTL", "30"))
+)
+
+# Turtle names and IDs, for lookups and autocomplete without the database
+name_directory = NameDirectory(
+    database,
+    model.classes.tartaruga.identificador,
+    model.classes.tartaruga.nome,
+    float(getenv("NAME_CACHE_TTL", "60"))
+)
+
+# Image bytes kept in the database, or in a file store with IMAGE_STORE_PATH
+image_store = ImageStore()
+
+# Background pipeline for asynchronous submissions and imports, tracked in
+# the database so that any worker answers /jobs
+submission_jobs = JobStore(int(getenv("SUBMISSION_WORKERS", "2")), database)
+
+
+def init_process():
+    """Create the resources that cannot be shared with forked processes.
+
+    Runs at import, or after the fork in each worker of a preloading WSGI
+    server (SERVER_PRELOAD=1, see gunicorn.conf.py)."""
+    global recognition_pool
+    # Never reuse connections opened before the fork
+    database.dispose()
+    if recognition_workers > 0:
+        recognition_pool = RecognitionPool(
+            recognition_workers,
+            int(getenv("RECOGNITION_SHARDS", "0")) or None
+        )
+
+
+if getenv("SERVER_PRELOAD") != "1":
+    init_process()
+
+
+@server.get("/ready")
+def ready():
+    """Readiness probe: 200 once the database answers, 503 otherwise."""
+    try:
+        with database.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except SQLAlchemyError:
+        return {"ready": False, "database": False}, 503
+    return {
+        "ready": True,
+        "database": True,
+        "head_index_loaded": head_index_loaded,
+        "recognition_workers": recognition_workers,
+    }
+
+
+def turtle_summary(sample):
+    return {
+        "id": sample.identificador,
+        "nome": sample.nome,
+        "ultimo_encontro": sample.ultimo_encontro,
+    }
+
+
+@server.get("/metrics")
+def get_metrics():
+    """Timing histograms in the Prometheus text format, of every worker with
+    METRICS_DIR and of this process otherwise."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
-# Map database tables as classes
-model = automap_base()
-model.prepare(database, reflect=True)
 
 @server.route("/get_all_turtles", methods=["GET"])
 def get_samples_turtles():
-    samples_list = []
-    with Session(database) as session:
-        results = session.query(
-            model.classes.tartaruga
-        ).all()
-        for sample in results:
-            samples_list.append({
-                "id": sample.identificador,
-                "nome": sample.nome,
-                "ultimo_encontro": sample.ultimo_encontro,
-                "forma": sample.forma,
-            })
+    """One page of turtles, or with ?stream=json|ndjson all of them, streamed."""
+    columns = (
+        model.classes.tartaruga.identificador,
+        model.classes.tartaruga.nome,
+        model.classes.tartaruga.ultimo_encontro
+    )
+    cursor = int_cursor(request.args.get('cursor'))
+    mode = stream_mode(request.args.get('stream'))
+    if mode is not None:
+        def rows():
+            with sessions.scope() as session:
+                query = session.query(*columns)
+                if cursor is not None:
+                    query = query.filter(model.classes.tartaruga.identificador > cursor)
+                for sample in stream_query(query.order_by(model.classes.tartaruga.identificador)):
+                    yield turtle_summary(sample)
+        return stream_response(rows(), mode, next_cursor=None)
+
+    with sessions.scope() as session:
+        with metrics.span("query"):
+            results, next_cursor = keyset_page(
+                session.query(*columns),
+                model.classes.tartaruga.identificador,
+                cursor,
+                page_size(request.args.get('limit'))
+            )
+        with metrics.span("serialize"):
+            samples_list = [turtle_summary(sample) for sample in results]
 
     return {
         "Samples": samples_list,
+        "next_cursor": next_cursor,
     }
 
     
+# Image columns served by /images/<encontro_id>/<kind>
+ENCONTRO_IMAGES = {
+    "corpo": "imagem_corpo",
+    "cabeca": "imagem_cabeca",
+    "miniatura_corpo": "miniatura_corpo",
+    "miniatura_cabeca": "miniatura_cabeca",
+}
+
+# Encounters stored before thumbnails existed serve the original instead
+ENCONTRO_IMAGE_FALLBACKS = {
+    "miniatura_corpo": "imagem_corpo",
+    "miniatura_cabeca": "imagem_cabeca",
+}
+
+
+def encontro_image_options():
+    """Query options that keep the image blobs out of listing queries."""
+    return [
+        defer(getattr(model.classes.encontro, column))
+        for column in ENCONTRO_IMAGES.values()
+    ]
+
+
+def encontro_image_urls(encontro_id):
+    return {
+        f"{column}_url": url_for("get_image", encontro_id=encontro_id, kind=kind)
+        for kind, column in ENCONTRO_IMAGES.items()
+    }
+
+
+@server.get("/images/<int:encontro_id>/<kind>")
+def get_image(encontro_id, kind):
+    if kind not in ENCONTRO_IMAGES:
+        return {"error": "Tipo de imagem inválido"}, 404
+
+    column = getattr(model.classes.encontro, ENCONTRO_IMAGES[kind])
+    if kind in ENCONTRO_IMAGE_FALLBACKS:
+        column = func.coalesce(
+            column,
+            getattr(model.classes.encontro, ENCONTRO_IMAGE_FALLBACKS[kind])
+        )
+    with sessions.scope() as session:
+        result = session.query(column).filter(
+            model.classes.encontro.identificador == encontro_id
+        ).first()
+    if result is None:
+        return {"error": "Encontro não encontrado"}, 404
+
+    data = image_store.get(result[0])
+    response = Response(data, mimetype=image_mimetype(data))
+    response.set_etag(sha1(data).hexdigest())
+    # Encounter images never change once stored
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response.make_conditional(request)
+
+
+def encontro_summary(sample):
+    return {
+        "id": sample.identificador,
+        "latitude": sample.latitude,
+        "longitude": sample.longitude,
+        "tartaruga_identificador": sample.tartaruga_identificador,
+        **encontro_image_urls(sample.identificador),
+        "data": sample.data
+    }
+
+
 @server.route("/get_all_findings", methods=["GET"])
 def get_samples_fingings():
+    """One page of encounters, or with ?stream=json|ndjson all of them, streamed."""
+    cursor = int_cursor(request.args.get('cursor'))
+    mode = stream_mode(request.args.get('stream'))
+    if mode is not None:
+        def rows():
+            with sessions.scope() as session:
+                query = session.query(
+                    model.classes.encontro
+                ).options(
+                    *encontro_image_options()
+                )
+                if cursor is not None:
+                    query = query.filter(model.classes.encontro.identificador > cursor)
+                for sample in stream_query(query.order_by(model.classes.encontro.identificador)):
+                    yield encontro_summary(sample)
+        return stream_response(rows(), mode, next_cursor=None)
 
-    samples_list = []
-    with Session(database) as session:
-        results = session.query(
-            model.classes.encontro
-        ).all()
-   
-
-        for sample in results:
-            samples_list.append({
-                "id": sample.identificador,
-                "latitude": sample.latitude,
-                "longitude": sample.longitude,
-                "tartaruga_identificador": sample.tartaruga_identificador,
-                "imagem_corpo": f"{sample.imagem_corpo}",
-                "imagem_cabeca": f"{sample.imagem_corpo}",
-                "data": sample.data
-            })
+    with sessions.scope() as session:
+        with metrics.span("query"):
+            results, next_cursor = keyset_page(
+                session.query(
+                    model.classes.encontro
+                ).options(
+                    *encontro_image_options()
+                ),
+                model.classes.encontro.identificador,
+                cursor,
+                page_size(request.args.get('limit'))
+            )
+        with metrics.span("serialize"):
+            samples_list = [encontro_summary(sample) for sample in results]
 
     return {
         "Samples": samples_list,
+        "next_cursor": next_cursor,
     }
 
+def compute_head_features(imagens):
+    """Descriptors of a list of head images, on the pool when there is one."""
+    if recognition_pool is not None:
+        return recognition_pool.head_features_many(MATCHER, imagens)
+    return [head_features(MATCHER, imagem) for imagem in imagens]
 
-def check_similarities(imagem_cabeca):
-    with Session(database) as session:
-        results = session.query(
-            model.classes.tartaruga
-        ).all()
 
-    best_matches = []
-    best_matches_identificadores = []
-    for sample in results:
-        imagem_cabeca_outra = sample.ultima_imagem_cabeca
-        d2 = contour_matching(imagem_cabeca, imagem_cabeca_outra)
-        if d2 <= 0.1:
-            best_matches.append(d2)
-            best_matches_identificadores.append(sample.identificador)
-        # threshold = 60
-        # if total_matches > threshold:
-        #     best_matches.append(total_matches)
-        #     best_matches_identificadores.append(sample.identificador)
-
-    if len(best_matches) == 0:
+def normalized_head(sample):
+    """Recognition image of a turtle, normalized now if it predates ingestion."""
+    if sample.cabeca_normalizada is not None:
+        return image_store.get(sample.cabeca_normalizada)
+    return ingest_image(image_store.get(sample.ultima_imagem_cabeca)).matching
+
+
+def load_head_index():
+    """Compute the head descriptor of every turtle missing from the index.
+
+    Only the turtles above the highest ID seen are queried, except on the
+    first call and then once every HEAD_INDEX_TTL seconds, which check them
+    all."""
+    global head_index_loaded, head_index_max_id, head_index_scanned_at
+    with head_index_lock:
+        if MATCHER == "sift":
+            # Descriptors other workers computed and stored in SIFT_INDEX_PATH
+            head_index.sync()
+        full_scan = (
+            head_index_scanned_at is None
+            or time.monotonic() - head_index_scanned_at > HEAD_INDEX_TTL
+        )
+        with sessions.scope() as session:
+            query = session.query(model.classes.tartaruga.identificador)
+            if not full_scan:
+                query = query.filter(model.classes.tartaruga.identificador > head_index_max_id)
+            identificadores = [sample.identificador for sample in query]
+            missing, indexed = [], set()
+            if identificadores:
+                indexed = set(head_index.identificadores)
+                hashed = set(hash_index.identificadores) if cascade_top_k > 0 else indexed
+                missing = [
+                    identificador for identificador in identificadores
+                    if identificador not in indexed or identificador not in hashed
+                ]
+            results = session.query(
+                model.classes.tartaruga.identificador,
+                model.classes.tartaruga.cabeca_normalizada,
+                model.classes.tartaruga.ultima_imagem_cabeca
+            ).filter(
+                model.classes.tartaruga.identificador.in_(missing)
+            ).all() if missing else []
+            # Release the connection before computing the descriptors
+            sessions.release()
+        cabecas = [normalized_head(sample) for sample in results]
+        sem_descritor = [
+            position for position, sample in enumerate(results)
+            if sample.identificador not in indexed
+        ]
+        descritores = compute_head_features([cabecas[position] for position in sem_descritor])
+        for position, descritor in zip(sem_descritor, descritores):
+            head_index.add(results[position].identificador, descritor)
+        if cascade_top_k > 0:
+            for sample, cabeca in zip(results, cabecas):
+                hash_index.add(sample.identificador, perceptual_hash(cabeca))
+        head_index_max_id = max([head_index_max_id, *identificadores])
+        if full_scan:
+            head_index_scanned_at = time.monotonic()
+        head_index_loaded = True
+
+
+def plausible_turtles(request_data):
+    """Turtles with a sighting within reach of a submission.
+
+    A sighting d days apart reaches GEO_PRIOR_MIN_KM + d * GEO_PRIOR_SPEED_KM_DAY,
+    up to GEO_PRIOR_MAX_KM. Returns None when the submission has no usable
+    coordinates or date."""
+    latitude = parse_coordinate(request_data["latitude"])
+    longitude = parse_coordinate(request_data["longitude"])
+    try:
+        data = dt.date.fromisoformat(request_data["photo_date"])
+    except (TypeError, ValueError):
         return None
-    else:
-        idx = np.argmin(best_matches)
-        return best_matches_identificadores[idx]
-    
-def insert_new_turtle(request_data):
-    with Session(database) as session:
-        obj =  model.classes.tartaruga(
-                   nome=request_data["turtle_name"],
-                   ultimo_encontro=request_data["photo_date"],
-                   ultima_imagem_cabeca=b64encode(b64decode(request_data['photo2']))
-                )
+    if latitude is None or longitude is None:
+        return None
+
+    with sessions.scope() as session:
+        sightings = within_bbox(
+            session.query(
+                model.classes.encontro.tartaruga_identificador,
+                model.classes.encontro.latitude_num,
+                model.classes.encontro.longitude_num,
+                model.classes.encontro.data
+            ),
+            radius_bbox(latitude, longitude, GEO_PRIOR_MAX_KM)
+        ).all()
+        # The matcher runs next, without holding a connection
+        sessions.release()
+
+    candidatos = set()
+    for sighting in sightings:
+        if sighting.tartaruga_identificador in candidatos:
+            continue
+        days = abs((data - sighting.data).days)
+        reach = min(GEO_PRIOR_MIN_KM + days * GEO_PRIOR_SPEED_KM_DAY, GEO_PRIOR_MAX_KM)
+        distance = haversine_km(latitude, longitude, sighting.latitude_num, sighting.longitude_num)
+        if distance <= reach:
+            candidatos.add(sighting.tartaruga_identificador)
+    return candidatos
+
+
+def check_similarities(descritor_cabeca, assinatura=None, candidatos=None):
+    """Best matching turtle, or None.
+
+    With candidatos (from plausible_turtles), those are searched first and
+    the whole population only when none of them matches."""
+    load_head_index()
+    if candidatos is not None:
+        mais_similar = None
+        if candidatos:
+            mais_similar = head_index.best_match(descritor_cabeca, match_threshold, list(candidatos))
+        with geo_prior_lock:
+            if not candidatos:
+                geo_prior_stats["no_candidates"] += 1
+            elif mais_similar is None:
+                geo_prior_stats["fallback"] += 1
+            else:
+                geo_prior_stats["regional"] += 1
+        if mais_similar is not None:
+            return mais_similar
+    if assinatura is not None and len(hash_index) > cascade_top_k:
+        candidatos = hash_index.shortlist(assinatura, cascade_top_k, cascade_max_distance)
+        return head_index.best_match(descritor_cabeca, match_threshold, candidatos)
+    if recognition_pool is not None:
+        return recognition_pool.best_match(head_index, descritor_cabeca, match_threshold)
+    return head_index.best_match(descritor_cabeca, match_threshold)
+
+def insert_new_turtle(session, request_data, imagem_cabeca, cabeca_normalizada):
+    """Add the turtle of an unmatched submission to the transaction of
+    session, and return its ID."""
+    obj = model.classes.tartaruga(
+        nome=request_data["turtle_name"],
+        ultimo_encontro=request_data["photo_date"],
+        ultima_imagem_cabeca=imagem_cabeca,
+        cabeca_normalizada=image_store.put(cabeca_normalizada)
+    )
+    session.add(obj)
+    # Raises IntegrityError now, rather than at commit, for a taken name
+    session.flush()
+    return obj.identificador
+
+
+def register_turtle(identificador, nome, descritor_cabeca, assinatura):
+    """Make a committed turtle known to the name directory and the indexes."""
+    name_directory.add(identificador, nome)
+    with head_index_lock:
+        if head_index_loaded:
+            head_index.add(identificador, descritor_cabeca)
+            if assinatura is not None:
+                hash_index.add(identificador, assinatura)
+
+
+def validate_sample(request_data):
+    """Return an error message for an invalid submission, or None.
+
+    A photo_date sent as a full ISO timestamp is cut down to its date."""
+    if not isinstance(request_data, dict):
+        return "JSON inválido"
+    for key in ("latitude", "longitude", "turtle_name", "photo_date", "photo1", "photo2"):
+        if key not in request_data:
+            return f"Campo {key} ausente"
+    photo_date = normalize_date(request_data["photo_date"])
+    if photo_date is None:
+        return "Data inválida"
+    request_data["photo_date"] = photo_date
+    for key in ("photo1", "photo2"):
         try:
-            session.add(
-               obj
-            )
-        except:
-            session.rollback()
-            raise
-        else:
-            session.commit()
-            session.refresh(obj)
-            
-        return obj.identificador    
+            b64decode(request_data[key])
+        except (TypeError, ValueError):
+            return f"Imagem {key} inválida"
+
 
 @server.route("/submit-sample", methods=["POST"])
 def submit_sample():
-    request_data =  request.json
-    imagem_corpo = b64encode(b64decode(request_data['photo1']))
-    imagem_cabeca = b64encode(b64decode(request_data['photo2']))
-    
-    mais_similar = check_similarities(imagem_cabeca)
-    # mais_similar = None
-    if mais_similar is None:
-        tartaruga_identificador = insert_new_turtle(request_data)
+    request_data =  request.get_json(silent=True)
+    with metrics.span("base64"):
+        error = validate_sample(request_data)
+        if error is not None:
+            return {"error": error}, 400
+
+        corpo = b64decode(request_data['photo1'])
+        cabeca = b64decode(request_data['photo2'])
+    try:
+        with metrics.span("ingest"):
+            miniatura_corpo = ingest_image(corpo, with_matching=False).thumbnail
+            cabeca_ingerida = ingest_image(cabeca)
+    except ValueError as error:
+        return {"error": str(error)}, 400
+    with metrics.span("store_images"):
+        imagens = {
+            "imagem_corpo": image_store.put(corpo),
+            "imagem_cabeca": image_store.put(cabeca),
+            "miniatura_corpo": image_store.put(miniatura_corpo),
+            "miniatura_cabeca": image_store.put(cabeca_ingerida.thumbnail),
+        }
+    cabeca_normalizada = cabeca_ingerida.matching
+
+    if request.args.get("async") == "1" or request_data.get("async"):
+        job_id = submission_jobs.submit(
+            process_sample, request_data, imagens, cabeca_normalizada
+        )
+        return {"job_id": job_id, "status": "queued"}, 202
+
+    return process_sample(request_data, imagens, cabeca_normalizada)
+
+
+@server.get("/jobs/<job_id>")
+def get_job(job_id):
+    job = submission_jobs.get(job_id)
+    if job is None:
+        return {"error": "Job não encontrado"}, 404
+
+    response = {
+        "id": job_id,
+        "status": job["status"],
+    }
+    if job["status"] == "done":
+        response["code"] = job["code"]
+        response["result"] = job["result"]
+    elif job["status"] == "failed":
+        response["error"] = job["error"]
+    return response
+
+
+def parse_coordinate(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def coordinate_columns(latitude, longitude):
+    """Numeric coordinates and geohash of an encounter, None when unparseable."""
+    latitude_num = parse_coordinate(latitude)
+    longitude_num = parse_coordinate(longitude)
+    if latitude_num is None or longitude_num is None:
+        geohash = None
     else:
-        tartaruga_identificador = mais_similar
+        geohash = geohash_encode(latitude_num, longitude_num)
+    return {
+        "latitude_num": latitude_num,
+        "longitude_num": longitude_num,
+        "geohash": geohash,
+    }
+
+
+def process_sample(request_data, imagens, cabeca_normalizada):
+    """Match, geocode and store a validated submission.
+
+    imagens maps the encontro image columns to their stored values, and
+    cabeca_normalizada is the head image used for recognition. Returns the
+    response body and status code, so it can back both the synchronous
+    endpoint and a background job."""
+    # Brightness, blur, threshold, Canny and Hu moments (or SIFT)
+    with metrics.span("features"):
+        descritor_cabeca, = compute_head_features([cabeca_normalizada])
+    with metrics.span("hash"):
+        assinatura = perceptual_hash(cabeca_normalizada) if cascade_top_k > 0 else None
+    with metrics.span("geo_prior"):
+        candidatos = plausible_turtles(request_data) if geo_prior else None
+    with metrics.span("match"):
+        mais_similar = check_similarities(descritor_cabeca, assinatura, candidatos)
 
     latitude = request_data['latitude']
     longitude = request_data['longitude']
 
-    query = {
-        'latitude': latitude,
-        'longitude': longitude
-    }
-    geodecoding = requests.get("https://api.bigdatacloud.net/data/reverse-geocode-client", params=query)
-    try:
-        for adm in geodecoding.json()['localityInfo']['administrative']:
-            if adm['adminLevel'] == 4:
-                estado = adm['name']
-            if adm['adminLevel'] == 8:
-                cidade = adm['name']
-    except:
-        estado = "indefinido"
-        cidade = "indefinido"
+    # Before the transaction, so no connection is held while the geocoder waits
+    with metrics.span("geocode"):
+        cidade, estado = geocoder.resolve(latitude, longitude)
 
+    # A new turtle and its first encounter are stored together or not at all
+    with sessions.scope() as session:
+        if mais_similar is None:
+            try:
+                with metrics.span("insert_turtle"):
+                    tartaruga_identificador = insert_new_turtle(
+                        session,
+                        request_data,
+                        imagens["imagem_cabeca"],
+                        cabeca_normalizada
+                    )
+            except IntegrityError:
+                session.rollback()
+                # tartaruga.nome is unique
+                return {
+                    "detail": 103,
+                    "error": f"Já existe uma tartaruga chamada {request_data['turtle_name']}"
+                }, 400
+        else:
+            tartaruga_identificador = mais_similar
 
-    with Session(database) as session:
-        try:
+        with metrics.span("insert_encounter"):
             session.add(
                 model.classes.encontro(
                     tartaruga_identificador=tartaruga_identificador,
                     latitude=latitude,
                     longitude=longitude,
+                    **coordinate_columns(latitude, longitude),
                     cidade=cidade,
                     estado=estado,
-                    imagem_corpo=imagem_corpo,
-                    imagem_cabeca=imagem_cabeca,
-                    data=request_data["photo_date"]
+                    data=request_data["photo_date"],
+                    **imagens
                 )
             )
-        except:
-            session.rollback()
-            raise
-        else:
             session.commit()
 
     if mais_similar is None:
-        return {"status": 200}
-    else:
-        result = session.query(
-            model.classes.tartaruga.nome
-        ).filter( model.classes.tartaruga.identificador == mais_similar).first()
+        register_turtle(
+            tartaruga_identificador,
+            request_data["turtle_name"],
+            descritor_cabeca,
+            assinatura
+        )
+    encontro_counter.invalidate()
 
+    if mais_similar is None:
+        return {"status": 200}, 200
+    else:
         return {
             "detail": 102,
-            "error": f"Esta tartaruga já existe e se chama {result.nome}"
+            "error": f"Esta tartaruga já existe e se chama {name_directory.name_of(mais_similar)}"
         }, 400
 
 
+# Recognition pool queue depth
+@server.get("/recognition-status")
+def recognition_status():
+    if recognition_pool is None:
+        status = {
+            "workers": 0,
+            "shards": 0,
+            "pending": 0,
+        }
+    else:
+        status = recognition_pool.status()
+    status["submissions_pending"] = submission_jobs.pending()
+    if geo_prior:
+        with geo_prior_lock:
+            # How often the regional search settled a submission
+            status["geo_prior"] = dict(geo_prior_stats)
+    return status
+
+
+# Bulk imports of photo archives (import_photos.py and /import)
+IMPORT_BATCH_SIZE = int(getenv("IMPORT_BATCH_SIZE", "32"))
+IMPORT_WORKERS = int(getenv("IMPORT_WORKERS", "0"))
+IMPORT_PATH = getenv("IMPORT_PATH") or tempfile.gettempdir()
+
+
+def import_name(photo, taken):
+    """Name of a new turtle of an unlabelled photo: its file name, made unique."""
+    base = path.splitext(path.basename(photo.item.key))[0]
+    nome, suffix = base, 1
+    while nome in taken or name_directory.id_of(nome) is not None:
+        suffix += 1
+        nome = f"{base}-{suffix}"
+    return nome
+
+
+def resolve_batch(photos, labels, report):
+    """Turtle of each photo of a bulk import batch.
+
+    A photo labelled with a known turtle goes to it. Any other photo is
+    matched against the gallery and then against the turtles started earlier
+    in the batch, and starts a new turtle, named after its label or its file,
+    when neither matches. The first photo of a new label decides the turtle
+    of the whole label. New turtles get negative placeholder IDs; returns the
+    turtle of each photo and {placeholder: (nome, photo)} of the new ones."""
+    load_head_index()
+    batch_index = SiftIndex() if MATCHER == "sift" else HuMomentsIndex()
+    novas = {}
+    turtles = []
+    for photo in photos:
+        label = photo.item.label
+        turtle = None
+        if label:
+            turtle = labels.get(label) or name_directory.id_of(label)
+        if turtle is not None:
+            report["by_label"] += 1
+        else:
+            candidatos = plausible_turtles({
+                "latitude": photo.latitude,
+                "longitude": photo.longitude,
+                "photo_date": photo.data,
+            }) if geo_prior else None
+            turtle = check_similarities(photo.descritor, photo.assinatura, candidatos)
+            if turtle is not None:
+                report["matched_gallery"] += 1
+                if label:
+                    report["label_matches"][label] = name_directory.name_of(turtle)
+            else:
+                turtle = batch_index.best_match(photo.descritor, match_threshold)
+                if turtle is not None:
+                    report["matched_batch"] += 1
+                else:
+                    turtle = -(len(novas) + 1)
+                    taken = {nome for nome, _ in novas.values()}
+                    novas[turtle] = (label or import_name(photo, taken), photo)
+                    batch_index.add(turtle, photo.descritor)
+            if label:
+                labels[label] = turtle
+        turtles.append(turtle)
+    return turtles, novas
+
+
+def store_batch(source, photos, turtles, novas, labels):
+    """Insert the new turtles and the encounters of a bulk import batch, in
+    one transaction and one multi-row INSERT per table."""
+    originais, miniaturas = [], []
+    for photo in photos:
+        originais.append(image_store.put(read_photo(source, photo.item.key)))
+        miniaturas.append(image_store.put(photo.thumbnail))
+    positions = {id(photo): position for position, photo in enumerate(photos)}
+    # Photos of the same place share one lookup
+    lugares = {}
+    for photo in photos:
+        coordenadas = (photo.latitude, photo.longitude)
+        if coordenadas not in lugares:
+            lugares[coordenadas] = geocoder.resolve(*coordenadas)
+
+    with database.begin() as conn:
+        identificadores = {}
+        if novas:
+            sequence = conn.execute(text(
+                "SELECT nextval(pg_get_serial_sequence('tartaruga', 'identificador')) "
+                "FROM generate_series(1, :count)"
+            ), {"count": len(novas)}).scalars().all()
+            identificadores = dict(zip(novas, sequence))
+            conn.execute(model.classes.tartaruga.__table__.insert(), [
+                {
+                    "identificador": identificadores[placeholder],
+                    "nome": nome,
+                    "ultimo_encontro": photo.data,
+                    "ultima_imagem_cabeca": originais[positions[id(photo)]],
+                    "cabeca_normalizada": image_store.put(photo.matching),
+                }
+                for placeholder, (nome, photo) in novas.items()
+            ])
+        conn.execute(model.classes.encontro.__table__.insert(), [
+            {
+                "tartaruga_identificador": identificadores.get(turtle, turtle),
+                "latitude": photo.latitude,
+                "longitude": photo.longitude,
+                **coordinate_columns(photo.latitude, photo.longitude),
+                "cidade": lugares[(photo.latitude, photo.longitude)][0],
+                "estado": lugares[(photo.latitude, photo.longitude)][1],
+                "data": photo.data,
+                "imagem_corpo": original,
+                "imagem_cabeca": original,
+                "miniatura_corpo": miniatura,
+                "miniatura_cabeca": miniatura,
+            }
+            for photo, turtle, original, miniatura in zip(photos, turtles, originais, miniaturas)
+        ])
+
+    for placeholder, (nome, photo) in novas.items():
+        name_directory.add(identificadores[placeholder], nome)
+        with head_index_lock:
+            if head_index_loaded:
+                head_index.add(identificadores[placeholder], photo.descritor)
+                if photo.assinatura is not None:
+                    hash_index.add(identificadores[placeholder], photo.assinatura)
+    for label, turtle in labels.items():
+        labels[label] = identificadores.get(turtle, turtle)
+    encontro_counter.invalidate()
+
+
+def import_archive(
+    source,
+    manifest=None,
+    resume=None,
+    batch_size=IMPORT_BATCH_SIZE,
+    workers=IMPORT_WORKERS,
+    defaults=None,
+    progress=None
+):
+    """Import every photo of a directory, zip or tar archive as an encounter.
+
+    Features are extracted on a process pool while the previous batch is
+    resolved and stored; photos listed in the resume file are skipped and the
+    photos of each committed batch are appended to it. Returns the throughput
+    report and status code, so it can also run as a job."""
+    log = ResumeLog(resume)
+    items = list(list_items(source, manifest))
+    pendentes = [item for item in items if item.key not in log]
+    report = {
+        "photos": len(items),
+        "already_imported": len(items) - len(pendentes),
+        "imported": 0,
+        "new_turtles": 0,
+        "by_label": 0,
+        "matched_gallery": 0,
+        "matched_batch": 0,
+        "skipped": {},
+        "label_matches": {},
+        "stages_s": {"extraction_wait": 0.0, "resolution": 0.0, "storage": 0.0},
+    }
+    labels = {}
+    start = time.perf_counter()
+    batches = extract_batches(
+        source,
+        iter(pendentes),
+        batch_size,
+        workers,
+        features=partial(head_features, MATCHER),
+        signature=perceptual_hash if cascade_top_k > 0 else None,
+        defaults=defaults
+    )
+    try:
+        while True:
+            waited = time.perf_counter()
+            batch = next(batches, None)
+            report["stages_s"]["extraction_wait"] += time.perf_counter() - waited
+            if batch is None:
+                break
+
+            photos = []
+            for photo in batch:
+                if photo.skipped is None:
+                    photos.append(photo)
+                else:
+                    report["skipped"][photo.skipped] = report["skipped"].get(photo.skipped, 0) + 1
+            if photos:
+                resolved = time.perf_counter()
+                turtles, novas = resolve_batch(photos, labels, report)
+                stored = time.perf_counter()
+                report["stages_s"]["resolution"] += stored - resolved
+                store_batch(source, photos, turtles, novas, labels)
+                report["stages_s"]["storage"] += time.perf_counter() - stored
+                log.record([photo.item.key for photo in photos])
+                report["imported"] += len(photos)
+                report["new_turtles"] += len(novas)
+            if progress is not None:
+                progress(report)
+    finally:
+        # Otherwise an upload keeps its file open, and its disk space, after
+        # import_upload removes it. Closing the batches stops the extraction
+        # processes, which close their own copies
+        batches.close()
+        close_archive(source)
+
+    elapsed = time.perf_counter() - start
+    report["stages_s"] = {stage: round(seconds, 3) for stage, seconds in report["stages_s"].items()}
+    report["elapsed_s"] = round(elapsed, 3)
+    report["photos_per_s"] = round(report["imported"] / elapsed, 2) if elapsed else 0.0
+    return report, 200
+
+
+def import_upload(archive, defaults):
+    try:
+        return import_archive(archive, defaults=defaults)
+    finally:
+        os.remove(archive)
+
+
+@server.post("/import")
+def import_photos():
+    """Bulk import of a zip or tar archive of photos, sent as the archive
+    form field, as a background job. Optional latitude, longitude and data
+    fields fill in photos without EXIF. Poll /jobs/<job_id> for the report."""
+    upload = request.files.get("archive")
+    if upload is None:
+        return {"error": "Campo archive ausente"}, 400
+
+    os.makedirs(IMPORT_PATH, exist_ok=True)
+    handle, archive = tempfile.mkstemp(
+        suffix=path.splitext(upload.filename or "")[1],
+        dir=IMPORT_PATH
+    )
+    os.close(handle)
+    upload.save(archive)
+    try:
+        source_keys(archive)
+    except (ValueError, OSError):
+        os.remove(archive)
+        return {"error": "Arquivo inválido"}, 400
+
+    defaults = {
+        key: request.form[key]
+        for key in ("latitude", "longitude", "data")
+        if request.form.get(key)
+    }
+    job_id = submission_jobs.submit(import_upload, archive, defaults)
+    return {"job_id": job_id, "status": "queued"}, 202
+
+
+# Zoom levels up to which /encounters/bbox returns clusters instead of points
+CLUSTER_MAX_ZOOM = int(getenv("CLUSTER_MAX_ZOOM", "9"))
+# Largest radius accepted by /encounters/near
+MAX_RADIUS_KM = float(getenv("MAX_RADIUS_KM", "500"))
+
+
+def float_args(*names):
+    """Parse required float query arguments, or return None."""
+    try:
+        return [float(request.args[name]) for name in names]
+    except (KeyError, ValueError):
+        return None
+
+
+def within_bbox(query, bbox):
+    """Restrict an encontro query to a bounding box."""
+    encontro = model.classes.encontro
+    return query.filter(bbox_filter(
+        encontro.longitude_num,
+        encontro.latitude_num,
+        bbox,
+        query.session.get_bind().dialect.name
+    ))
+
+
+def spatial_query(session):
+    return session.query(
+        model.classes.encontro.identificador,
+        model.classes.encontro.latitude_num,
+        model.classes.encontro.longitude_num,
+        model.classes.encontro.cidade,
+        model.classes.encontro.estado,
+        model.classes.encontro.data,
+        model.classes.encontro.tartaruga_identificador,
+        model.classes.tartaruga.nome
+    ).join(
+        model.classes.tartaruga,
+        model.classes.encontro.tartaruga_identificador == model.classes.tartaruga.identificador
+    )
+
+
+def spatial_sample(sample):
+    return {
+        "id": sample.identificador,
+        "latitude": sample.latitude_num,
+        "longitude": sample.longitude_num,
+        "cidade": sample.cidade,
+        "estado": sample.estado,
+        "data": sample.data,
+        "tartaruga_identificador": sample.tartaruga_identificador,
+        "nome": sample.nome,
+    }
+
+
+@server.get("/encounters/bbox")
+def encounters_bbox():
+    """Encounters inside ?south=&west=&north=&east=.
+
+    With ?zoom= at or below CLUSTER_MAX_ZOOM, returns one cluster per
+    geohash cell (count and mean position) instead of the points."""
+    bbox = float_args("south", "west", "north", "east")
+    if bbox is None:
+        return {"error": "Informe south, west, north e east"}, 400
+
+    zoom = int_cursor(request.args.get("zoom"))
+    with sessions.scope() as session:
+        if zoom is not None and zoom <= CLUSTER_MAX_ZOOM:
+            cell = func.substr(model.classes.encontro.geohash, 1, zoom_precision(zoom))
+            results = within_bbox(
+                session.query(
+                    cell.label("geohash"),
+                    func.count(model.classes.encontro.identificador).label("count"),
+                    func.avg(model.classes.encontro.latitude_num).label("latitude"),
+                    func.avg(model.classes.encontro.longitude_num).label("longitude")
+                ),
+                bbox
+            ).group_by(cell).all()
+            return {
+                "Clusters": [
+                    {
+                        "geohash": cluster.geohash,
+                        "count": cluster.count,
+                        "latitude": float(cluster.latitude),
+                        "longitude": float(cluster.longitude),
+                    }
+                    for cluster in results
+                ]
+            }
+
+        results = within_bbox(spatial_query(session), bbox).order_by(
+            model.classes.encontro.identificador.desc()
+        ).limit(page_size(request.args.get("limit"))).all()
+
+    return {
+        "Samples": [spatial_sample(sample) for sample in results]
+    }
+
+
+@server.get("/encounters/near")
+def encounters_near():
+    """Encounters within ?radius_km= (default 10) of ?latitude=&longitude=,
+    closest first."""
+    center = float_args("latitude", "longitude")
+    if center is None:
+        return {"error": "Informe latitude e longitude"}, 400
+    latitude, longitude = center
+    try:
+        radius_km = min(float(request.args.get("radius_km", 10)), MAX_RADIUS_KM)
+    except ValueError:
+        return {"error": "Raio inválido"}, 400
+
+    # Planar distance is enough to rank the candidates in the database
+    scale = math.cos(math.radians(latitude))
+    approximate_distance = (
+        (model.classes.encontro.latitude_num - latitude) * (model.classes.encontro.latitude_num - latitude) +
+        (model.classes.encontro.longitude_num - longitude) * (model.classes.encontro.longitude_num - longitude) * scale * scale
+    )
+    with sessions.scope() as session:
+        results = within_bbox(
+            spatial_query(session),
+            radius_bbox(latitude, longitude, radius_km)
+        ).order_by(approximate_distance).limit(
+            page_size(request.args.get("limit"))
+        ).all()
+
+    samples_list = []
+    for sample in results:
+        distance = haversine_km(latitude, longitude, sample.latitude_num, sample.longitude_num)
+        if distance <= radius_km:
+            samples_list.append({
+                **spatial_sample(sample),
+                "distancia_km": round(distance, 3),
+            })
+    samples_list.sort(key=lambda sample: sample["distancia_km"])
+
+    return {
+        "Samples": samples_list
+    }
+
+
 # Check all samples in database
 @server.get("/samples")
 def log_sample():
+    """List encounters, newest first.
+
+    Pages are selected by keyset with ?cursor=<id of the last row>; the
+    legacy ?offset= is still honoured when no cursor is given. ?count=
+    chooses exact, cached (default), approx or none."""
     samples_list = []
-    with Session(database) as session:
-        results = session.query(
-            model.classes.encontro
-        ).order_by(
-            model.classes.encontro.identificador.desc()
-        ).limit(
-            request.args.get('limit')
-        ).offset(request.args.get('offset')).all()
-        count = session.query(
-            model.classes.encontro
-        ).count()
-
-        for sample in results:
-            samples_list.append({
-                "id": sample.tartaruga_identificador,
-                "latitude": sample.latitude,
-                "longitude": sample.longitude,
-                "cidade": sample.cidade,
-                "estado": sample.estado,
-                "data": sample.data       
-            })
+    with sessions.scope() as session:
+        query = session.query(
+            model.classes.encontro,
+            model.classes.tartaruga.nome
+        ).join(
+            model.classes.tartaruga,
+            model.classes.encontro.tartaruga_identificador == model.classes.tartaruga.identificador
+        ).options(
+            *encontro_image_options()
+        )
+        limit = page_size(request.args.get('limit'))
+        cursor = int_cursor(request.args.get('cursor'))
+        with metrics.span("query"):
+            if cursor is None and request.args.get('offset'):
+                query = query.order_by(
+                    model.classes.encontro.identificador.desc()
+                ).offset(request.args.get('offset'))
+                results, next_cursor = query.limit(limit).all(), None
+                if len(results) == limit:
+                    next_cursor = results[-1][0].identificador
+            else:
+                results, next_cursor = keyset_page(
+                    query,
+                    model.classes.encontro.identificador,
+                    cursor,
+                    limit,
+                    descending=True,
+                    key=lambda row: row[0].identificador
+                )
+        with metrics.span("count"):
+            count = encontro_counter.count(session, request.args.get('count'))
 
-        for sample in samples_list:
-            result = session.query(
-                model.classes.tartaruga.nome
-            ).filter(model.classes.tartaruga.identificador == sample['id']).first()
-            sample['nome'] = result.nome
-            
+        with metrics.span("serialize"):
+            for sample, nome in results:
+                samples_list.append({
+                    "id": sample.tartaruga_identificador,
+                    "latitude": sample.latitude,
+                    "longitude": sample.longitude,
+                    "cidade": sample.cidade,
+                    "estado": sample.estado,
+                    "data": sample.data,
+                    "nome": nome
+                })
 
     return {
         "Samples": samples_list,
-        "Count": count
+        "Count": count,
+        "next_cursor": next_cursor
     }
 
 
 # Get all samples names
 @server.get("/samples-names")
 def samples_names():
-    samples_list = []
-  
-    with Session(database) as session:
-        results = session.query(
-            model.classes.tartaruga
-        ).all()
+    """Turtle names in case and accent insensitive order, from the name directory.
+
+    ?prefix= keeps the names starting with it (autocomplete), and pages
+    follow ?cursor=<last name of the previous page>."""
+    nomes, next_cursor = name_directory.names(
+        page_size(request.args.get('limit')),
+        request.args.get('cursor') or None,
+        request.args.get('prefix')
+    )
 
-    for sample in results:
-        samples_list.append(sample.nome)
-    samples_list.sort()
-    
     return {
-        "nomes": samples_list
+        "nomes": nomes,
+        "next_cursor": next_cursor
     }
 
 
 
-@server.post("/filter-samples")
-def filter_sample():
-    samples_list = []
-    request_data =  request.json
+def filtered_encontros(session, request_data, selected_id):
+    """Encounters matching the /filter-samples criteria, without the images."""
     date_range = request_data['date']
-    selected_name =  request_data['nome']
     selected_city =  request_data['cidade']
     selected_state =  request_data['estado']
 
+    partial_result = session.query(
+        model.classes.encontro
+    ).options(
+        *encontro_image_options()
+    )
 
-    with Session(database) as session:
-
-        partial_result = session.query(model.classes.encontro)
-        result = session.query(
-                model.classes.tartaruga.identificador
-            ).filter(model.classes.tartaruga.nome == selected_name).first()
-
-        if selected_name:
-            partial_result = partial_result.filter(
-                model.classes.encontro.tartaruga_identificador == result.identificador
-            )
+    if selected_id is not None:
+        partial_result = partial_result.filter(
+            model.classes.encontro.tartaruga_identificador == selected_id
+        )
 
-        if date_range:
-            if len(date_range) == 2:
-                first_date = date_range[0]
-                last_date = date_range[1]
-                if first_date:
-                    partial_result = partial_result.filter(
-                        model.classes.encontro.data.between(first_date, last_date)
-                    )
-                else:
-                    partial_result = partial_result.filter(
-                        model.classes.encontro.data <= date_range[1]
-                    )
+    if date_range:
+        if len(date_range) == 2:
+            first_date = date_range[0]
+            last_date = date_range[1]
+            if first_date:
+                partial_result = partial_result.filter(
+                    model.classes.encontro.data.between(first_date, last_date)
+                )
             else:
                 partial_result = partial_result.filter(
-                    model.classes.encontro.data == date_range[0]
+                    model.classes.encontro.data <= date_range[1]
                 )
-        if selected_city:
-            partial_result = partial_result.filter(
-                model.classes.encontro.cidade == selected_city
-            )
-        if selected_state:
+        else:
             partial_result = partial_result.filter(
-                model.classes.encontro.estado == selected_state
+                model.classes.encontro.data == date_range[0]
             )
+    if selected_city:
+        partial_result = partial_result.filter(
+            model.classes.encontro.cidade == selected_city
+        )
+    if selected_state:
+        partial_result = partial_result.filter(
+            model.classes.encontro.estado == selected_state
+        )
+    return partial_result
 
 
-        results = partial_result.all()
+def filtered_summary(sample):
+    return {
+        "id": sample.identificador,
+        "latitude": sample.latitude,
+        "cidade" :sample.cidade,
+        "estado": sample.estado,
+        "longitude": sample.longitude,
+        "tartaruga_identificador": sample.tartaruga_identificador,
+        **encontro_image_urls(sample.identificador),
+        "data": sample.data,
+        "nome": name_directory.name_of(sample.tartaruga_identificador)
+    }
 
-        for sample in results:
-            samples_list.append({
-                "id": sample.identificador,
-                "latitude": sample.latitude,
-                "cidade" :sample.cidade,
-                "estado": sample.estado,
-                "longitude": sample.longitude,
-                "tartaruga_identificador": sample.tartaruga_identificador,
-                "imagem_corpo": f"{sample.imagem_corpo}",
-                "imagem_cabeca": f"{sample.imagem_cabeca}",
-                "data": sample.data   
-            })
 
-        for sample in samples_list:
-            result = session.query(
-                model.classes.tartaruga.nome
-            ).filter(model.classes.tartaruga.identificador == sample['tartaruga_identificador']).first()
-            sample['nome'] = result.nome
-        
+@server.post("/filter-samples")
+def filter_sample():
+    """One page of the encounters matching the filters, following
+    ?cursor=<next_cursor of the previous page>; ?stream=json|ndjson streams
+    all of them while they are fetched."""
+    request_data =  request.json
+    selected_name =  request_data['nome']
+    cursor = int_cursor(request.args.get('cursor'))
+    mode = stream_mode(request.args.get('stream'))
+
+    selected_id = None
+    if selected_name:
+        selected_id = name_directory.id_of(selected_name)
+        if selected_id is None:
+            if mode is not None:
+                return stream_response(iter(()), mode)
+            return {
+                "Samples": [],
+                "next_cursor": None,
+            }
+
+    if mode is not None:
+        def rows():
+            with sessions.scope() as session:
+                query = filtered_encontros(session, request_data, selected_id)
+                for sample in stream_query(query):
+                    yield filtered_summary(sample)
+        return stream_response(rows(), mode)
+
+    with sessions.scope() as session:
+        with metrics.span("query"):
+            results, next_cursor = keyset_page(
+                filtered_encontros(session, request_data, selected_id),
+                model.classes.encontro.identificador,
+                cursor,
+                page_size(request.args.get('limit'))
+            )
+        with metrics.span("serialize"):
+            samples_list = [filtered_summary(sample) for sample in results]
+
     return {
         "Samples": samples_list,
-        # "Nome": result.nome
+        "next_cursor": next_cursor,
+    }
+
+
+# Encounter statistics, read from the summaries that 0007_estatisticas keeps
+# up to date on every write. ?source=encontro aggregates encontro instead,
+# which costs a scan of the whole history but checks the summaries
+def stats_from_encontro():
+    return request.args.get("source") == "encontro"
+
+
+def parse_month(value):
+    """First day of a YYYY-MM month, None when absent; raises ValueError."""
+    if not value:
+        return None
+    return dt.date.fromisoformat(f"{value}-01")
+
+
+@server.get("/stats")
+def stats_overview():
+    """Encounters, turtles seen, cities and states."""
+    encontro = model.classes.encontro
+    local = model.classes.estatistica_local
+    with sessions.scope() as session, metrics.span("query"):
+        if stats_from_encontro():
+            row = session.query(
+                func.count(encontro.identificador).label("encontros"),
+                func.count(func.distinct(encontro.tartaruga_identificador)).label("tartarugas"),
+                func.count(func.distinct(func.concat(encontro.estado, "/", encontro.cidade))).label("cidades"),
+                func.count(func.distinct(encontro.estado)).label("estados")
+            ).one()
+            totals = dict(row._mapping)
+        else:
+            totals = {
+                "encontros": session.query(
+                    func.coalesce(func.sum(model.classes.estatistica_mes.encontros), 0)
+                ).scalar(),
+                "tartarugas": session.query(model.classes.estatistica_tartaruga).filter(
+                    model.classes.estatistica_tartaruga.encontros > 0
+                ).count(),
+                "cidades": session.query(local).filter(local.encontros > 0).count(),
+                "estados": session.query(func.count(func.distinct(local.estado))).filter(
+                    local.encontros > 0
+                ).scalar(),
+            }
+    return {key: int(value) for key, value in totals.items()}
+
+
+@server.get("/stats/estados")
+def stats_states():
+    """Encounters per state, most first."""
+    if stats_from_encontro():
+        estado = model.classes.encontro.estado
+        encontros = func.count(model.classes.encontro.identificador)
+    else:
+        estado = model.classes.estatistica_local.estado
+        encontros = func.sum(model.classes.estatistica_local.encontros)
+    with sessions.scope() as session, metrics.span("query"):
+        results = session.query(estado, encontros.label("encontros")).group_by(
+            estado
+        ).having(encontros > 0).order_by(encontros.desc(), estado).all()
+    return {
+        "Stats": [
+            {"estado": row[0], "encontros": int(row.encontros)}
+            for row in results
+        ]
+    }
+
+
+@server.get("/stats/cidades")
+def stats_cities():
+    """Encounters per city, most first, optionally of one ?estado=."""
+    if stats_from_encontro():
+        table = model.classes.encontro
+        encontros = func.count(table.identificador)
+    else:
+        table = model.classes.estatistica_local
+        encontros = func.sum(table.encontros)
+    with sessions.scope() as session, metrics.span("query"):
+        query = session.query(table.estado, table.cidade, encontros.label("encontros"))
+        if request.args.get("estado"):
+            query = query.filter(table.estado == request.args["estado"])
+        results = query.group_by(table.estado, table.cidade).having(
+            encontros > 0
+        ).order_by(encontros.desc(), table.estado, table.cidade).limit(
+            page_size(request.args.get("limit"))
+        ).all()
+    return {
+        "Stats": [
+            {"estado": row.estado, "cidade": row.cidade, "encontros": int(row.encontros)}
+            for row in results
+        ]
+    }
+
+
+@server.get("/stats/tartarugas")
+def stats_turtles():
+    """Encounters, first and last sighting per turtle, most seen first."""
+    if stats_from_encontro():
+        encontro = model.classes.encontro
+        tartaruga_identificador = encontro.tartaruga_identificador
+        encontros = func.count(encontro.identificador)
+        primeiro = func.min(encontro.data)
+        ultimo = func.max(encontro.data)
+    else:
+        resumo = model.classes.estatistica_tartaruga
+        tartaruga_identificador = resumo.tartaruga_identificador
+        encontros = func.sum(resumo.encontros)
+        primeiro = func.min(resumo.primeiro_encontro)
+        ultimo = func.max(resumo.ultimo_encontro)
+    with sessions.scope() as session, metrics.span("query"):
+        results = session.query(
+            tartaruga_identificador.label("id"),
+            encontros.label("encontros"),
+            primeiro.label("primeiro_encontro"),
+            ultimo.label("ultimo_encontro")
+        ).group_by(tartaruga_identificador).having(encontros > 0).order_by(
+            encontros.desc(), tartaruga_identificador
+        ).limit(page_size(request.args.get("limit"))).all()
+    return {
+        "Stats": [
+            {
+                "id": row.id,
+                "nome": name_directory.name_of(row.id),
+                "encontros": int(row.encontros),
+                "primeiro_encontro": row.primeiro_encontro,
+                "ultimo_encontro": row.ultimo_encontro,
+            }
+            for row in results
+        ]
+    }
+
+
+@server.get("/stats/meses")
+def stats_months():
+    """Encounters per month (YYYY-MM), oldest first, optionally between
+    ?inicio= and ?fim= (both YYYY-MM, inclusive)."""
+    try:
+        inicio = parse_month(request.args.get("inicio"))
+        fim = parse_month(request.args.get("fim"))
+    except ValueError:
+        return {"error": "Mês inválido, use AAAA-MM"}, 400
+
+    if stats_from_encontro():
+        mes = func.date_trunc("month", model.classes.encontro.data)
+        encontros = func.count(model.classes.encontro.identificador)
+    else:
+        mes = model.classes.estatistica_mes.mes
+        encontros = func.sum(model.classes.estatistica_mes.encontros)
+    with sessions.scope() as session, metrics.span("query"):
+        query = session.query(mes.label("mes"), encontros.label("encontros"))
+        if inicio is not None:
+            query = query.filter(mes >= inicio)
+        if fim is not None:
+            query = query.filter(mes <= fim)
+        results = query.group_by(mes).having(encontros > 0).order_by(mes).all()
+    return {
+        "Stats": [
+            {"mes": row.mes.strftime("%Y-%m"), "encontros": int(row.encontros)}
+            for row in results
+        ]
     }
@@ -1,39 +1,49 @@
 import cv2 
-import matplotlib.pyplot as plt
-from imageio import imread
 import numpy as np
 import io
-import base64
+from typing import NamedTuple
 from .image_treatment import automatic_brightness_and_contrast
+from .descriptor_index import hu_distances
 from PIL import Image
 
+class HeadFeatures(NamedTuple):
+    """ Resultado do pré-processamento de uma imagem de cabeça. """
+
+    edges: np.ndarray
+    hu_moments: np.ndarray
+
+
+def preprocess_head(img):
+    """ Aplica o pré-processamento (brilho, blur, threshold e Canny)
+        sobre os bytes de uma imagem e calcula os momentos de Hu do mapa
+        de bordas, que é exatamente o que o cv2.matchShapes compara. """
+
+    img = np.asarray(Image.open(io.BytesIO(img)))
+    img = automatic_brightness_and_contrast(img)
+
+    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    img_gray = cv2.GaussianBlur(img_gray, (11, 11), 0)
+    t, img_gray = cv2.threshold(img_gray, 150, 255, cv2.THRESH_BINARY)
+
+    med_val = np.median(img_gray)
+    lower = int(max(0, 0.7*med_val))
+    upper = int(min(255, 1.3*med_val))
+    edges = cv2.Canny(img_gray, lower, upper)
+    return HeadFeatures(edges, cv2.HuMoments(cv2.moments(edges)).ravel())
+
+
+def compare(features1, features2):
+    """ Distância CONTOURS_MATCH_I2 entre duas cabeças já pré-processadas,
+        igual à do cv2.matchShapes sobre os mapas de bordas. """
+
+    return float(hu_distances(features1.hu_moments, features2.hu_moments[np.newaxis])[0])
+
+
 def contour_matching(img1, img2):
     """ Realiza o matching entre duas imagens a partir 
         da identificação dos contornos. """
-    
-    img1 = np.asarray(Image.open(io.BytesIO(base64.decodebytes(img1))))
-    img2 = np.asarray(Image.open(io.BytesIO(base64.decodebytes(img2))))
-
-    img1 = automatic_brightness_and_contrast(img1)
-    img2 = automatic_brightness_and_contrast(img2)
-
-    img_gray1 = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
-    img_gray2 = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
-    img_gray1=cv2.GaussianBlur(img_gray1, (11, 11), 0)
-    img_gray2=cv2.GaussianBlur(img_gray2, (11, 11), 0)
-    t, img_gray1=cv2.threshold(img_gray1, 150, 255, cv2.THRESH_BINARY)
-    t, img_gray2=cv2.threshold(img_gray2, 150, 255, cv2.THRESH_BINARY)
-
-
-    med_val1 = np.median(img_gray1)
-    med_val2 = np.median(img_gray2)
-    lower1 = int(max(0 ,0.7*med_val1))
-    upper1 = int(min(255,1.3*med_val1))
-    lower2 = int(max(0 ,0.7*med_val2))
-    upper2 = int(min(255,1.3*med_val2))
-    edges1 = cv2.Canny(img_gray1, lower1, upper1)
-    edges2 = cv2.Canny(img_gray2, lower2, upper2)
-    d2=cv2.matchShapes(edges1, edges2, cv2.CONTOURS_MATCH_I2, 0)
+
+    d2 = compare(preprocess_head(img1), preprocess_head(img2))
     # FLAN_INDEX_KDTREE = 1
     # index_params = dict(algorithm = FLAN_INDEX_KDTREE, trees=5)
     # search_params = dict(checks=50)
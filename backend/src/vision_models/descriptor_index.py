@@ -0,0 +1,86 @@
+import threading
+
+import numpy as np
+
+# Mesmo epsilon usado internamente pelo cv2.matchShapes
+HU_EPS = 1.e-5
+
+
+def hu_log_scale(moments):
+    """ Converte momentos de Hu para a escala sign(h) * log10(|h|) usada
+        pelo cv2.matchShapes. Retorna os valores e a máscara dos
+        momentos grandes o suficiente para entrar na comparação. """
+
+    moments = np.asarray(moments, dtype=np.float64)
+    absolute = np.abs(moments)
+    mask = absolute > HU_EPS
+    scaled = np.zeros_like(moments)
+    scaled[mask] = np.sign(moments[mask]) * np.log10(absolute[mask])
+    return scaled, mask
+
+
+def hu_distances(query, moments):
+    """ Distância CONTOURS_MATCH_I2 entre um vetor de momentos de Hu e
+        cada linha de uma matriz Nx7, calculada de uma só vez. """
+
+    query_scaled, query_mask = hu_log_scale(query)
+    scaled, mask = hu_log_scale(moments)
+    distances = np.where(mask & query_mask, np.abs(scaled - query_scaled), 0.0).sum(axis=1)
+
+    # O matchShapes considera incompatível uma forma vazia contra uma não vazia
+    query_any = np.any(np.asarray(query) != 0)
+    moments_any = np.any(np.asarray(moments) != 0, axis=1)
+    distances[moments_any != query_any] = np.inf
+    return distances
+
+
+class HuMomentsIndex:
+    """ Índice em memória dos momentos de Hu das cabeças de cada
+        tartaruga, para não reprocessar as imagens a cada busca. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.identificadores = np.empty(0, dtype=np.int64)
+        self.moments = np.empty((0, 7), dtype=np.float64)
+
+    def __len__(self):
+        return len(self.identificadores)
+
+    def __contains__(self, identificador):
+        return bool(np.any(self.identificadores == identificador))
+
+    def add(self, identificador, moments):
+        """ Insere (ou substitui) o descritor de uma tartaruga. """
+
+        moments = np.asarray(moments, dtype=np.float64).reshape(1, 7)
+        with self._lock:
+            position = np.flatnonzero(self.identificadores == identificador)
+            if len(position):
+                self.moments[position[0]] = moments
+                return
+            self.identificadores = np.append(self.identificadores, identificador)
+            self.moments = np.vstack([self.moments, moments])
+
+    def snapshot(self):
+        """ Identificadores e momentos atuais, consistentes entre si. """
+
+        with self._lock:
+            return self.identificadores, self.moments
+
+    def best_match(self, moments, threshold, candidatos=None):
+        """ Retorna o identificador mais próximo com distância menor ou
+            igual ao threshold, ou None se nenhum candidato servir. Com
+            candidatos, só esses identificadores são comparados. """
+
+        identificadores, candidates = self.snapshot()
+        if candidatos is not None:
+            mask = np.isin(identificadores, candidatos)
+            identificadores, candidates = identificadores[mask], candidates[mask]
+        if len(identificadores) == 0:
+            return None
+
+        distances = hu_distances(moments, candidates)
+        idx = np.argmin(distances)
+        if distances[idx] > threshold:
+            return None
+        return int(identificadores[idx])
@@ -0,0 +1,82 @@
+import io
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+
+# Número de bits 1 de cada byte, para a distância de Hamming vetorizada
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def perceptual_hash(img):
+    """ Hash perceptual (pHash) de 64 bits dos bytes de uma imagem: os
+        coeficientes de baixa frequência da DCT comparados com a mediana.
+        Imagens parecidas ficam a poucos bits de distância. """
+
+    image = Image.open(io.BytesIO(img))
+    # Só 32x32 pixels são usados, então o JPEG pode ser decodificado reduzido
+    image.draft("L", (4 * HASH_SIZE * 2, 4 * HASH_SIZE * 2))
+    image = image.convert("L").resize((4 * HASH_SIZE, 4 * HASH_SIZE), Image.LANCZOS)
+
+    dct = cv2.dct(np.asarray(image, dtype=np.float32))
+    low = dct[:HASH_SIZE, :HASH_SIZE].ravel()
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distances(query, hashes):
+    """ Distância de Hamming entre um hash e cada elemento de um vetor
+        de hashes uint64, calculada de uma só vez. """
+
+    xor = np.bitwise_xor(hashes, np.uint64(query))
+    return POPCOUNT[xor.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+
+class HashIndex:
+    """ Índice em memória dos hashes perceptuais das cabeças, usado como
+        primeiro estágio barato da busca: seleciona os K candidatos mais
+        próximos para só eles passarem pelo matcher completo. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.identificadores = np.empty(0, dtype=np.int64)
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.identificadores)
+
+    def __contains__(self, identificador):
+        return bool(np.any(self.identificadores == identificador))
+
+    def add(self, identificador, hash_value):
+        """ Insere (ou substitui) o hash de uma tartaruga. """
+
+        with self._lock:
+            position = np.flatnonzero(self.identificadores == identificador)
+            if len(position):
+                self.hashes[position[0]] = hash_value
+                return
+            self.identificadores = np.append(self.identificadores, identificador)
+            self.hashes = np.append(self.hashes, np.uint64(hash_value))
+
+    def shortlist(self, hash_value, k, max_distance=None):
+        """ Identificadores dos k hashes mais próximos, do mais próximo
+            ao mais distante, descartando os acima de max_distance. """
+
+        with self._lock:
+            identificadores, hashes = self.identificadores, self.hashes
+        if len(identificadores) == 0:
+            return identificadores
+
+        distances = hamming_distances(hash_value, hashes)
+        if k < len(distances):
+            nearest = np.argpartition(distances, k)[:k]
+        else:
+            nearest = np.arange(len(distances))
+        nearest = nearest[np.argsort(distances[nearest], kind="stable")]
+        if max_distance is not None:
+            nearest = nearest[distances[nearest] <= max_distance]
+        return identificadores[nearest]
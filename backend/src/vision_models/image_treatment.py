@@ -1,42 +1,35 @@
 import cv2
-import matplotlib.pyplot as plt
 import numpy as np
 import math
 
 # Code from https://stackoverflow.com/questions/56905592/automatic-contrast-and-brightness-adjustment-of-a-color-photo-of-a-sheet-of-pape
 
+def _clip_scale(accumulator, clip_hist_percent):
+    """Find alpha and beta from the cumulative histogram(s) in the last axis."""
+    # Locate points to clip
+    maximum = accumulator[..., -1:]
+    clip = clip_hist_percent * (maximum / 100.0) / 2.0
+
+    # Left cut is the first bin reaching the clip, right cut the last bin
+    # still below the top clip
+    minimum_gray = np.sum(accumulator < clip, axis=-1)
+    maximum_gray = np.sum(accumulator < (maximum - clip), axis=-1) - 1
+
+    # Calculate alpha and beta values
+    alpha = 255 / (maximum_gray - minimum_gray)
+    beta = -minimum_gray * alpha
+    return alpha, beta
+
 #  Automatic brightness and contrast optimization with optional histogram clipping
 def automatic_brightness_and_contrast(image, clip_hist_percent=1):
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     
     # Calculate grayscale histogram
     hist = cv2.calcHist([gray],[0],None,[256],[0,256])
-    hist_size = len(hist)
     
     # Calculate cumulative distribution from the histogram
-    accumulator = []
-    accumulator.append(float(hist[0]))
-    for index in range(1, hist_size):
-        accumulator.append(accumulator[index -1] + float(hist[index]))
-    
-    # Locate points to clip
-    maximum = accumulator[-1]
-    clip_hist_percent *= (maximum/100.0)
-    clip_hist_percent /= 2.0
-    
-    # Locate left cut
-    minimum_gray = 0
-    while accumulator[minimum_gray] < clip_hist_percent:
-        minimum_gray += 1
-    
-    # Locate right cut
-    maximum_gray = hist_size -1
-    while accumulator[maximum_gray] >= (maximum - clip_hist_percent):
-        maximum_gray -= 1
-    
-    # Calculate alpha and beta values
-    alpha = 255 / (maximum_gray - minimum_gray)
-    beta = -minimum_gray * alpha
+    accumulator = np.cumsum(hist.ravel(), dtype=np.float64)
+    alpha, beta = _clip_scale(accumulator, clip_hist_percent)
     
     '''
     # Calculate new histogram with desired range and show histogram 
@@ -47,5 +40,30 @@ def automatic_brightness_and_contrast(image, clip_hist_percent=1):
     plt.show()
     '''
 
-    auto_result = cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
-    return auto_result
\ No newline at end of file
+    auto_result = cv2.convertScaleAbs(image, alpha=float(alpha), beta=float(beta))
+    return auto_result
+
+#  Same as above for a stack of equally sized images (N, H, W, 3)
+def automatic_brightness_and_contrast_batch(images, clip_hist_percent=1):
+    images = np.asarray(images)
+    n, height = images.shape[:2]
+
+    # Convert the whole stack at once by treating it as one tall image
+    gray = cv2.cvtColor(
+        np.ascontiguousarray(images.reshape(n * height, *images.shape[2:])),
+        cv2.COLOR_BGR2GRAY
+    ).reshape(n, height, -1)
+
+    # One 256-bin histogram per image
+    hist = np.stack([
+        cv2.calcHist([g],[0],None,[256],[0,256]).ravel()
+        for g in gray
+    ])
+
+    accumulator = np.cumsum(hist, axis=1, dtype=np.float64)
+    alpha, beta = _clip_scale(accumulator, clip_hist_percent)
+
+    return np.stack([
+        cv2.convertScaleAbs(image, alpha=float(a), beta=float(b))
+        for image, a, b in zip(images, alpha, beta)
+    ])
@@ -0,0 +1,131 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .contour_recognition import preprocess_head
+from .descriptor_index import HuMomentsIndex, hu_distances
+from .sift_index import SiftIndex
+from .sift_recognition import preprocess_sift
+
+
+def head_features(matcher, imagem_cabeca):
+    """ Descritor de uma imagem de cabeça para o matcher escolhido. """
+
+    if matcher == "sift":
+        return preprocess_sift(imagem_cabeca)
+    return preprocess_head(imagem_cabeca).hu_moments
+
+
+def hu_shard_best_match(descritor, identificadores, moments):
+    """ Melhor candidato (distância, identificador) de um shard do
+        índice de momentos de Hu. """
+
+    if len(identificadores) == 0:
+        return None
+    distances = hu_distances(descritor, moments)
+    idx = np.argmin(distances)
+    return float(distances[idx]), int(identificadores[idx])
+
+
+# Índices SIFT persistidos já mapeados neste processo worker
+_sift_indexes = {}
+
+
+def sift_slice_votes(path, descritores):
+    """ Votos de uma fatia dos descritores da consulta contra o índice SIFT
+        persistido inteiro. Cada worker mapeia o índice uma vez e só
+        reconstrói o matcher quando o índice em disco cresce. """
+
+    index = _sift_indexes.get(path)
+    if index is None:
+        index = _sift_indexes[path] = SiftIndex(path)
+    else:
+        index.sync()
+    return index.votes(descritores)
+
+
+class RecognitionPool:
+    """ Pool de processos para o reconhecimento, fora da thread do Flask.
+        Com momentos de Hu, os candidatos são divididos em shards e cada
+        worker devolve o melhor do seu shard. Com SIFT, são os descritores
+        da consulta que se dividem: o ratio test precisa dos dois vizinhos
+        mais próximos na galeria inteira, então cada worker busca a sua
+        fatia no índice completo. O pool junta os resultados. """
+
+    def __init__(self, workers, shards=None):
+        self.workers = workers
+        self.shards = shards or workers
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        # Start the workers right away, while the server has no other threads
+        # to be copied into the forked processes
+        self.executor.submit(int).result()
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, fn, *args):
+        """ Envia uma tarefa ao pool, contabilizando a fila. """
+
+        with self._lock:
+            self._pending += 1
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def status(self):
+        with self._lock:
+            pending = self._pending
+        return {
+            "workers": self.workers,
+            "shards": self.shards,
+            "pending": pending,
+        }
+
+    def head_features_many(self, matcher, imagens):
+        futures = [self.submit(head_features, matcher, img) for img in imagens]
+        return [future.result() for future in futures]
+
+    def best_match(self, index, descritor, threshold):
+        """ Mesmo resultado de index.best_match, mas com os candidatos
+            espalhados entre os workers. """
+
+        if isinstance(index, HuMomentsIndex):
+            identificadores, moments = index.snapshot()
+            futures = [
+                self.submit(hu_shard_best_match, descritor, ids, shard)
+                for ids, shard in zip(
+                    np.array_split(identificadores, self.shards),
+                    np.array_split(moments, self.shards)
+                )
+            ]
+            results = [r for r in (f.result() for f in futures) if r is not None]
+            if not results:
+                return None
+            distance, identificador = min(results)
+            return identificador if distance <= threshold else None
+
+        if isinstance(index, SiftIndex) and index.path is not None:
+            if descritor is None or len(descritor) == 0:
+                return None
+            futures = [
+                self.submit(sift_slice_votes, index.path, fatia)
+                for fatia in np.array_split(descritor, min(self.shards, len(descritor)))
+            ]
+            votes = {}
+            for future in futures:
+                for identificador, count in future.result().items():
+                    votes[identificador] = votes.get(identificador, 0) + count
+            if not votes:
+                return None
+            # Na ordem dos identificadores, para desempatar como index.votes
+            votes = dict(sorted(votes.items()))
+            identificador = max(votes, key=votes.get)
+            return identificador if votes[identificador] >= threshold else None
+
+        # Índice SIFT apenas em memória: não há como compartilhá-lo
+        return index.best_match(descritor, threshold)
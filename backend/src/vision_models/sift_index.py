@@ -0,0 +1,239 @@
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+SIFT_DIMENSIONS = 128
+DESCRIPTORS_FILE = "descriptors.f32"
+LABELS_FILE = "labels.i64"
+LOCK_FILE = "index.lock"
+
+
+class SiftIndex:
+    """ Índice FLANN (KD-tree) único sobre os descritores SIFT de todas as
+        tartarugas conhecidas. Os descritores ficam em dois arquivos
+        binários (float32 Mx128 e int64 M) que são abertos com np.memmap
+        e só crescem com novas inserções. Vários processos podem dividir
+        os arquivos: as escritas são serializadas por um flock e cada
+        processo carrega com sync() as linhas que os outros acrescentaram. """
+
+    def __init__(self, path=None, trees=5, checks=50, ratio=0.7):
+        self.path = path
+        self.index_params = dict(algorithm=1, trees=trees)
+        self.search_params = dict(checks=checks)
+        self.ratio = ratio
+
+        self._lock = threading.Lock()
+        self._matcher = None
+        self._descriptors = np.empty((0, SIFT_DIMENSIONS), dtype=np.float32)
+        self._labels = np.empty(0, dtype=np.int64)
+        # Inserções em memória ainda não concatenadas aos arrays
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self.identificadores = set()
+        self._persisted = 0
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+
+    def _consolidate(self):
+        """ Concatena de uma vez os blocos acrescentados em memória, para
+            que montar o índice com N inserções não custe O(N²). """
+
+        with self._pending_lock:
+            if self._pending:
+                chunks, self._pending = self._pending, []
+                self._descriptors = np.concatenate([self._descriptors] + [d for d, _ in chunks])
+                self._labels = np.concatenate([self._labels] + [l for _, l in chunks])
+
+    @property
+    def descriptors(self):
+        self._consolidate()
+        return self._descriptors
+
+    @descriptors.setter
+    def descriptors(self, descriptors):
+        self._descriptors = descriptors
+
+    @property
+    def labels(self):
+        self._consolidate()
+        return self._labels
+
+    @labels.setter
+    def labels(self, labels):
+        self._labels = labels
+
+    def __len__(self):
+        return len(self.identificadores)
+
+    def __contains__(self, identificador):
+        return identificador in self.identificadores
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _file_lock(self):
+        """ Trava exclusiva, entre processos, sobre os dois arquivos. """
+
+        with open(self._file(LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _rows(self):
+        """ Linhas completas nos dois arquivos, sem uma escrita interrompida. """
+
+        descriptors_path = self._file(DESCRIPTORS_FILE)
+        labels_path = self._file(LABELS_FILE)
+        if not (os.path.exists(descriptors_path) and os.path.exists(labels_path)):
+            return 0
+
+        row_size = SIFT_DIMENSIONS * np.dtype(np.float32).itemsize
+        return min(
+            os.path.getsize(descriptors_path) // row_size,
+            os.path.getsize(labels_path) // np.dtype(np.int64).itemsize
+        )
+
+    def _map(self, rows):
+        """ Mapeia as primeiras rows linhas dos arquivos, incluindo as que
+            outros processos acrescentaram desde o último mapeamento. """
+
+        if rows <= self._persisted:
+            return
+        self.descriptors = np.memmap(
+            self._file(DESCRIPTORS_FILE), dtype=np.float32, mode="r", shape=(rows, SIFT_DIMENSIONS)
+        )
+        self.labels = np.memmap(self._file(LABELS_FILE), dtype=np.int64, mode="r", shape=(rows,))
+        self.identificadores.update(np.unique(self.labels[self._persisted:]).tolist())
+        self._persisted = rows
+        self._matcher = None
+
+    def _load(self):
+        """ Mapeia os arquivos do disco, descartando uma escrita incompleta. """
+
+        with self._file_lock():
+            self._map(self._rows())
+
+    def sync(self):
+        """ Carrega as tartarugas que outros processos gravaram nos arquivos. """
+
+        if self.path is None:
+            return
+        with self._lock, self._file_lock():
+            self._map(self._rows())
+
+    def add(self, identificador, descriptors):
+        """ Acrescenta os descritores de uma tartaruga ao índice (e ao disco). """
+
+        with self._lock:
+            if descriptors is None or len(descriptors) == 0:
+                self.identificadores.add(identificador)
+                return
+
+            descriptors = np.ascontiguousarray(descriptors, dtype=np.float32)
+            labels = np.full(len(descriptors), identificador, dtype=np.int64)
+            if self.path is None:
+                if identificador in self.identificadores:
+                    return
+                self.identificadores.add(identificador)
+                with self._pending_lock:
+                    self._pending.append((descriptors, labels))
+                self._matcher = None
+                return
+
+            with self._file_lock():
+                rows = self._rows()
+                self._map(rows)
+                # Outro processo já gravou esta tartaruga
+                if identificador in self.identificadores:
+                    return
+                # Descarta a sobra de uma escrita interrompida, para que as
+                # linhas dos dois arquivos continuem alinhadas
+                for name, dtype, width in (
+                    (DESCRIPTORS_FILE, np.float32, SIFT_DIMENSIONS),
+                    (LABELS_FILE, np.int64, 1),
+                ):
+                    with open(self._file(name), "ab") as file:
+                        file.truncate(rows * width * np.dtype(dtype).itemsize)
+                with open(self._file(DESCRIPTORS_FILE), "ab") as file:
+                    file.write(descriptors.tobytes())
+                with open(self._file(LABELS_FILE), "ab") as file:
+                    file.write(labels.tobytes())
+                self._map(rows + len(labels))
+
+    def _subset(self, mask, identificadores):
+        subset = SiftIndex(
+            trees=self.index_params["trees"],
+            checks=self.search_params["checks"],
+            ratio=self.ratio
+        )
+        subset.descriptors = np.ascontiguousarray(self.descriptors[mask])
+        subset.labels = np.asarray(self.labels[mask])
+        subset.identificadores = identificadores
+        return subset
+
+    def subset(self, candidatos):
+        """ Cópia em memória só com as tartarugas candidatas. """
+
+        candidatos = np.asarray(candidatos, dtype=np.int64)
+        return self._subset(
+            np.isin(self.labels, candidatos),
+            self.identificadores & set(candidatos.tolist())
+        )
+
+    def _get_matcher(self):
+        """ Reconstrói o matcher FLANN apenas quando o índice mudou. """
+
+        with self._lock:
+            if self._matcher is None and len(self.descriptors) >= 2:
+                matcher = cv2.FlannBasedMatcher(self.index_params, self.search_params)
+                matcher.add([np.ascontiguousarray(self.descriptors)])
+                # A kd-tree do FLANN é sorteada: com a semente fixa, o mesmo
+                # índice dá os mesmos votos em qualquer processo do pool
+                cv2.setRNGSeed(0)
+                matcher.train()
+                self._matcher = (matcher, self.labels)
+            return self._matcher
+
+    def votes(self, descriptors):
+        """ Faz um único knnMatch contra toda a população e conta, por
+            tartaruga, os matches que passam no ratio test. """
+
+        built = self._get_matcher()
+        if built is None or descriptors is None or len(descriptors) == 0:
+            return {}
+        matcher, labels = built
+
+        matches = matcher.knnMatch(np.asarray(descriptors, dtype=np.float32), k=2)
+        good = [
+            m[0].trainIdx for m in matches
+            if len(m) == 2 and m[0].distance < self.ratio * m[1].distance
+        ]
+        if not good:
+            return {}
+
+        identificadores, counts = np.unique(labels[good], return_counts=True)
+        return dict(zip(identificadores.tolist(), counts.tolist()))
+
+    def best_match(self, descriptors, threshold, candidatos=None):
+        """ Retorna a tartaruga mais votada se tiver pelo menos threshold
+            matches, ou None. Com candidatos, a votação é feita num índice
+            só com os descritores dessas tartarugas. """
+
+        if candidatos is not None:
+            return self.subset(candidatos).best_match(descriptors, threshold)
+        votes = self.votes(descriptors)
+        if not votes:
+            return None
+        identificador = max(votes, key=votes.get)
+        if votes[identificador] < threshold:
+            return None
+        return identificador
@@ -1,6 +1,7 @@
 import cv2 
-import matplotlib.pyplot as plt
 import numpy as np
+import io
+from PIL import Image
 
 from .image_treatment import automatic_brightness_and_contrast
 
@@ -16,6 +17,14 @@ def sift_feature_detection(img1):
     return descriptors1
 
 
+def preprocess_sift(img):
+    """ Decodifica os bytes de uma imagem e extrai seus descritores SIFT
+        para consulta no SiftIndex. """
+
+    img = np.asarray(Image.open(io.BytesIO(img)).convert("RGB"))
+    return sift_feature_detection(img)
+
+
 def flann_feature_matching(img1_descriptors, img2_descriptors):
     """ Com base nos descritores do SIFT de duas imagens, utilizar 
         o FLANN para compara-las. """
@@ -0,0 +1,19 @@
+"""
+WSGI entry point for production servers:
+
+    gunicorn -c src/gunicorn.conf.py --chdir src wsgi:application
+
+Importing it loads everything the workers can share: the migrated and
+reflected schema and, unless PRELOAD_INDEX=0, the recognition index.
+"""
+from os import getenv
+
+from server import database, load_head_index, server
+
+if getenv("PRELOAD_INDEX", "1") == "1":
+    load_head_index()
+
+# The connections used while loading stay with this process
+database.dispose()
+
+application = server
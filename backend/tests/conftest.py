@@ -0,0 +1,53 @@
+"""
+Shared test setup: the backend modules are imported from src, like the
+server and the benchmarks do. Tests that need the database use the one of
+the SQL_* variables, in a scratch schema dropped when they end, and are
+skipped without it.
+"""
+import os
+import sys
+from os import path
+
+import pytest
+
+SRC_DIR = path.join(path.dirname(path.abspath(__file__)), "..", "src")
+IMAGES_DIR = path.join(SRC_DIR, "..", "..", "notebooks", "imgs")
+BASELINE_SQL = path.join(SRC_DIR, "..", "..", "database", "create_db.sql")
+TEST_SCHEMA = "backend_tests"
+
+sys.path.insert(0, SRC_DIR)
+
+
+@pytest.fixture(scope="session")
+def server_module():
+    """The server module, with the baseline tables created and migrated in
+    TEST_SCHEMA."""
+    if not os.getenv("SQL_HOST"):
+        pytest.skip("the SQL_* variables are not set")
+
+    import sqlalchemy as sql
+    from helpers.utils import connect_db
+
+    database = connect_db()
+    try:
+        with database.begin() as conn:
+            conn.execute(sql.text(f'DROP SCHEMA IF EXISTS "{TEST_SCHEMA}" CASCADE'))
+            conn.execute(sql.text(f'CREATE SCHEMA "{TEST_SCHEMA}"'))
+            conn.execute(sql.text(f'SET LOCAL search_path TO "{TEST_SCHEMA}"'))
+            with open(BASELINE_SQL, encoding="utf-8") as file:
+                conn.exec_driver_sql(file.read())
+    except sql.exc.OperationalError as error:
+        pytest.skip(f"the database is unavailable: {error}")
+
+    # libpq sets the schema on every connection of the server, including
+    # the ones that run the migrations at import
+    os.environ["PGOPTIONS"] = f"-c search_path={TEST_SCHEMA}"
+    os.environ["GEOCODER_HTTP"] = "0"
+    import server
+
+    yield server
+
+    server.database.dispose()
+    with database.begin() as conn:
+        conn.execute(sql.text(f'DROP SCHEMA "{TEST_SCHEMA}" CASCADE'))
+    database.dispose()
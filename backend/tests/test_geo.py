@@ -0,0 +1,152 @@
+"""
+The geographic helpers behind /encounters/bbox and /encounters/near, and the
+bounding box condition on SQLite, the fallback of the PostgreSQL box test.
+"""
+import math
+
+import pytest
+import sqlalchemy as sql
+
+from helpers.geo import (
+    EARTH_RADIUS_KM,
+    bbox_filter,
+    geohash_encode,
+    haversine_km,
+    radius_bbox,
+    split_bbox,
+    zoom_precision
+)
+
+
+@pytest.mark.parametrize("latitude,longitude,precision,expected", [
+    (57.64911, 10.40744, 11, "u4pruydqqvj"),
+    (42.6, -5.6, 5, "ezs42"),
+    (0.0, 0.0, 5, "s0000"),
+    (-90.0, -180.0, 4, "0000"),
+    (90.0, 180.0, 4, "zzzz"),
+])
+def test_geohash_encode(latitude, longitude, precision, expected):
+    assert geohash_encode(latitude, longitude, precision) == expected
+
+
+def test_geohash_prefixes_nest():
+    geohash = geohash_encode(-22.9068, -43.1729)
+    assert len(geohash) == 9
+    assert all(geohash.startswith(geohash_encode(-22.9068, -43.1729, n)) for n in range(1, 9))
+
+
+@pytest.mark.parametrize("lat1,lon1,lat2,lon2,expected", [
+    (0, 0, 0, 1, 2 * math.pi * EARTH_RADIUS_KM / 360),
+    (0, 179.5, 0, -179.5, 2 * math.pi * EARTH_RADIUS_KM / 360),
+    (90, 0, 90, 123, 0),
+    (90, 0, -90, 0, math.pi * EARTH_RADIUS_KM),
+])
+def test_haversine_km(lat1, lon1, lat2, lon2, expected):
+    assert haversine_km(lat1, lon1, lat2, lon2) == pytest.approx(expected, abs=1e-6)
+
+
+@pytest.mark.parametrize("bbox,expected", [
+    ((-10, -50, 10, -40), [(-10, -50, 10, -40)]),
+    ((-20, 170, -10, -170), [(-20, 170, -10, 180.0), (-20, -180.0, -10, -170)]),
+    ((-20, -180, -10, 180), [(-20, -180, -10, 180)]),
+])
+def test_split_bbox(bbox, expected):
+    assert split_bbox(*bbox) == expected
+
+
+@pytest.mark.parametrize("latitude,longitude,radius_km", [
+    (-22.9, -43.2, 10),
+    (0, 0, 500),
+    (60, 30, 200),
+    (-17, 179.9, 100),
+    (-17, -179.9, 100),
+])
+def test_radius_bbox_encloses_circle(latitude, longitude, radius_km):
+    south, west, north, east = radius_bbox(latitude, longitude, radius_km)
+    parts = split_bbox(south, west, north, east)
+
+    def inside(lat, lon):
+        return any(s <= lat <= n and w <= lon <= e for s, w, n, e in parts)
+
+    # Points on the circle, just inside the radius
+    for step in range(360):
+        bearing = math.radians(step)
+        angle = radius_km * 0.999 / EARTH_RADIUS_KM
+        lat1, lon1 = math.radians(latitude), math.radians(longitude)
+        lat2 = math.asin(
+            math.sin(lat1) * math.cos(angle) + math.cos(lat1) * math.sin(angle) * math.cos(bearing)
+        )
+        lon2 = lon1 + math.atan2(
+            math.sin(bearing) * math.sin(angle) * math.cos(lat1),
+            math.cos(angle) - math.sin(lat1) * math.sin(lat2)
+        )
+        point = math.degrees(lat2), (math.degrees(lon2) + 540) % 360 - 180
+        assert haversine_km(latitude, longitude, *point) <= radius_km
+        assert inside(*point)
+
+
+def test_radius_bbox_crosses_antimeridian():
+    south, west, north, east = radius_bbox(-17, 179.9, 100)
+    assert west > east
+    assert len(split_bbox(south, west, north, east)) == 2
+
+
+@pytest.mark.parametrize("latitude", [89.5, -89.5])
+def test_radius_bbox_at_poles_spans_every_longitude(latitude):
+    south, west, north, east = radius_bbox(latitude, 45, 100)
+    assert (west, east) == (-180.0, 180.0)
+    assert -90.0 <= south < latitude < north <= 90.0
+
+
+def test_radius_bbox_wide_circle_spans_every_longitude():
+    # At 80 degrees a 2000 km circle reaches past the pole's meridians
+    assert radius_bbox(80, 0, 2000)[1:4:2] == (-180.0, 180.0)
+
+
+@pytest.mark.parametrize("zoom,expected", [
+    (-3, 1), (0, 1), (1, 1), (2, 1), (3, 2), (9, 5), (15, 8), (22, 8),
+])
+def test_zoom_precision(zoom, expected):
+    assert zoom_precision(zoom) == expected
+
+
+@pytest.fixture(scope="module")
+def points():
+    engine = sql.create_engine("sqlite://")
+    metadata = sql.MetaData()
+    table = sql.Table(
+        "ponto", metadata,
+        sql.Column("nome", sql.String, primary_key=True),
+        sql.Column("latitude", sql.Float),
+        sql.Column("longitude", sql.Float),
+    )
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(table.insert(), [
+            {"nome": "fiji_leste", "latitude": -17.0, "longitude": 179.5},
+            {"nome": "fiji_oeste", "latitude": -17.0, "longitude": -179.5},
+            {"nome": "vanuatu", "latitude": -17.0, "longitude": 168.0},
+            {"nome": "rio", "latitude": -22.9, "longitude": -43.2},
+        ])
+    return engine, table
+
+
+@pytest.mark.parametrize("bbox,expected", [
+    ((-18, 179, -16, -179), {"fiji_leste", "fiji_oeste"}),
+    ((-18, 160, -16, 179.9), {"fiji_leste", "vanuatu"}),
+    ((-30, -50, -20, -40), {"rio"}),
+    ((0, -180, 10, 180), set()),
+])
+def test_bbox_filter_sqlite(points, bbox, expected):
+    engine, table = points
+    condition = bbox_filter(table.c.longitude, table.c.latitude, bbox, engine.dialect.name)
+    with engine.connect() as conn:
+        names = conn.execute(sql.select(table.c.nome).where(condition)).scalars().all()
+    assert set(names) == expected
+
+
+def test_bbox_filter_postgresql_uses_box():
+    table = sql.table("encontro", sql.column("latitude_num"), sql.column("longitude_num"))
+    condition = bbox_filter(table.c.longitude_num, table.c.latitude_num, (-18, 179, -16, -179))
+    compiled = str(condition.compile(compile_kwargs={"literal_binds": True}))
+    assert compiled.count("<@ box(") == 2
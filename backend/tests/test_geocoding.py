@@ -0,0 +1,191 @@
+"""
+Geocoder with stub providers: the in-memory LRU cache and its TTL, the
+persistent cache table on SQLite, the order in which providers are tried
+and the fallback from HttpGeocoder to CentroidGeocoder.
+"""
+import datetime as dt
+from types import SimpleNamespace
+
+import pytest
+import sqlalchemy as sql
+
+from helpers import geocoding
+from helpers.geocoding import (
+    UNDEFINED,
+    CentroidGeocoder,
+    Geocoder,
+    HttpGeocoder,
+    geocoding_metadata
+)
+
+RIO = ("Rio de Janeiro", "Rio de Janeiro")
+NITEROI = ("Niterói", "Rio de Janeiro")
+
+
+class StubProvider:
+    """Returns a fixed answer and records the coordinates it was asked for."""
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = []
+
+    def __call__(self, latitude, longitude):
+        self.calls.append((latitude, longitude))
+        return self.value
+
+
+class StubSession:
+    """Stands in for requests.Session: returns a payload or raises."""
+
+    def __init__(self, payload=None, error=None):
+        self.payload = payload
+        self.error = error
+        self.calls = 0
+
+    def get(self, url, params, timeout):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(json=lambda: self.payload)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A settable time.time for the cache expiry."""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(geocoding, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+@pytest.fixture
+def database():
+    engine = sql.create_engine("sqlite://")
+    geocoding_metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_rounded_coordinates_hit_the_memory_cache():
+    provider = StubProvider(RIO)
+    geocoder = Geocoder([provider], precision=3)
+
+    assert geocoder.resolve("-22.90681", "-43.17291") == RIO
+    assert geocoder.resolve(-22.9068, -43.1729) == RIO
+    assert provider.calls == [(-22.907, -43.173)]
+
+
+def test_lru_evicts_the_least_recently_used():
+    provider = StubProvider(RIO)
+    geocoder = Geocoder([provider], max_entries=2)
+
+    geocoder.resolve(1, 1)
+    geocoder.resolve(2, 2)
+    geocoder.resolve(1, 1)  # 2 is now the least recently used
+    geocoder.resolve(3, 3)
+    assert len(provider.calls) == 3
+
+    geocoder.resolve(1, 1)
+    assert len(provider.calls) == 3
+    geocoder.resolve(2, 2)
+    assert provider.calls[-1] == (2, 2)
+
+
+def test_ttl_expires_memory_entries(clock):
+    provider = StubProvider(RIO)
+    geocoder = Geocoder([provider], ttl=60)
+
+    geocoder.resolve(1, 1)
+    clock.value += 59
+    geocoder.resolve(1, 1)
+    assert len(provider.calls) == 1
+
+    clock.value += 2
+    geocoder.resolve(1, 1)
+    assert len(provider.calls) == 2
+
+
+def test_providers_are_tried_in_order():
+    first, second, third = StubProvider(None), StubProvider(NITEROI), StubProvider(RIO)
+    geocoder = Geocoder([first, second, third])
+
+    assert geocoder.resolve(-22.88, -43.1) == NITEROI
+    assert len(first.calls) == len(second.calls) == 1
+    assert third.calls == []
+
+
+def test_http_geocoder_falls_back_to_centroids():
+    http = HttpGeocoder()
+    http._session = StubSession(error=ConnectionError("offline"))
+    centroids = CentroidGeocoder([
+        ("Rio de Janeiro", "Rio de Janeiro", -22.9068, -43.1729),
+        ("Niterói", "Rio de Janeiro", -22.8832, -43.1034),
+    ])
+    geocoder = Geocoder([http, centroids])
+
+    assert geocoder.resolve(-22.90, -43.17) == RIO
+    assert geocoder.resolve(-22.89, -43.11) == NITEROI
+    assert http.session.calls == 2
+
+
+def test_http_geocoder_reads_administrative_levels():
+    http = HttpGeocoder()
+    http._session = StubSession(payload={"localityInfo": {"administrative": [
+        {"adminLevel": 2, "name": "Brasil"},
+        {"adminLevel": 4, "name": "Rio de Janeiro"},
+        {"adminLevel": 8, "name": "Niterói"},
+    ]}})
+    assert http(-22.88, -43.1) == NITEROI
+
+    http._session = StubSession(payload={"localityInfo": {"administrative": [
+        {"adminLevel": 4, "name": "Rio de Janeiro"},
+    ]}})
+    assert http(-22.88, -43.1) is None
+
+
+def test_every_provider_missing_is_undefined_and_not_cached():
+    provider = StubProvider(None)
+    geocoder = Geocoder([provider, CentroidGeocoder([("Rio de Janeiro", "Rio de Janeiro", -22.9, -43.2)])])
+
+    assert geocoder.resolve(0, 0) == UNDEFINED
+    assert geocoder.resolve(0, 0) == UNDEFINED
+    assert len(provider.calls) == 2
+
+
+@pytest.mark.parametrize("latitude,longitude", [(None, 1), ("norte", "1"), ("", "")])
+def test_invalid_coordinates_are_undefined(latitude, longitude):
+    provider = StubProvider(RIO)
+    assert Geocoder([provider]).resolve(latitude, longitude) == UNDEFINED
+    assert provider.calls == []
+
+
+def test_persistent_cache_is_shared(database):
+    provider = StubProvider(RIO)
+    Geocoder([provider], database=database).resolve(-22.9, -43.2)
+
+    other = StubProvider(NITEROI)
+    assert Geocoder([other], database=database).resolve(-22.9, -43.2) == RIO
+    assert other.calls == []
+
+
+def test_persistent_cache_expires(database):
+    Geocoder([StubProvider(RIO)], database=database, ttl=60).resolve(-22.9, -43.2)
+    with database.begin() as conn:
+        conn.execute(geocoding.geocodificacao.update().values(
+            criado_em=dt.datetime.now() - dt.timedelta(hours=1)
+        ))
+
+    other = StubProvider(NITEROI)
+    assert Geocoder([other], database=database, ttl=60).resolve(-22.9, -43.2) == NITEROI
+    assert len(other.calls) == 1
+
+
+def test_failed_store_does_not_fail_resolve():
+    # No geocodificacao table: reading and writing the persistent cache fail
+    engine = sql.create_engine("sqlite://")
+    provider = StubProvider(RIO)
+    geocoder = Geocoder([provider], database=engine)
+
+    assert geocoder.resolve(-22.9, -43.2) == RIO
+    assert geocoder.resolve(-22.9, -43.2) == RIO
+    assert len(provider.calls) == 1
+    engine.dispose()
@@ -0,0 +1,88 @@
+"""
+The vectorized automatic_brightness_and_contrast, and its batch variant,
+against the loop it replaced, on the sample photos of notebooks/imgs.
+"""
+import glob
+from functools import lru_cache
+from os import path
+
+import cv2
+import numpy as np
+import pytest
+
+from conftest import IMAGES_DIR
+from vision_models.image_treatment import (
+    automatic_brightness_and_contrast,
+    automatic_brightness_and_contrast_batch
+)
+
+PHOTOS = sorted(glob.glob(path.join(IMAGES_DIR, "*", "*.JPG")))
+CLIPS = (0, 1, 5)
+
+pytestmark = pytest.mark.skipif(not PHOTOS, reason="notebooks/imgs has no photos")
+
+
+def baseline(image, clip_hist_percent=1):
+    """The original implementation, with Python loops over the histogram."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256])
+    hist_size = len(hist)
+
+    accumulator = [float(hist[0])]
+    for index in range(1, hist_size):
+        accumulator.append(accumulator[index - 1] + float(hist[index]))
+
+    maximum = accumulator[-1]
+    clip_hist_percent *= (maximum / 100.0)
+    clip_hist_percent /= 2.0
+
+    minimum_gray = 0
+    while accumulator[minimum_gray] < clip_hist_percent:
+        minimum_gray += 1
+
+    maximum_gray = hist_size - 1
+    while accumulator[maximum_gray] >= (maximum - clip_hist_percent):
+        maximum_gray -= 1
+
+    alpha = 255 / (maximum_gray - minimum_gray)
+    beta = -minimum_gray * alpha
+    return cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
+
+
+@lru_cache(maxsize=None)
+def photo(name, size=512):
+    """A photo no wider or taller than size, to keep the run short."""
+    image = cv2.imread(name)
+    scale = size / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return image
+
+
+@pytest.mark.parametrize("clip", CLIPS)
+@pytest.mark.parametrize("name", PHOTOS, ids=lambda name: path.relpath(name, IMAGES_DIR))
+def test_matches_baseline(name, clip):
+    image = photo(name)
+    np.testing.assert_array_equal(
+        automatic_brightness_and_contrast(image, clip),
+        baseline(image, clip)
+    )
+
+
+@pytest.mark.parametrize("clip", CLIPS)
+def test_batch_matches_baseline(clip):
+    images = np.stack([cv2.resize(photo(name), (320, 240)) for name in PHOTOS])
+    result = automatic_brightness_and_contrast_batch(images, clip)
+
+    assert result.shape == images.shape
+    assert result.dtype == np.uint8
+    for image, adjusted in zip(images, result):
+        np.testing.assert_array_equal(adjusted, baseline(image, clip))
+
+
+def test_batch_of_one_matches_single():
+    image = photo(PHOTOS[0])
+    np.testing.assert_array_equal(
+        automatic_brightness_and_contrast_batch(image[np.newaxis])[0],
+        automatic_brightness_and_contrast(image)
+    )
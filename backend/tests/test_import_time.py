@@ -0,0 +1,61 @@
+"""
+Startup cost of the server: import server in fresh interpreters with
+-X importtime, within the budget of benchmarks/import_time.py and without
+the heavy modules the server only loads on demand. The budget can be
+raised on a slow machine with IMPORT_BUDGET_MS.
+"""
+import json
+import os
+import subprocess
+import sys
+
+from conftest import SRC_DIR
+
+BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1000"))
+RUNS = 3
+
+# Heavy modules the server only needs, if ever, after startup
+LAZY_MODULES = ("matplotlib", "pandas", "imageio", "requests")
+
+IMPORT_SERVER = """
+import json, sys, time
+start = time.perf_counter()
+import server
+wall_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({"wall_ms": wall_ms, "modules": sorted(sys.modules)}))
+"""
+
+
+def import_server():
+    """Wall time, loaded modules and the slowest top-level packages of one
+    import of server."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SERVER],
+        cwd=SRC_DIR, capture_output=True, text=True, check=True
+    )
+    packages = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if "." not in name.strip():
+            packages[name.strip()] = int(cumulative) / 1000
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    slowest = sorted(packages.items(), key=lambda item: -item[1])[:8]
+    return report["wall_ms"], set(report["modules"]), slowest
+
+
+def test_import_time(server_module):
+    runs = [import_server() for _ in range(RUNS)]
+
+    wall_ms, modules, slowest = min(runs, key=lambda run: run[0])
+    lazy = sorted(
+        name for name in LAZY_MODULES
+        if any(module == name or module.startswith(name + ".") for module in modules)
+    )
+    assert not lazy, f"imported at startup: {', '.join(lazy)}"
+    assert wall_ms <= BUDGET_MS, (
+        f"import took {wall_ms:.0f} ms, budget {BUDGET_MS:.0f} ms; slowest: "
+        + ", ".join(f"{name} {ms:.0f} ms" for name, ms in slowest)
+    )
@@ -0,0 +1,65 @@
+"""
+Stage timings of helpers.metrics, labelled with the URL rule of the request
+that ran them, on a small Flask app of its own.
+"""
+import pytest
+from flask import Flask
+
+from helpers.metrics import Metrics
+
+
+@pytest.fixture
+def app_metrics():
+    app = Flask(__name__)
+    metrics = Metrics()
+    metrics.instrument_app(app)
+
+    @app.get("/samples/<int:identificador>")
+    def sample(identificador):
+        with metrics.span("query"):
+            pass
+        return {"id": identificador}
+
+    @app.post("/submit-sample")
+    def submit():
+        with metrics.span("query"):
+            pass
+        with metrics.span("ingest"):
+            pass
+        return {}
+
+    return app, metrics
+
+
+def stage_counts(metrics):
+    return {labels: sum(values[:-1]) for labels, values in metrics.stages.snapshot().items()}
+
+
+def test_stages_are_labelled_by_endpoint(app_metrics):
+    app, metrics = app_metrics
+    client = app.test_client()
+    client.get("/samples/1")
+    client.get("/samples/2")
+    client.post("/submit-sample")
+
+    assert stage_counts(metrics) == {
+        ("/samples/<int:identificador>", "query"): 2,
+        ("/submit-sample", "query"): 1,
+        ("/submit-sample", "ingest"): 1,
+    }
+
+
+def test_stages_outside_a_request(app_metrics):
+    _, metrics = app_metrics
+    with metrics.span("recognition"):
+        pass
+
+    assert stage_counts(metrics) == {("none", "recognition"): 1}
+
+
+def test_render_has_both_labels(app_metrics):
+    app, metrics = app_metrics
+    app.test_client().post("/submit-sample")
+
+    rendered = metrics.render()
+    assert 'stage_duration_seconds_count{endpoint="/submit-sample",stage="ingest"} 1' in rendered
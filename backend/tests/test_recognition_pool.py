@@ -0,0 +1,68 @@
+"""
+RecognitionPool.best_match against the inline index.best_match, with a SIFT
+index persisted from the first photo of each turtle in notebooks/imgs and
+the next photos as queries.
+"""
+import glob
+from os import path
+
+import cv2
+import pytest
+
+from conftest import IMAGES_DIR
+from vision_models.recognition_pool import RecognitionPool, head_features
+from vision_models.sift_index import SiftIndex
+
+TURTLES = sorted(glob.glob(path.join(IMAGES_DIR, "CM*")))
+QUERIES_PER_TURTLE = 2
+
+pytestmark = pytest.mark.skipif(not TURTLES, reason="notebooks/imgs has no photos")
+
+
+def photo_bytes(name, size=400):
+    """A photo no wider or taller than size, encoded as JPEG."""
+    image = cv2.imread(name)
+    scale = size / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+
+@pytest.fixture(scope="module")
+def gallery(tmp_path_factory):
+    index = SiftIndex(str(tmp_path_factory.mktemp("sift")))
+    queries = []
+    for identificador, directory in enumerate(TURTLES, 1):
+        photos = sorted(glob.glob(path.join(directory, "*.JPG")))
+        index.add(identificador, head_features("sift", photo_bytes(photos[0])))
+        queries += [
+            head_features("sift", photo_bytes(name))
+            for name in photos[1:1 + QUERIES_PER_TURTLE]
+        ]
+    return index, queries
+
+
+@pytest.mark.parametrize("workers,shards", [(1, 1), (2, 3), (3, 7)])
+def test_sift_pool_matches_inline(gallery, workers, shards):
+    index, queries = gallery
+    pool = RecognitionPool(workers, shards)
+    try:
+        for threshold in (1, 10):
+            inline = [index.best_match(query, threshold) for query in queries]
+            pooled = [pool.best_match(index, query, threshold) for query in queries]
+            assert pooled == inline
+    finally:
+        pool.executor.shutdown()
+
+
+def test_sift_pool_sees_new_turtles(gallery):
+    index, queries = gallery
+    pool = RecognitionPool(2, 2)
+    try:
+        pool.best_match(index, queries[0], 1)
+        identificador = len(TURTLES) + 1
+        index.add(identificador, queries[0])
+        assert index.best_match(queries[0], 1) == identificador
+        assert pool.best_match(index, queries[0], 1) == identificador
+    finally:
+        pool.executor.shutdown()
@@ -0,0 +1,46 @@
+"""
+SiftIndex kept only in memory: inserts are concatenated lazily, and a turtle
+added twice keeps its first descriptors, as in the persisted index.
+"""
+import numpy as np
+import pytest
+
+from vision_models.sift_index import SIFT_DIMENSIONS, SiftIndex
+
+
+def random_descriptors(rows, seed):
+    return np.random.default_rng(seed).random((rows, SIFT_DIMENSIONS), dtype=np.float32)
+
+
+@pytest.mark.parametrize("path", [None, "disk"])
+def test_add_keeps_insert_order(tmp_path, path):
+    index = SiftIndex(None if path is None else str(tmp_path))
+    chunks = [random_descriptors(rows, seed) for seed, rows in enumerate((3, 1, 7, 2), 1)]
+    for identificador, descriptors in enumerate(chunks, 1):
+        index.add(identificador, descriptors)
+
+    np.testing.assert_array_equal(index.descriptors, np.concatenate(chunks))
+    np.testing.assert_array_equal(
+        index.labels, np.repeat(np.arange(1, len(chunks) + 1), [len(c) for c in chunks])
+    )
+    assert len(index) == len(chunks)
+
+
+@pytest.mark.parametrize("path", [None, "disk"])
+def test_add_ignores_duplicate_identificador(tmp_path, path):
+    index = SiftIndex(None if path is None else str(tmp_path))
+    index.add(1, random_descriptors(4, 1))
+    index.add(1, random_descriptors(6, 2))
+
+    np.testing.assert_array_equal(index.descriptors, random_descriptors(4, 1))
+    assert index.labels.tolist() == [1] * 4
+
+
+def test_add_after_query_rebuilds_matcher():
+    index = SiftIndex()
+    index.add(1, random_descriptors(20, 1))
+    assert index.best_match(random_descriptors(20, 1), 1) == 1
+
+    index.add(2, random_descriptors(20, 2))
+    assert index.best_match(random_descriptors(20, 2), 1) == 2
+    assert len(index.descriptors) == 40
@@ -0,0 +1,104 @@
+"""
+/encounters/bbox and /encounters/near on encounters placed around the
+antimeridian, near the north pole and in a small cluster. Their estado is
+kept apart from the other test modules, which share the database.
+"""
+import pytest
+from sqlalchemy import text
+
+from helpers.geo import geohash_encode, zoom_precision
+
+ESTADO = "GEO"
+
+# nome: (latitude, longitude)
+ENCOUNTERS = {
+    "fiji_leste": (-17.0, 179.5),
+    "fiji_oeste": (-17.0, -179.5),
+    "vanuatu": (-17.0, 168.0),
+    "polo_0": (89.5, 0.0),
+    "polo_180": (89.5, 180.0),
+    "grupo_1": (10.0, 20.0),
+    "grupo_2": (10.001, 20.001),
+    "grupo_3": (10.1, 20.0),
+}
+
+
+@pytest.fixture(scope="module")
+def client(server_module):
+    with server_module.database.begin() as conn:
+        for nome, (latitude, longitude) in ENCOUNTERS.items():
+            conn.execute(text("""
+                WITH nova AS (
+                    INSERT INTO tartaruga (nome, ultimo_encontro, ultima_imagem_cabeca)
+                    VALUES (:nome, date '2022-07-29', decode('00', 'hex'))
+                    RETURNING identificador
+                )
+                INSERT INTO encontro (latitude, longitude, latitude_num, longitude_num, geohash,
+                                      cidade, estado, tartaruga_identificador,
+                                      imagem_corpo, imagem_cabeca, "data")
+                SELECT :latitude, :longitude, :latitude_num, :longitude_num,
+                       geohash_encode(:latitude_num, :longitude_num, 9),
+                       'cidade', :estado, identificador,
+                       decode('00', 'hex'), decode('00', 'hex'), date '2022-01-01'
+                FROM nova
+            """), {
+                "nome": nome, "estado": ESTADO,
+                "latitude": str(latitude), "longitude": str(longitude),
+                "latitude_num": latitude, "longitude_num": longitude,
+            })
+    client = server_module.server.test_client()
+    return client
+
+
+def names(response):
+    assert response.status_code == 200
+    return [sample["nome"] for sample in response.get_json()["Samples"]]
+
+
+@pytest.mark.parametrize("bbox,expected", [
+    ("south=-18&west=179&north=-16&east=-179", {"fiji_leste", "fiji_oeste"}),
+    ("south=-18&west=160&north=-16&east=179.9", {"fiji_leste", "vanuatu"}),
+    ("south=89&west=-180&north=90&east=180", {"polo_0", "polo_180"}),
+    ("south=9.9&west=19.9&north=10.05&east=20.05", {"grupo_1", "grupo_2"}),
+    ("south=-1&west=-1&north=1&east=1", set()),
+])
+def test_bbox(client, bbox, expected):
+    assert set(names(client.get(f"/encounters/bbox?{bbox}"))) == expected
+
+
+def test_bbox_limit(client):
+    assert len(names(client.get("/encounters/bbox?south=9&west=19&north=11&east=21&limit=2"))) == 2
+
+
+def test_bbox_clusters(client):
+    response = client.get("/encounters/bbox?south=9&west=19&north=11&east=21&zoom=3")
+    assert response.status_code == 200
+    clusters = response.get_json()["Clusters"]
+    assert [cluster["count"] for cluster in clusters] == [3]
+    assert clusters[0]["geohash"] == geohash_encode(10.0, 20.0, zoom_precision(3))
+    assert clusters[0]["latitude"] == pytest.approx((10.0 + 10.001 + 10.1) / 3)
+
+
+@pytest.mark.parametrize("query,expected", [
+    ("latitude=-17&longitude=179.9&radius_km=100", ["fiji_leste", "fiji_oeste"]),
+    ("latitude=-17&longitude=-179.9&radius_km=100", ["fiji_oeste", "fiji_leste"]),
+    ("latitude=89.9&longitude=0&radius_km=100", ["polo_0", "polo_180"]),
+    ("latitude=10&longitude=20&radius_km=1", ["grupo_1", "grupo_2"]),
+    ("latitude=10&longitude=20&radius_km=20", ["grupo_1", "grupo_2", "grupo_3"]),
+    ("latitude=0&longitude=0", []),
+])
+def test_near(client, query, expected):
+    response = client.get(f"/encounters/near?{query}")
+    assert names(response) == expected
+    distances = [sample["distancia_km"] for sample in response.get_json()["Samples"]]
+    assert distances == sorted(distances)
+
+
+@pytest.mark.parametrize("url", [
+    "/encounters/bbox?south=1&west=2&north=3",
+    "/encounters/bbox?south=a&west=2&north=3&east=4",
+    "/encounters/near?latitude=1",
+    "/encounters/near?latitude=1&longitude=2&radius_km=perto",
+])
+def test_bad_arguments(client, url):
+    assert client.get(url).status_code == 400
@@ -0,0 +1,90 @@
+"""
+SQL statements per request of the listing endpoints, counted with
+helpers.instrumentation. A page costs the same statements whatever its
+size, so no row runs queries of its own (the turtle names come from a join
+or the name directory, not one lookup per encounter).
+"""
+import pytest
+from sqlalchemy import text
+
+from helpers.instrumentation import count_queries
+
+TURTLES = 20
+ENCOUNTERS = 60
+
+# One SELECT of the page with the turtle names; the encounter count and the
+# names are served from their caches
+SAMPLES_STATEMENTS = 1
+# One SELECT of the matching encounters
+FILTER_STATEMENTS = 1
+
+
+@pytest.fixture(scope="module")
+def client(server_module):
+    with server_module.database.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO tartaruga (nome, ultimo_encontro, ultima_imagem_cabeca)
+            SELECT 'tartaruga_' || i, date '2022-07-29', decode('00', 'hex')
+            FROM generate_series(1, :turtles) i
+        """), {"turtles": TURTLES})
+        # Encounters 1 to 5 are in SP, the others in RJ
+        conn.execute(text("""
+            INSERT INTO encontro (latitude, longitude, cidade, estado,
+                                  tartaruga_identificador, imagem_corpo, imagem_cabeca, "data")
+            SELECT '-22.9', '-43.2', 'cidade', CASE WHEN i <= 5 THEN 'SP' ELSE 'RJ' END,
+                   t.identificador, decode('00', 'hex'), decode('00', 'hex'),
+                   date '2022-01-01' + i
+            FROM generate_series(1, :encounters) i
+            JOIN tartaruga t ON t.nome = 'tartaruga_' || (1 + i % :turtles)
+        """), {"turtles": TURTLES, "encounters": ENCOUNTERS})
+
+    client = server_module.server.test_client()
+    # Fill the encounter count and name directory caches
+    client.get("/samples?limit=1")
+    client.get("/samples-names")
+    return client
+
+
+def statements(server_module, send):
+    with count_queries(server_module.database) as counter:
+        response = send()
+    assert response.status_code == 200
+    return response.get_json(), counter.count
+
+
+@pytest.mark.parametrize("limit", [5, 50])
+def test_samples_statements(server_module, client, limit):
+    body, count = statements(server_module, lambda: client.get(f"/samples?limit={limit}"))
+
+    assert len(body["Samples"]) == limit
+    assert all(sample["nome"].startswith("tartaruga_") for sample in body["Samples"])
+    assert count == SAMPLES_STATEMENTS
+
+
+@pytest.mark.parametrize("estado, rows", [("SP", 5), ("RJ", ENCOUNTERS - 5)])
+def test_filter_samples_statements(server_module, client, estado, rows):
+    body, count = statements(server_module, lambda: client.post("/filter-samples", json={
+        "nome": "", "date": "", "cidade": "", "estado": estado
+    }))
+
+    assert len(body["Samples"]) == rows
+    assert all(sample["nome"].startswith("tartaruga_") for sample in body["Samples"])
+    assert count == FILTER_STATEMENTS
+
+
+@pytest.mark.parametrize("limit", [7, ENCOUNTERS - 5])
+def test_filter_samples_pages(server_module, client, limit):
+    filters = {"nome": "", "date": "", "cidade": "", "estado": "RJ"}
+    ids, cursor = [], None
+    while True:
+        query = f"?limit={limit}" + (f"&cursor={cursor}" if cursor is not None else "")
+        body, count = statements(server_module, lambda: client.post(f"/filter-samples{query}", json=filters))
+        assert len(body["Samples"]) <= limit
+        assert count == FILTER_STATEMENTS
+        ids += [sample["id"] for sample in body["Samples"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(ids) == ENCOUNTERS - 5
+    assert ids == sorted(set(ids))
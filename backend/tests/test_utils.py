@@ -0,0 +1,26 @@
+"""
+normalize_date, which checks the photo_date of a submission: the frontend
+may send a bare date or the full ISO timestamp of Date.toISOString().
+"""
+import pytest
+
+from helpers.utils import normalize_date
+
+
+@pytest.mark.parametrize("date,expected", [
+    ("2024-05-01", "2024-05-01"),
+    ("2024-05-01T13:45:10.123Z", "2024-05-01"),
+    ("2024-05-01T13:45:10", "2024-05-01"),
+    ("2024-05-01T13:45:10-03:00", "2024-05-01"),
+    ("2024-05-01 13:45", "2024-05-01"),
+])
+def test_normalize_date_accepts(date, expected):
+    assert normalize_date(date) == expected
+
+
+@pytest.mark.parametrize("date", [
+    None, 20240501, "", "01/05/2024", "2024-5-1", "2024-13-01", "2024-02-30",
+    "2024-05-01T", "2024-05-01Tnoon", "2024-05-01 and more",
+])
+def test_normalize_date_rejects(date):
+    assert normalize_date(date) is None